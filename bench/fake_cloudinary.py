@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Servidor HTTP local que imita la Upload API de Cloudinary (para pruebas y benchmarks).
+
+- POST /v1_1/<cloud>/image/upload (multipart): guarda los bytes en memoria y
+  responde como Cloudinary (public_id, version, secure_url, etag, bytes, format; con
+  eager=t1|t2, la lista "eager" con la URL de cada derivado).
+- Admin API: GET /v1_1/<cloud>/resources/image/upload?prefix=&max_results=&next_cursor=
+  (listado paginado con bytes/etag) y DELETE …/resources/image/upload?public_ids[]=…
+- Entrega (CDN): GET/HEAD /<cloud>/image/upload/[transformaciones/]v<versión>/<id>.<formato>
+  con Range (206) para lo que se subió; 404 si no existe (p.ej. borrado). --cdn-latency-ms
+  la hace lenta (para CLD_MODE=verify).
+- Keep-alive (HTTP/1.1) y conteo de conexiones: GET /__stats.
+- Latencia y tasa de error configurables (--latency-ms, --error-rate).
+- --rate-limit N: más de N subidas/s responde 429 con Retry-After (como el API real).
+
+Uso:
+  python3 bench/fake_cloudinary.py --port 8765 --latency-ms 40 --error-rate 0.02
+  CLD_API_BASE=http://127.0.0.1:8765 python3 extract_and_upload_images_by_model_incremental.py
+
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import re, sys, json, time, random, hashlib, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+def sniff_format(b):
+    if b[:8] == b"\x89PNG\r\n\x1a\n": return "png"
+    if b[:3] == b"\xff\xd8\xff": return "jpg"
+    if b[:4] == b"GIF8": return "gif"
+    if b[:4] == b"RIFF" and b[8:12] == b"WEBP": return "webp"
+    if b[:2] == b"BM": return "bmp"
+    return "bin"
+
+def parse_multipart(body, ctype):
+    """{campo: bytes} de un multipart/form-data sencillo (sin anidar)."""
+    m = re.search(r"boundary=([^;]+)", ctype or "")
+    if not m:
+        return {}
+    sep = ("--" + m.group(1).strip('"')).encode("utf-8")
+    out = {}
+    for part in body.split(sep)[1:]:
+        if part.startswith(b"--"):
+            break
+        head, _, data = part.partition(b"\r\n\r\n")
+        name = re.search(rb'name="([^"]*)"', head)
+        if name:
+            out[name.group(1).decode("utf-8")] = data[:-2] if data.endswith(b"\r\n") else data
+    return out
+
+class FakeCloudinary(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128   # el backlog por defecto (5) hace esperar ~1s a las conexiones de más
+
+    def __init__(self, addr, latency_ms=0, error_rate=0.0, seed=None, rate_limit=0, cdn_latency_ms=0):
+        ThreadingHTTPServer.__init__(self, addr, Handler)
+        self.latency_ms = latency_ms
+        self.cdn_latency_ms = cdn_latency_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.window = [0, 0]      # [segundo, subidas en ese segundo]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.assets = {}          # "folder/public_id" -> {"bytes", "version", "etag", "format"}
+        self.stats = {"connections": 0, "uploads": 0, "errors": 0, "throttled": 0, "bytes_in": 0,
+                      "list_calls": 0, "deleted": 0, "deliveries": 0, "eager": 0}
+
+    @property
+    def base_url(self):
+        return "http://%s:%d" % self.server_address[:2]
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _asset_url(self, cloud, rt, full_id, a):
+        return "%s/%s/%s/upload/v%d/%s.%s" % (self.server.base_url, cloud, rt, a["version"], full_id, a["format"])
+
+    def _deliver(self, head):
+        """Sirve un asset subido como lo haría el CDN (las transformaciones se ignoran)."""
+        srv = self.server
+        m = re.match(r"^/[^/]+/\w+/upload/(?:.+/)?v(\d+)/(.+)\.(\w+)$", urlsplit(self.path).path)
+        with srv.lock:
+            srv.stats["deliveries"] += 1
+            a = srv.assets.get(m.group(2)) if m else None
+        if srv.cdn_latency_ms:
+            time.sleep(srv.cdn_latency_ms / 1000.0)
+        if a is None:
+            data = b"not found"
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            return None if head else self.wfile.write(data)
+        data, status = a["bytes"], 200
+        rng = re.match(r"^bytes=(\d+)-(\d*)$", self.headers.get("Range") or "")
+        if rng and not head and data:
+            start = min(int(rng.group(1)), len(data) - 1)
+            end = min(int(rng.group(2)) if rng.group(2) else len(data) - 1, len(data) - 1)
+            total, data, status = len(data), data[start:end + 1], 206
+        self.send_response(status)
+        self.send_header("Content-Type", "image/%s" % a["format"])
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", '"%s"' % a["etag"])
+        if status == 206:
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, start + len(data) - 1, total))
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        self._deliver(head=True)
+
+    def do_GET(self):
+        srv = self.server
+        if self.path == "/__stats":
+            with srv.lock:
+                stats = dict(srv.stats, assets=len(srv.assets))
+            return self._json(200, stats)
+        if "/upload/" in self.path and not self.path.startswith("/v1_1/"):
+            return self._deliver(head=False)
+        u = urlsplit(self.path)
+        m = re.match(r"^/v1_1/([^/]+)/resources/(\w+)/upload$", u.path)
+        if not m:
+            return self._json(404, {"error": {"message": "not found"}})
+        q = parse_qs(u.query)
+        prefix = (q.get("prefix") or [""])[0]
+        limit = max(1, min(500, int((q.get("max_results") or ["10"])[0])))
+        start = int((q.get("next_cursor") or ["0"])[0])
+        with srv.lock:
+            srv.stats["list_calls"] += 1
+            ids = sorted(k for k in srv.assets if k.startswith(prefix))
+            page = [(k, srv.assets[k]) for k in ids[start:start + limit]]
+        res = {"resources": [{
+            "public_id": k, "version": a["version"], "format": a["format"], "bytes": len(a["bytes"]),
+            "etag": a["etag"], "resource_type": m.group(2), "type": "upload",
+            "secure_url": self._asset_url(m.group(1), m.group(2), k, a),
+        } for k, a in page]}
+        if start + limit < len(ids):
+            res["next_cursor"] = str(start + limit)
+        self._json(200, res)
+
+    def do_DELETE(self):
+        srv = self.server
+        u = urlsplit(self.path)
+        if not re.match(r"^/v1_1/([^/]+)/resources/(\w+)/upload$", u.path):
+            return self._json(404, {"error": {"message": "not found"}})
+        deleted = {}
+        with srv.lock:
+            for pid in parse_qs(u.query).get("public_ids[]", []):
+                deleted[pid] = "deleted" if srv.assets.pop(pid, None) is not None else "not_found"
+                srv.stats["deleted"] += deleted[pid] == "deleted"
+        self._json(200, {"deleted": deleted})
+
+    def do_POST(self):
+        srv = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        m = re.match(r"^/v1_1/([^/]+)/(\w+)/upload$", self.path)
+        if not m:
+            return self._json(404, {"error": {"message": "not found"}})
+        with srv.lock:
+            throttled = False
+            if srv.rate_limit:
+                sec = int(time.time())
+                if srv.window[0] != sec:
+                    srv.window = [sec, 0]
+                srv.window[1] += 1
+                throttled = srv.window[1] > srv.rate_limit
+                if throttled:
+                    srv.stats["throttled"] += 1
+        if throttled:
+            self.send_response(429)
+            data = b'{"error": {"message": "Rate Limit Exceeded"}}'
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return self.wfile.write(data)
+        if srv.latency_ms:
+            time.sleep(srv.latency_ms / 1000.0)
+        with srv.lock:
+            fail = srv.rng.random() < srv.error_rate
+            if fail:
+                srv.stats["errors"] += 1
+        if fail:
+            return self._json(500, {"error": {"message": "fake server error"}})
+
+        fields = parse_multipart(body, self.headers.get("Content-Type"))
+        data = fields.get("file") or b""
+        folder = (fields.get("folder") or b"").decode("utf-8")
+        public_id = (fields.get("public_id") or b"").decode("utf-8") or hashlib.md5(data).hexdigest()[:20]
+        full_id = "%s/%s" % (folder, public_id) if folder else public_id
+        fmt = sniff_format(data)
+        etag = hashlib.md5(data).hexdigest()
+        with srv.lock:
+            version = int(time.time()) + srv.stats["uploads"]
+            srv.assets[full_id] = {"bytes": data, "version": version, "etag": etag, "format": fmt}
+            srv.stats["uploads"] += 1
+            srv.stats["bytes_in"] += len(data)
+        url = self._asset_url(m.group(1), m.group(2), full_id, srv.assets[full_id])
+        res = {
+            "public_id": full_id, "version": version, "format": fmt, "bytes": len(data),
+            "etag": etag, "resource_type": m.group(2), "url": url, "secure_url": url,
+        }
+        eager = [t for t in (fields.get("eager") or b"").decode("utf-8").split("|") if t]
+        if eager:
+            # el CDN falso entrega cualquier transformación con los bytes originales
+            res["eager"] = [{"transformation": t, "secure_url": url.replace("/upload/", "/upload/%s/" % t, 1)} for t in eager]
+            with srv.lock:
+                srv.stats["eager"] += len(eager)
+        self._json(200, res)
+
+def serve(port=0, latency_ms=0, error_rate=0.0, seed=None, rate_limit=0, cdn_latency_ms=0):
+    """Arranca el servidor en un hilo y lo devuelve (srv.base_url, srv.shutdown())."""
+    srv = FakeCloudinary(("127.0.0.1", port), latency_ms=latency_ms, error_rate=error_rate,
+                         seed=seed, rate_limit=rate_limit, cdn_latency_ms=cdn_latency_ms)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cloudinary falso para pruebas/benchmarks")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--rate-limit", type=int, default=0, help="subidas/s antes de responder 429")
+    ap.add_argument("--cdn-latency-ms", type=float, default=0, help="latencia de GET/HEAD de los assets")
+    args = ap.parse_args(argv)
+    srv = FakeCloudinary(("127.0.0.1", args.port), latency_ms=args.latency_ms, error_rate=args.error_rate,
+                         seed=args.seed, rate_limit=args.rate_limit, cdn_latency_ms=args.cdn_latency_ms)
+    print("fake cloudinary en %s" % srv.base_url, flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
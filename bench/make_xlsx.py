@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Genera un .xlsx sintético con la forma del catálogo real, para benchmarks.
+
+- Hoja 'Master' (más una hoja 'Notas' vacía delante), encabezados en la fila 5
+  ('2026 model', 'Description', 'FOB USD') y N filas de modelos a partir de la 6.
+- M imágenes ancladas por fila (oneCellAnchor en columnas D, E, …).
+- Formatos mezclables: png, bmp, emf (y jpg si hay Pillow); tamaño en px configurable.
+  Los píxeles son ruido, así que el peso se parece al de fotos reales (no comprime).
+- --dup-rate: fracción de imágenes repetidas; la mitad reusa la misma parte del ZIP y la
+  otra mitad es otra parte con bytes idénticos (lo que el dedupe por hash debe detectar).
+
+Uso:
+  python3 bench/make_xlsx.py --rows 500 --images 2 --size 800x600 --formats png,bmp,emf \\
+      --dup-rate 0.1 --seed 1 --out /tmp/bench.xlsx
+
+Sólo librería estándar (Pillow opcional para jpg); Python 3.9 compatible.
+"""
+
+import io, sys, zlib, random, struct, zipfile, argparse
+from xml.sax.saxutils import escape
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_R    = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PR   = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_XDR  = "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing"
+NS_A    = "http://schemas.openxmlformats.org/drawingml/2006/main"
+REL     = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+
+HEADER_ROW = 5
+HEADERS = ["2026 model", "Description", "FOB USD"]
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "bmp": "image/bmp", "emf": "image/x-emf"}
+
+# ========= Imágenes =========
+def _noise(rng, n):
+    return bytes(rng.getrandbits(8) for _ in range(n)) if n < 4096 else rng.getrandbits(8 * n).to_bytes(n, "little")
+
+def make_png(rng, w, h):
+    def chunk(t, d):
+        return struct.pack(">I", len(d)) + t + d + struct.pack(">I", zlib.crc32(t + d) & 0xffffffff)
+    row = 3 * w
+    raw = b"".join(b"\x00" + _noise(rng, row) for _ in range(h))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+def make_bmp(rng, w, h):
+    row = (3 * w + 3) & ~3
+    pixels = b"".join(_noise(rng, 3 * w) + b"\x00" * (row - 3 * w) for _ in range(h))
+    header = struct.pack("<2sIHHI", b"BM", 54 + len(pixels), 0, 0, 54)
+    info = struct.pack("<IiiHHIIiiII", 40, w, h, 1, 24, 0, len(pixels), 2835, 2835, 0, 0)
+    return header + info + pixels
+
+def make_emf(rng, w, h):
+    # EMR_HEADER + un rectángulo + EMR_EOF: vectorial mínimo válido (lo que Excel guarda al pegar desde Office)
+    bounds = struct.pack("<iiii", 0, 0, w, h)
+    frame = struct.pack("<iiii", 0, 0, w * 26, h * 26)   # 0.01 mm
+    # EMR_RECTANGLE con márgenes al azar: cada EMF generado es distinto
+    x0, y0 = rng.randrange(max(1, w // 4)), rng.randrange(max(1, h // 4))
+    records = [struct.pack("<II", 43, 24) + struct.pack("<iiii", x0, y0, w - x0, h - y0)]
+    body = b"".join(records)
+    eof = struct.pack("<IIIII", 14, 20, 0, 16, 20)
+    size = 88 + len(body) + len(eof)
+    header = (struct.pack("<II", 1, 88) + bounds + frame + b" EMF" + struct.pack("<IIIHH", 0x10000, size, 2 + len(records), 1, 0)
+              + struct.pack("<III", 0, 0, 0) + struct.pack("<ii", 1920, 1080) + struct.pack("<ii", 508, 286))
+    return header + body + eof
+
+def make_jpg(rng, w, h):
+    from PIL import Image
+    im = Image.frombytes("RGB", (w, h), _noise(rng, 3 * w * h))
+    out = io.BytesIO()
+    im.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+MAKERS = {"png": make_png, "bmp": make_bmp, "emf": make_emf, "jpg": make_jpg}
+
+# ========= Libro =========
+def col_letter(idx0):
+    s = ""
+    idx0 += 1
+    while idx0:
+        idx0, r = divmod(idx0 - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+def build(out, rows=100, images=1, size=(400, 300), formats=("png",), dup_rate=0.0, seed=0):
+    """Escribe el .xlsx y devuelve {"anchors", "media_parts", "distinct", "bytes"}."""
+    rng = random.Random(seed)
+    formats = list(formats)
+    if "jpg" in formats:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            sys.stderr.write("⚠️  Sin Pillow: jpg se reemplaza por png\n")
+            formats = [f if f != "jpg" else "png" for f in formats]
+    w, h = size
+
+    strings = list(HEADERS)
+    def sidx(s):
+        strings.append(s)
+        return len(strings) - 1
+
+    sheet_rows = ['<row r="%d">%s</row>' % (HEADER_ROW, "".join(
+        '<c r="%s%d" t="s"><v>%d</v></c>' % (col_letter(i), HEADER_ROW, i) for i in range(len(HEADERS))))]
+    anchors, rels, media = [], [], []   # media: (nombre, bytes)
+    made = []                           # (nombre, bytes, ext) ya generadas, para duplicar
+    distinct = 0
+    for i in range(rows):
+        r = HEADER_ROW + 1 + i
+        model = "BM-%05d" % i
+        sheet_rows.append('<row r="%d"><c r="A%d" t="s"><v>%d</v></c><c r="B%d" t="s"><v>%d</v></c><c r="C%d"><v>%.2f</v></c></row>'
+                          % (r, r, sidx(model), r, sidx("Producto sintético %d" % i), r, 5 + (i % 97) * 0.5))
+        for k in range(images):
+            if made and rng.random() < dup_rate:
+                name, data, ext = rng.choice(made)
+                if rng.random() < 0.5:
+                    target = name                                   # misma parte del ZIP
+                else:
+                    target = "image%d.%s" % (len(media) + 1, ext)   # otra parte, mismos bytes
+                    media.append((target, data))
+            else:
+                ext = formats[(i * images + k) % len(formats)]
+                data = MAKERS[ext](rng, w, h)
+                target = "image%d.%s" % (len(media) + 1, ext)
+                media.append((target, data))
+                made.append((target, data, ext))
+                distinct += 1
+            rid = "rId%d" % (len(rels) + 1)
+            rels.append('<Relationship Id="%s" Type="%simage" Target="../media/%s"/>' % (rid, REL, target))
+            anchors.append('<xdr:oneCellAnchor><xdr:from><xdr:col>%d</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>%d</xdr:row>'
+                           '<xdr:rowOff>0</xdr:rowOff></xdr:from><xdr:ext cx="914400" cy="685800"/><xdr:pic><xdr:nvPicPr>'
+                           '<xdr:cNvPr id="%d" name="Picture %d"/><xdr:cNvPicPr/></xdr:nvPicPr><xdr:blipFill><a:blip r:embed="%s"/>'
+                           '</xdr:blipFill><xdr:spPr/></xdr:pic><xdr:clientData/></xdr:oneCellAnchor>'
+                           % (3 + k, r - 1, len(anchors) + 2, len(anchors) + 1, rid))
+
+    exts = sorted(set(n.rsplit(".", 1)[1] for n, _ in media))
+    z = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED)
+    z.writestr("[Content_Types].xml",
+               '<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+               '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+               '<Default Extension="xml" ContentType="application/xml"/>'
+               + "".join('<Default Extension="%s" ContentType="%s"/>' % (e, CONTENT_TYPES[e]) for e in exts) +
+               '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+               '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+               '<Override PartName="/xl/worksheets/sheet2.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+               '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+               '<Override PartName="/xl/drawings/drawing1.xml" ContentType="application/vnd.openxmlformats-officedocument.drawing+xml"/>'
+               '</Types>')
+    z.writestr("_rels/.rels", '<Relationships xmlns="%s"><Relationship Id="rId1" Type="%sofficeDocument" Target="xl/workbook.xml"/></Relationships>' % (NS_PR, REL))
+    z.writestr("xl/workbook.xml", '<workbook xmlns="%s" xmlns:r="%s"><sheets><sheet name="Notas" sheetId="1" r:id="rId2"/>'
+               '<sheet name="Master" sheetId="2" r:id="rId1"/></sheets></workbook>' % (NS_MAIN, NS_R))
+    z.writestr("xl/_rels/workbook.xml.rels", '<Relationships xmlns="%s">'
+               '<Relationship Id="rId1" Type="%sworksheet" Target="worksheets/sheet1.xml"/>'
+               '<Relationship Id="rId2" Type="%sworksheet" Target="worksheets/sheet2.xml"/>'
+               '<Relationship Id="rId3" Type="%ssharedStrings" Target="sharedStrings.xml"/></Relationships>' % (NS_PR, REL, REL, REL))
+    z.writestr("xl/sharedStrings.xml", '<sst xmlns="%s" count="%d" uniqueCount="%d">%s</sst>'
+               % (NS_MAIN, len(strings), len(strings), "".join("<si><t>%s</t></si>" % escape(s) for s in strings)))
+    z.writestr("xl/worksheets/sheet1.xml", '<worksheet xmlns="%s" xmlns:r="%s"><sheetData>%s</sheetData><drawing r:id="rId1"/></worksheet>'
+               % (NS_MAIN, NS_R, "".join(sheet_rows)))
+    z.writestr("xl/worksheets/sheet2.xml", '<worksheet xmlns="%s"><sheetData/></worksheet>' % NS_MAIN)
+    z.writestr("xl/worksheets/_rels/sheet1.xml.rels", '<Relationships xmlns="%s"><Relationship Id="rId1" Type="%sdrawing" '
+               'Target="../drawings/drawing1.xml"/></Relationships>' % (NS_PR, REL))
+    z.writestr("xl/drawings/drawing1.xml", '<xdr:wsDr xmlns:xdr="%s" xmlns:a="%s" xmlns:r="%s">%s</xdr:wsDr>'
+               % (NS_XDR, NS_A, NS_R, "".join(anchors)))
+    z.writestr("xl/drawings/_rels/drawing1.xml.rels", '<Relationships xmlns="%s">%s</Relationships>' % (NS_PR, "".join(rels)))
+    total = 0
+    for name, data in media:
+        # media ya comprimida: STORED, como la guarda Excel
+        z.writestr(zipfile.ZipInfo("xl/media/" + name), data, compress_type=zipfile.ZIP_STORED)
+        total += len(data)
+    z.close()
+    return {"anchors": len(anchors), "media_parts": len(media), "distinct": distinct, "bytes": total}
+
+def parse_size(s):
+    w, _, h = s.lower().partition("x")
+    return int(w), int(h or w)
+
+def add_args(ap):
+    ap.add_argument("--rows", type=int, default=200, help="filas de modelos")
+    ap.add_argument("--images", type=int, default=1, help="imágenes ancladas por fila")
+    ap.add_argument("--size", default="400x300", help="px por imagen (WxH)")
+    ap.add_argument("--formats", default="png", help="lista: png,jpg,bmp,emf (se alternan)")
+    ap.add_argument("--dup-rate", type=float, default=0.0, help="fracción de imágenes duplicadas")
+    ap.add_argument("--seed", type=int, default=1)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera un .xlsx sintético para benchmarks")
+    add_args(ap)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args(argv)
+    info = build(args.out, rows=args.rows, images=args.images, size=parse_size(args.size),
+                 formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+                 dup_rate=args.dup_rate, seed=args.seed)
+    print("%s: %d anchors, %d partes de media (%d distintas), %.1f MB de imágenes"
+          % (args.out, info["anchors"], info["media_parts"], info["distinct"], info["bytes"] / 1048576.0))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark reproducible del subidor incremental contra el Cloudinary falso.
+
+1) Genera (y cachea por parámetros) un .xlsx sintético con bench/make_xlsx.py.
+2) Arranca bench/fake_cloudinary.py en este proceso (latencia / errores / rate limit).
+3) Corre extract_and_upload_images_by_model_incremental.py como subproceso, en un directorio
+   de trabajo limpio por repetición (data/ propio, CLD_FORCE=1: siempre corrida en frío).
+4) Mide tiempo de pared, img/s, MB/s, p50/p95, RSS pico del subproceso (os.wait4, incluye
+   los procesos de transcodificación) y los tiempos por fase de data/run_report.json.
+5) Agrega una línea JSON a bench/results.jsonl con commit, parámetros y medianas; con
+   --history muestra las corridas previas con los mismos parámetros, commit por commit.
+
+Uso:
+  python3 bench/run_bench.py --rows 500 --images 1 --size 800x600 --formats png,bmp,emf \\
+      --dup-rate 0.1 --latency-ms 40 --error-rate 0.01 --repeat 3
+  python3 bench/run_bench.py --rows 500 --history
+  python3 bench/run_bench.py --rows 200 --env CLD_CONCURRENCY=4 --env IMG_WORKERS=0
+
+Sólo librería estándar (Pillow opcional, como en el script); Linux/macOS. Python 3.9 compatible.
+"""
+
+import os, sys, json, time, shutil, hashlib, argparse, tempfile, threading, subprocess, statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+SCRIPT = os.path.join(ROOT, "extract_and_upload_images_by_model_incremental.py")
+RESULTS = os.path.join(BENCH_DIR, "results.jsonl")
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "showroom_bench")
+
+sys.path.insert(0, BENCH_DIR)
+import make_xlsx
+from fake_cloudinary import serve
+
+def git_rev():
+    def git(*args):
+        try:
+            return subprocess.check_output(("git",) + args, cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+    return git("rev-parse", "--short", "HEAD") or "?", bool(git("status", "--porcelain", "--untracked-files=no"))
+
+def workbook_for(args):
+    """Ruta del .xlsx sintético para estos parámetros (se genera una sola vez)."""
+    params = {"rows": args.rows, "images": args.images, "size": args.size, "formats": args.formats,
+              "dup_rate": args.dup_rate, "seed": args.seed}
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(CACHE_DIR, "bench_%s.xlsx" % key)
+    if not os.path.exists(path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = path + ".tmp"
+        info = make_xlsx.build(tmp, rows=args.rows, images=args.images, size=make_xlsx.parse_size(args.size),
+                               formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+                               dup_rate=args.dup_rate, seed=args.seed)
+        os.replace(tmp, path)
+        print("[bench] libro generado: %s (%d anchors, %.1f MB de imágenes)" % (path, info["anchors"], info["bytes"] / 1048576.0))
+    return path, params
+
+def run_once(xlsx, base_url, extra_env, timeout):
+    work = tempfile.mkdtemp(prefix="showroom_bench_run_")
+    env = dict(os.environ)
+    env.update({
+        "EXCEL_PATH": xlsx, "EXCEL_URL": "", "SHEET_NAME": "Master", "HEADER_ROW": "5",
+        "CLOUDINARY_CLOUD_NAME": "bench", "CLOUDINARY_API_KEY": "bench", "CLOUDINARY_API_SECRET": "bench",
+        "CLD_API_BASE": base_url, "CLD_FORCE": "1", "CLD_RESUME": "0",
+        "PROGRESS_FORMAT": "json", "PROGRESS_EVERY": "3600", "RUN_REPORT": "1",
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    env.update(extra_env)
+    t0 = time.time()
+    proc = subprocess.Popen([sys.executable, SCRIPT], cwd=work, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stdout/stderr en hilos y os.wait4 aquí mismo: así el rusage (RSS pico) es el de este hijo
+    # (más los nietos que esperó: pool de transcodificación), no el acumulado de todos
+    chunks = {"out": [], "err": []}
+    readers = [threading.Thread(target=lambda k, f: chunks[k].append(f.read()), args=(k, f), daemon=True)
+               for k, f in (("out", proc.stdout), ("err", proc.stderr))]
+    for t in readers:
+        t.start()
+    killer = threading.Timer(timeout, proc.kill)
+    killer.start()
+    _, status, ru = os.wait4(proc.pid, 0)
+    killer.cancel()
+    wall = time.time() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    for t in readers:
+        t.join()
+    out, err = b"".join(chunks["out"]), b"".join(chunks["err"])
+    rss_mb = ru.ru_maxrss / 1024.0   # Linux: KiB
+    summary = None
+    for line in out.decode("utf-8", "replace").splitlines():
+        if line.startswith("{"):
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue
+            if ev.get("event") == "summary":
+                summary = ev
+    try:
+        with open(os.path.join(work, "data", "run_report.json"), "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+    shutil.rmtree(work, ignore_errors=True)
+    if proc.returncode != 0 or summary is None:
+        sys.stderr.write(err.decode("utf-8", "replace")[-2000:])
+        raise SystemExit("[bench] la corrida falló (código %s)" % proc.returncode)
+    return {
+        "wall_s": round(wall, 3),
+        "images_per_s": summary.get("images_per_s"),
+        "mbytes_per_s": round(summary.get("bytes_sent", 0) / 1048576.0 / max(1e-6, summary.get("upload_s") or wall), 3),
+        "p50_ms": summary.get("p50_ms"),
+        "p95_ms": summary.get("p95_ms"),
+        "uploaded": summary.get("uploaded"),
+        "failed": summary.get("failed"),
+        "aliased": summary.get("aliased"),
+        "bytes_sent": summary.get("bytes_sent"),
+        "maxrss_mb": round(rss_mb, 1),
+        "phases": dict((p["name"], p["wall_s"]) for p in report.get("phases", [])),
+    }
+
+def median_of(runs, key):
+    vals = [r[key] for r in runs if r.get(key) is not None]
+    return round(statistics.median(vals), 3) if vals else None
+
+def show_history(params_key):
+    try:
+        with open(RESULTS, "r", encoding="utf-8") as f:
+            rows = [json.loads(l) for l in f if l.strip()]
+    except OSError:
+        rows = []
+    rows = [r for r in rows if r.get("params_key") == params_key]
+    if not rows:
+        print("[bench] sin resultados previos para estos parámetros")
+        return
+    print("%-20s %-10s %9s %9s %9s %8s %8s" % ("fecha", "commit", "wall_s", "img/s", "rss_mb", "p50", "p95"))
+    for r in rows:
+        m = r["median"]
+        print("%-20s %-10s %9s %9s %9s %8s %8s" % (r["time"][:19], r["commit"] + ("*" if r.get("dirty") else ""),
+              m["wall_s"], m["images_per_s"], m["maxrss_mb"], m["p50_ms"], m["p95_ms"]))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark del subidor de imágenes contra el Cloudinary falso")
+    make_xlsx.add_args(ap)
+    ap.add_argument("--latency-ms", type=float, default=20)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--timeout", type=float, default=1800)
+    ap.add_argument("--env", action="append", default=[], help="KEY=VALUE extra para el script (repetible)")
+    ap.add_argument("--label", default="", help="etiqueta libre para el resultado")
+    ap.add_argument("--no-save", action="store_true", help="no agregar a bench/results.jsonl")
+    ap.add_argument("--history", action="store_true", help="sólo mostrar resultados previos")
+    args = ap.parse_args(argv)
+
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    server = {"latency_ms": args.latency_ms, "error_rate": args.error_rate, "rate_limit": args.rate_limit}
+    key_src = {"rows": args.rows, "images": args.images, "size": args.size, "formats": args.formats,
+               "dup_rate": args.dup_rate, "seed": args.seed, "server": server, "env": extra_env}
+    params_key = hashlib.sha1(json.dumps(key_src, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    if args.history:
+        return show_history(params_key)
+
+    xlsx, params = workbook_for(args)
+    runs = []
+    for i in range(args.repeat):
+        # servidor nuevo por repetición: sin assets ni conexiones de la anterior
+        srv = serve(0, latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed, rate_limit=args.rate_limit)
+        try:
+            r = run_once(xlsx, srv.base_url, extra_env, args.timeout)
+            with srv.lock:
+                r["server"] = dict(srv.stats)
+        finally:
+            srv.shutdown()
+            srv.server_close()
+        runs.append(r)
+        print("[bench] %d/%d: %.2fs · %s img/s · %s MB/s · p50 %s ms · p95 %s ms · RSS %s MB · subidas %s (fallidas %s) · conexiones %d"
+              % (i + 1, args.repeat, r["wall_s"], r["images_per_s"], r["mbytes_per_s"], r["p50_ms"], r["p95_ms"],
+                 r["maxrss_mb"], r["uploaded"], r["failed"], r["server"]["connections"]))
+
+    commit, dirty = git_rev()
+    keys = ("wall_s", "images_per_s", "mbytes_per_s", "p50_ms", "p95_ms", "maxrss_mb")
+    median = dict((k, median_of(runs, k)) for k in keys)
+    phases = {}
+    for name in runs[0]["phases"]:
+        phases[name] = round(statistics.median(r["phases"].get(name, 0) for r in runs), 4)
+    result = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "dirty": dirty, "label": args.label,
+        "params_key": params_key, "params": dict(params, server=server, env=extra_env),
+        "python": sys.version.split()[0], "cpus": os.cpu_count(),
+        "median": median, "phases": phases, "runs": runs,
+    }
+    print("[bench] mediana (%d corridas) @ %s%s: %s" % (len(runs), commit, "*" if dirty else "",
+          " · ".join("%s=%s" % (k, median[k]) for k in keys)))
+    print("[bench] fases (mediana, s): %s" % " · ".join("%s=%s" % kv for kv in phases.items()))
+    if not args.no_save:
+        with open(RESULTS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print("[bench] guardado en %s (params %s)" % (RESULTS, params_key))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,16 +7,20 @@ nombrándolas por el valor de la columna '2026 model' (aliases permitidos).
 
 - EXCEL_URL o EXCEL_PATH (uno de los dos).
 - SHEET_NAME='Master' por defecto. HEADER_ROW=5 por defecto.
+- La hoja se lee en streaming (xlsx_media): sólo encabezados y columna del modelo.
+- Mapa atómico (image_map): si una subida falla, el modelo conserva su URL del mapa anterior;
+  al lado queda un índice compacto (data/cloudinary_map_index.json).
 - Python 3.9 compatible (sin typing PEP 604).
 - No depende de 'requests'.
 
-Requiere: openpyxl, cloudinary  (opcional: python-dotenv)
+Requiere: cloudinary  (opcional: python-dotenv)
 """
 
-import os, re, io, sys, json, zipfile
+import os, re, io, sys, time, zipfile, hashlib
 from urllib.request import urlopen, Request
 from xml.etree import ElementTree as ET
-from openpyxl import load_workbook
+from xlsx_media import pick_sheet, stream_model_column, rels_path_for, ModelIndex, ZipIndex
+from image_map import write_map, load_map, merge_previous, index_path_for
 import cloudinary, cloudinary.uploader
 
 # .env opcional
@@ -44,6 +48,7 @@ CLD_FOLDER = (os.getenv("CLOUDINARY_FOLDER") or "showroom_2025").strip()
 # Salida
 DATA_DIR     = "data"
 IMG_MAP_JSON = os.path.join(DATA_DIR, "cloudinary_map.json")
+IMG_INDEX_JSON = index_path_for(IMG_MAP_JSON)
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # ========= VALIDACIONES =========
@@ -73,38 +78,39 @@ def fuzzy_find_key(row_dict, aliases):
                 return k
     return None
 
-def fetch_excel_bytes():
+def open_workbook():
+    # Archivo local: el ZIP se lee directo del disco (sin copiar el .xlsx a memoria)
     if EXCEL_PATH:
-        with open(EXCEL_PATH, "rb") as f:
-            return f.read()
+        return zipfile.ZipFile(EXCEL_PATH, "r")
     # URL
     req = Request(EXCEL_URL, headers={"User-Agent":"Mozilla/5.0"})
     with urlopen(req, timeout=120) as r:
-        return r.read()
+        return zipfile.ZipFile(io.BytesIO(r.read()), "r")
 
 # ========= Cargar libro/hoja =========
-xlsx_bytes = fetch_excel_bytes()
-wb = load_workbook(io.BytesIO(xlsx_bytes), data_only=True)
-if SHEET_NAME not in wb.sheetnames:
-    print("⚠️  Hoja '%s' no existe, usando la primera: %s" % (SHEET_NAME, wb.sheetnames[0]))
-    SHEET_NAME = wb.sheetnames[0]
-ws = wb[SHEET_NAME]
-
-headers = [cell.value if cell.value is not None else "" for cell in ws[HEADER_ROW]]
-
-def row_to_dict(r):
-    row = ws[r]
-    d = {}
-    for i, cell in enumerate(row[:len(headers)]):
-        d[headers[i]] = cell.value if cell.value is not None else ""
-    return d
-
-sample_dict = row_to_dict(HEADER_ROW + 1)
-model_key = fuzzy_find_key(sample_dict, A_MODEL)
+z = open_workbook()
+zidx = ZipIndex(z)   # nombres del ZIP en hash maps (se consulta por anchor)
+
+SHEET_TITLE, SHEET_PART, found = pick_sheet(z, SHEET_NAME)
+if not SHEET_PART:
+    sys.exit("❌ ERROR: El libro no tiene hojas.")
+if not found:
+    print("⚠️  Hoja '%s' no existe, usando la primera: %s" % (SHEET_NAME, SHEET_TITLE))
+SHEET_NAME = SHEET_TITLE
+
+def pick_model_key(hdrs):
+    return fuzzy_find_key(dict.fromkeys(hdrs), A_MODEL)
+
+# Un solo recorrido de la hoja: encabezados + columna del modelo ({fila: modelo})
+headers, model_key, models, max_row = stream_model_column(z, SHEET_PART, HEADER_ROW, pick_model_key)
 if not model_key:
     print("Headers:", headers)
     sys.exit("❌ ERROR: No pude detectar la columna del modelo. Aliases: %s" % A_MODEL)
 
+# fila -> modelo en O(1) (incluye la búsqueda de hasta 3 filas hacia abajo)
+model_index = ModelIndex(models, HEADER_ROW, max_row)
+del models
+
 # ========= Parsear drawings del .xlsx desde bytes =========
 NS = {
     "a":   "http://schemas.openxmlformats.org/drawingml/2006/main",
@@ -112,14 +118,11 @@ NS = {
     "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
 }
 
-z = zipfile.ZipFile(io.BytesIO(xlsx_bytes), "r")
-
 # localizar drawing de la hoja actual
-sheet_index = wb.sheetnames.index(ws.title) + 1
-sheet_rels_path = "xl/worksheets/_rels/sheet%d.xml.rels" % sheet_index
+sheet_rels_path = rels_path_for(SHEET_PART)
 
 drawing_target = None
-if sheet_rels_path in z.namelist():
+if sheet_rels_path in zidx:
     rels_xml = ET.fromstring(z.read(sheet_rels_path))
     # Namespace Relationships de OPC
     RNS = {"": "http://schemas.openxmlformats.org/package/2006/relationships"}
@@ -130,20 +133,19 @@ if sheet_rels_path in z.namelist():
 
 if not drawing_target:
     # Sin imágenes incrustadas
-    with open(IMG_MAP_JSON, "w", encoding="utf-8") as f:
-        json.dump({}, f, ensure_ascii=False, indent=2)
+    write_map(IMG_MAP_JSON, IMG_INDEX_JSON, {})
     sys.exit("ℹ️ La hoja no tiene imágenes incrustadas.")
 
 drawing_path = drawing_target.replace("../", "xl/")
 if not drawing_path.startswith("xl/"):
     drawing_path = "xl/" + drawing_target.lstrip("/")
 
-if drawing_path not in z.namelist():
+if drawing_path not in zidx:
     sys.exit("❌ No encontré el drawing en el ZIP: %s" % drawing_path)
 
 rels_path = drawing_path.replace("drawings/", "drawings/_rels/") + ".rels"
 rels_map = {}
-if rels_path in z.namelist():
+if rels_path in zidx:
     d_rels = ET.fromstring(z.read(rels_path))
     RNS = {"": "http://schemas.openxmlformats.org/package/2006/relationships"}
     for rel in d_rels.findall("Relationship", RNS):
@@ -177,57 +179,26 @@ for tag in ("twoCellAnchor", "oneCellAnchor"):
         anchors.append({"row0": row0, "col0": col0, "media": media})
 
 if not anchors:
-    with open(IMG_MAP_JSON, "w", encoding="utf-8") as f:
-        json.dump({}, f, ensure_ascii=False, indent=2)
+    write_map(IMG_MAP_JSON, IMG_INDEX_JSON, {})
     sys.exit("ℹ️ No se detectaron anchors de imágenes.")
 
 # ========= Procesar anchors y subir =========
-def find_model_for_row(start_r):
-    # toma modelo en start_r; si vacío, mira hacia abajo 3 filas
-    row_excel = start_r
-    if row_excel <= HEADER_ROW:
-        row_excel = HEADER_ROW + 1
-    if row_excel > ws.max_row:
-        return "", None
-    rdict = row_to_dict(row_excel)
-    val = (rdict.get(model_key) or "").strip() if rdict else ""
-    if val:
-        return val, row_excel
-    for off in range(1, 4):
-        r2 = row_excel + off
-        if r2 > ws.max_row: break
-        rd2 = row_to_dict(r2)
-        mv2 = (rd2.get(model_key) or "").strip() if rd2 else ""
-        if mv2:
-            return mv2, r2
-    return "", row_excel
-
 uploaded = 0
 failed   = 0
 skipped  = 0
-model_to_url = {}
+model_to_url = {}      # modelo -> [(url, hash, uploaded_at)]
+failed_models = set()
 
 for a in anchors:
     row_excel = a["row0"] + 1
-    model_val, bind_row = find_model_for_row(row_excel)
+    model_val, bind_row = model_index.lookup(row_excel)
     if not model_val:
         continue
 
-    media_path = a["media"]
-    # fallback por número de imagen, si el path rel no está
-    if media_path not in z.namelist():
-        candidates = [n for n in z.namelist() if n.startswith("xl/media/")]
-        mnum = re.search(r"image(\d+)\.(\w+)", media_path or "", re.I)
-        chosen = None
-        if mnum:
-            for c in candidates:
-                if ("image%s." % mnum.group(1)) in c:
-                    chosen = c
-                    break
-        media_path = chosen or media_path
-
-    if media_path not in z.namelist():
-        print("⚠️  Media no encontrada en ZIP:", media_path)
+    # ruta del rel o, si no está, fallback por número de imagen
+    media_path = zidx.resolve_media(a["media"])
+    if not media_path:
+        print("⚠️  Media no encontrada en ZIP:", a["media"])
         failed += 1
         continue
 
@@ -246,16 +217,16 @@ for a in anchors:
         )
         secure = res.get("secure_url", "")
         optimized = secure.replace("/upload/", "/upload/f_auto,q_auto/")
-        model_to_url[model_val] = optimized
+        model_to_url[model_val] = [(optimized, hashlib.sha1(img_bytes).hexdigest(), int(time.time()))]
         uploaded += 1
         print("↑ OK %s -> %s" % (model_val, optimized))
     except Exception as e:
         failed += 1
+        failed_models.add(model_val)
         print("❌ Error subiendo %s: %s" % (model_val, e))
 
-# Guardar mapa (opcional para inspección)
-with open(IMG_MAP_JSON, "w", encoding="utf-8") as f:
-    json.dump(model_to_url, f, ensure_ascii=False, indent=2)
+# Guardar mapa (opcional para inspección): tmp + rename; las fallidas conservan su URL anterior
+write_map(IMG_MAP_JSON, IMG_INDEX_JSON, merge_previous(model_to_url, load_map(IMG_MAP_JSON), failed_models))
 
 print("\n========== RESUMEN ==========")
 print("Anchors procesados:           ", len(anchors))
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+Escritura del mapa modelo -> imágenes que consume server.js.
+
+Compartido por extract_and_upload_images_by_model*.py:
+- write_json_atomic: tmp + fsync + rename (quien lee ve el archivo anterior o el nuevo).
+- write_map: data/cloudinary_map*.json legible ({modelo: [url, …]}, indent=2) y, al lado,
+  un índice compacto y versionado para cargar/diferenciar barato. Su nombre sale del mapa
+  (index_path_for): data/cloudinary_map_full.json -> data/cloudinary_map_full_index.json.
+
+    {"version": 1, "generated_at": epoch, "base": "https://…/upload/f_auto,q_auto/",
+     "models": {"MODELO": [[hash16, uploaded_at, "v123/carpeta/MODELO.png"], …]}}
+
+  minificado y con claves ordenadas (dos corridas iguales dan bytes iguales salvo generated_at);
+  cada URL = base + resto; hash16 = primeros 16 hex del sha1 del contenido (el del manifiesto).
+  Un solo objeto JSON: se lee con un JSON.parse.
+- Derivados por ancho (IMG_WIDTHS): al lado, data/cloudinary_sizes.json
+
+    {"version": 2, "generated_at": epoch, "widths": [320, 640],
+     "models": {"MODELO": [{"320": url, "640": url}, …]},      (grilla/srcset: DERIVATIVE)
+     "documents": {"MODELO": [{"320": url, "640": url}, …]}}   (PDF/Excel: DOCUMENT_DERIVATIVE)
+
+  una entrada por imagen de la galería; las transformaciones son las mismas que se piden
+  eager al subir, para que la grilla y el PDF bajen sólo el tamaño (y formato) que usan.
+  Sin IMG_WIDTHS el archivo no existe.
+- merge_previous: los modelos cuya subida falló conservan lo que tenían en el mapa anterior.
+- load_items: lo último escrito como items (del índice si está al día, si no del mapa), para
+  corridas que sólo tocan algunos modelos (CLD_MODE=retry).
+
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import os, re, json, time
+
+INDEX_VERSION = 1
+INDEX_HASH_LEN = 16
+SIZES_VERSION = 2   # 2: derivados aparte para PDF/Excel ("documents")
+# ancho máximo sin agrandar, calidad automática; la grilla con formato automático (WebP/AVIF
+# según el navegador) y los documentos en JPEG, que pdfkit y exceljs sí leen
+DERIVATIVE = "c_limit,w_%d,f_auto,q_auto"
+DOCUMENT_DERIVATIVE = "c_limit,w_%d,f_jpg,q_auto"
+
+_UPLOAD_URL = re.compile(r"^(.*?/upload/)(?:(?!v\d+/)[^/]+/)*(v\d+/.+)$")
+
+def write_json_atomic(path, obj, **dump_kw):
+    # tmp + rename: quien lea el archivo ve el anterior o el nuevo, nunca uno a medias
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, **dump_kw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def index_path_for(map_path):
+    """Índice compacto de un mapa: <mapa>_index.json en el mismo directorio."""
+    return os.path.splitext(map_path)[0] + "_index.json"
+
+def gallery_urls(value):
+    """Valor del mapa -> [url, …] (acepta el formato viejo {modelo: url})."""
+    if isinstance(value, list):
+        return [u for u in value if u]
+    return [value] if value else []
+
+def load_map(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+def merge_previous(items, prev_map, failed_models):
+    """Agrega a `items` la galería anterior de los modelos que fallaron y no tienen nada nuevo."""
+    for model in failed_models:
+        if model not in items and prev_map.get(model):
+            items[model] = [(u, None, None) for u in gallery_urls(prev_map[model])]
+    return items
+
+def load_items(map_path, index_path=None):
+    """{modelo: [(url, hash16|None, uploaded_at|None), …]} tal como quedó en la última escritura."""
+    try:
+        fresh = os.path.getmtime(index_path) >= os.path.getmtime(map_path)
+    except (OSError, TypeError):
+        fresh = False
+    if fresh:
+        index = load_map(index_path)
+        if index.get("version") == INDEX_VERSION and isinstance(index.get("models"), dict):
+            base = index.get("base") or ""
+            return dict((m, [(base + rel, h, ts) for h, ts, rel in entries]) for m, entries in index["models"].items())
+    return dict((m, [(u, None, None) for u in gallery_urls(v)]) for m, v in load_map(map_path).items() if gallery_urls(v))
+
+def parse_widths(value):
+    """'320, 640,1280' -> [320, 640, 1280] (ordenados, sin repetidos ni ceros)."""
+    return sorted(set(int(w) for w in re.findall(r"\d+", value or "") if int(w) > 0))
+
+def eager_transformations(widths):
+    """Parámetro 'eager' de la Upload API: los derivados se generan al subir (no en la primera visita)."""
+    return "|".join(t % w for w in widths for t in (DERIVATIVE, DOCUMENT_DERIVATIVE))
+
+def derivative_url(url, width, transformation=DERIVATIVE):
+    """URL de entrega -> misma imagen con la transformación (reemplaza f_auto,q_auto u otra)."""
+    m = _UPLOAD_URL.match(url or "")
+    return "%s%s/%s" % (m.group(1), transformation % width, m.group(2)) if m else None
+
+def _sized(items, widths, transformation):
+    out = {}
+    for m, entries in items.items():
+        sized = [dict((str(w), derivative_url(u, w, transformation)) for w in widths) for u, _, _ in entries]
+        if any(all(d.values()) for d in sized):
+            out[m] = [d if all(d.values()) else {} for d in sized]
+    return out
+
+def build_sizes(items, widths, generated_at=None):
+    return {"version": SIZES_VERSION, "generated_at": int(generated_at or time.time()), "widths": list(widths),
+            "models": _sized(items, widths, DERIVATIVE), "documents": _sized(items, widths, DOCUMENT_DERIVATIVE)}
+
+def _url_base(urls):
+    base = os.path.commonprefix(urls) if urls else ""
+    return base[:base.rfind("/") + 1]
+
+def build_index(items, generated_at=None):
+    """items: {modelo: [(url, hash, uploaded_at), …]} en orden de galería."""
+    base = _url_base([u for entries in items.values() for u, _, _ in entries])
+    return {
+        "version": INDEX_VERSION,
+        "generated_at": int(generated_at or time.time()),
+        "base": base,
+        "models": dict((m, [[(h or "")[:INDEX_HASH_LEN] or None, ts, u[len(base):]] for u, h, ts in entries]) for m, entries in items.items()),
+    }
+
+def write_map(map_path, index_path, items, sizes_path=None, widths=()):
+    """Mapa legible + índice compacto (+ derivados por ancho), atómicos. items: {modelo: [(url, hash, uploaded_at), …]}."""
+    write_json_atomic(map_path, dict((m, [u for u, _, _ in entries]) for m, entries in items.items()), indent=2)
+    if index_path:
+        write_json_atomic(index_path, build_index(items), separators=(",", ":"), sort_keys=True)
+    if sizes_path and widths:
+        write_json_atomic(sizes_path, build_sizes(items, widths), separators=(",", ":"), sort_keys=True)
+    elif sizes_path:
+        # sin IMG_WIDTHS: que nadie use derivados de una configuración anterior
+        try:
+            os.remove(sizes_path)
+        except OSError:
+            pass
@@ -0,0 +1,1568 @@
+# -*- coding: utf-8 -*-
+
+"""
+Motor importable del subidor incremental de imágenes (.xlsx -> Cloudinary).
+
+- Config: configuración desde variables de entorno (más overrides por trabajo).
+- Engine: estado que sobrevive entre corridas: pool de conexiones keep-alive,
+  pool de transcodificación y caché de libros ya parseados (anchors ligados a
+  modelo + hashes de media), así un segundo trabajo sobre el mismo .xlsx no
+  vuelve a leer la hoja ni a hashear imágenes.
+- Engine.run(cfg, log, cancel, emit): una corrida completa; devuelve el resumen. Con `emit`,
+  además de los logs de texto manda eventos dict (fase, contadores, bytes, img/s, p50/p95, ETA).
+- Incremental: manifiesto modelo -> hash -> URL (sólo se sube lo nuevo o cambiado), journal por
+  subida confirmada (una corrida cortada se retoma) y, si el libro (sha1) y la configuración son
+  los de la última corrida completa, no se hace nada (CLD_SKIP_UNCHANGED=0 lo desactiva).
+- Extracción y subida en pipeline (cola acotada + hilos), transcodificación en procesos aparte
+  (IMG_WORKERS, image_transcode) y subidas por upload_engine; con IMG_WIDTHS cada subida pide
+  los derivados por ancho como eager (ver image_map).
+- CLD_MODE=reconcile: lista la carpeta remota (Admin API, paginado), re-sube lo que falta o
+  no coincide por etag/bytes y borra los huérfanos; CLD_DRY_RUN=1 sólo imprime el plan.
+- CLD_SHARD=i/N: esta corrida sólo sube los modelos de su shard (sha1 del modelo mod N) y deja
+  sus resultados en data/shards/<i>-of-<N>/; image_shards los reparte y los combina.
+- Subidas fallidas -> cola de fallidas (DLQ_JSONL, una línea por imagen) con sus bytes originales
+  cacheados en FAILED_MEDIA_DIR; CLD_MODE=retry reprocesa sólo esas sin volver a leer el libro.
+- CLD_MODE=verify: HEAD/Range concurrente a las URLs del mapa (image_verify); las rotas se
+  marcan "broken" en el manifiesto y la próxima corrida las vuelve a subir.
+
+Lo usan extract_and_upload_images_by_model_incremental.py (CLI, una corrida) e
+image_worker.py (daemon que atiende trabajos por stdin/stdout).
+Python 3.9 compatible (sin typing PEP604).
+"""
+
+import os, re, sys, json, zipfile, time, hashlib, queue, threading, multiprocessing
+from collections import OrderedDict, deque
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+from xml.etree import ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from xlsx_media import list_sheets, read_rels, stream_model_column, ModelIndex, ZipIndex
+from upload_engine import (CloudinaryUploader, DEFAULT_API_BASE, AdaptiveLimiter, TokenBucket,
+                           classify_error, backoff_delay, OK, PERMANENT, RATE_LIMIT)
+from image_transcode import needs_transcode, transcode, PIL_OK
+from run_profile import PhaseTimer
+from image_verify import verify_urls, sample_entries
+from image_map import (write_json_atomic, write_map, load_map, load_items, merge_previous,
+                       index_path_for, parse_widths, eager_transformations, SIZES_VERSION)
+
+# Por defecto, usar el archivo local data/last.xlsx (arrastrado por el usuario)
+DEFAULT_EXCEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "last.xlsx")
+DEFAULT_MODEL_ALIASES = "2026 model,2026 Model,Model,Item #,Item,Modelo,#Item,Item#"
+
+NS = {
+    "a":   "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r":   "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
+}
+
+class PipelineStop(Exception):
+    """Fin anticipado de la corrida con mensaje para el usuario (equivale al sys.exit de antes)."""
+
+    def __init__(self, message, code=1):
+        Exception.__init__(self, message)
+        self.code = code
+
+# ========= CONFIG =========
+def _flag(v, default):
+    v = (v or default).strip().lower()
+    return v in ("1", "true", "yes")
+
+class Config:
+    """Mismas variables de entorno que antes tenía el script, como atributos."""
+
+    def __init__(self, env=None):
+        env = os.environ if env is None else env
+        g = lambda k, d="": (env.get(k) or d).strip()
+
+        # Misma precedencia que server.js: EXCEL_URL gana salvo que EXCEL_PATH venga explícito
+        self.EXCEL_URL  = g("EXCEL_URL")
+        self.EXCEL_PATH = g("EXCEL_PATH") or ("" if self.EXCEL_URL else DEFAULT_EXCEL_PATH)
+        self.EXCEL_TIMEOUT = int(g("EXCEL_TIMEOUT", "120"))         # s sin recibir datos (no total)
+        self.SHEET_NAME = g("SHEET_NAME", "Master")
+        self.HEADER_ROW = int(g("HEADER_ROW", "5"))
+        # Columna modelo (aliases)
+        self.A_MODEL = [s.strip() for s in g("COL_MODEL", DEFAULT_MODEL_ALIASES).split(",")]
+
+        # Cloudinary
+        self.CLOUD_NAME = g("CLOUDINARY_CLOUD_NAME")
+        self.API_KEY    = g("CLOUDINARY_API_KEY")
+        self.API_SECRET = g("CLOUDINARY_API_SECRET")
+        self.CLD_FOLDER = g("CLOUDINARY_FOLDER", "showroom_2025")
+
+        # Performance
+        self.CLD_CONCURRENCY     = int(g("CLD_CONCURRENCY", "8"))      # subidas en vuelo al arrancar
+        self.CLD_MIN_CONCURRENCY = int(g("CLD_MIN_CONCURRENCY", "1"))
+        self.CLD_MAX_CONCURRENCY = int(g("CLD_MAX_CONCURRENCY", str(max(self.CLD_CONCURRENCY, 32))))  # hilos de subida
+        self.CLD_RATE_LIMIT   = float(g("CLD_RATE_LIMIT", "0"))     # arranques de subida por segundo (0 = sin límite)
+        self.CLD_TIMEOUT      = int(g("CLD_TIMEOUT", "120"))        # s (timeout por upload en Cloudinary)
+        self.CLD_MAX_RETRIES  = int(g("CLD_MAX_RETRIES", "2"))      # intentos por imagen (los 4xx no se reintentan)
+        self.CLD_ENGINE       = g("CLD_ENGINE", "pool").lower()     # pool | sdk
+        self.CLD_API_BASE     = g("CLD_API_BASE", DEFAULT_API_BASE) # backend del motor 'pool'
+        self.CLD_QUEUE_SIZE   = int(g("CLD_QUEUE_SIZE", str(2 * self.CLD_CONCURRENCY)))  # imágenes en espera (acota RAM)
+        self.IMG_WORKERS      = int(g("IMG_WORKERS", str(os.cpu_count() or 2)))  # procesos de transcodificación
+        self.IMG_MAX_EDGE     = int(g("IMG_MAX_EDGE", "2000"))      # px del lado largo (0 = sin límite)
+        self.IMG_MAX_BYTES    = int(g("IMG_MAX_BYTES", "1500000"))  # bytes por imagen antes de recomprimir (0 = sin límite)
+        self.IMG_JPEG_QUALITY = int(g("IMG_JPEG_QUALITY", "85"))
+        # Derivados por ancho (ver image_map.DERIVATIVE/DOCUMENT_DERIVATIVE): "320,640" -> data/cloudinary_sizes.json;
+        # con IMG_EAGER se piden como eager (asíncronos) en cada subida
+        self.IMG_WIDTHS = parse_widths(g("IMG_WIDTHS"))
+        self.IMG_EAGER  = _flag(env.get("IMG_EAGER"), "1")
+        self.CLD_FORCE  = _flag(env.get("CLD_FORCE"), "0")          # ignora el manifiesto
+        self.CLD_RESUME = _flag(env.get("CLD_RESUME"), "1")         # retoma desde el journal
+        self.CLD_SKIP_UNCHANGED = _flag(env.get("CLD_SKIP_UNCHANGED"), "1")  # libro idéntico a la última corrida completa -> nada que hacer
+        # incremental: confía en el manifiesto | reconcile: además lista la carpeta remota (Admin API),
+        # re-sube lo que falta o no coincide (etag/bytes) y borra lo que ningún modelo usa |
+        # retry: sólo reintenta las subidas de la cola de fallidas (DLQ_JSONL) |
+        # verify: comprueba que las URLs del mapa respondan (no sube nada)
+        self.CLD_MODE    = g("CLD_MODE", "incremental").lower()
+        self.CLD_DRY_RUN = _flag(env.get("CLD_DRY_RUN"), "0")       # sólo imprime el plan (no sube, borra ni escribe)
+        self.CLD_RECONCILE_MAX_DELETE = float(g("CLD_RECONCILE_MAX_DELETE", "0.5"))  # fracción máx. de la carpeta a borrar (1 = sin tope)
+
+        # Verificación (CLD_MODE=verify)
+        self.VERIFY_SAMPLE      = float(g("VERIFY_SAMPLE", "0"))       # 0 = todas; < 1 fracción; >= 1 cantidad
+        self.VERIFY_CONCURRENCY = int(g("VERIFY_CONCURRENCY", "16"))
+        self.VERIFY_TIMEOUT     = float(g("VERIFY_TIMEOUT", "10"))     # s por request
+        self.VERIFY_SLOW_MS     = int(g("VERIFY_SLOW_MS", "2000"))     # más lento = "slow" (0 = no se mide)
+        self.VERIFY_REUPLOAD_SLOW = _flag(env.get("VERIFY_REUPLOAD_SLOW"), "0")  # también re-subir las lentas
+
+        # Shards (ver image_shards): CLD_SHARDS=N reparte la corrida en N procesos y combina;
+        # CLD_SHARD=i/N es uno de esos procesos (el mismo directorio data/ para todos)
+        self.CLD_SHARDS      = int(g("CLD_SHARDS", "0"))
+        self.CLD_SHARD_SPAWN = _flag(env.get("CLD_SHARD_SPAWN"), "1")   # 0: los shards corren en otros nodos, sólo esperar y combinar
+        self.CLD_SHARD_WAIT  = float(g("CLD_SHARD_WAIT", "21600"))      # s máx. esperando a los shards
+        self.CLD_SHARD_RUN   = g("CLD_SHARD_RUN")                       # id de la corrida del coordinador
+        self.CLD_SHARD = g("CLD_SHARD")
+        self.SHARD = parse_shard(self.CLD_SHARD)                        # (i, N) o None
+        self.env = dict(env)   # entorno de la corrida (con los overrides del trabajo): lo heredan los shards
+
+        # Progreso: text (logs legibles) | json (un objeto JSON por línea, ver Engine.run)
+        self.PROGRESS_FORMAT = g("PROGRESS_FORMAT", "text").lower()
+        self.PROGRESS_EVERY  = float(g("PROGRESS_EVERY", "1"))      # s entre eventos de progreso
+
+        # Medición: reporte por corrida (tiempos/memoria por fase) + perfiles opcionales
+        self.RUN_REPORT  = _flag(env.get("RUN_REPORT"), "1")
+        self.PROFILE_CPU = _flag(env.get("PROFILE_CPU"), "0")       # cProfile (hilo de la corrida + hilos de subida)
+        self.PROFILE_MEM = _flag(env.get("PROFILE_MEM"), "0")       # tracemalloc (pico por fase)
+
+        # Salida informativa
+        self.DATA_DIR      = "data"
+        self.IMG_MAP_JSON  = os.path.join(self.DATA_DIR, "cloudinary_map_full.json")
+        self.IMG_INDEX_JSON = index_path_for(self.IMG_MAP_JSON)   # índice compacto (ver image_map)
+        self.IMG_SIZES_JSON = os.path.join(self.DATA_DIR, "cloudinary_sizes.json")   # ancho -> URL (con IMG_WIDTHS)
+        self.MANIFEST_JSON = os.path.join(self.DATA_DIR, "cloudinary_manifest.json")
+        self.JOURNAL_JSONL = os.path.join(self.DATA_DIR, "upload_journal.jsonl")   # subidas confirmadas de la corrida en curso
+        self.DLQ_JSONL     = os.path.join(self.DATA_DIR, "upload_failed.jsonl")    # subidas fallidas de la última corrida (ver CLD_MODE=retry)
+        self.FAILED_MEDIA_DIR = os.path.join(self.DATA_DIR, "failed_media")        # bytes originales de las fallidas (<hash><ext>)
+        self.EXCEL_CACHE      = os.path.join(self.DATA_DIR, "excel_cache.xlsx")      # última descarga de EXCEL_URL
+        self.EXCEL_CACHE_META = os.path.join(self.DATA_DIR, "excel_cache.json")      # url, etag, last_modified, sha1
+        self.RUN_REPORT_JSON  = os.path.join(self.DATA_DIR, "run_report.json")       # tiempos/memoria de la última corrida
+        self.PROFILE_PSTATS   = os.path.join(self.DATA_DIR, "run_profile.pstats")    # con PROFILE_CPU=1
+        self.VERIFY_REPORT_JSON = os.path.join(self.DATA_DIR, "verify_report.json")  # resultado de CLD_MODE=verify
+        if self.SHARD:
+            # un shard lee manifiesto, mapa y cola de fallidas comunes y escribe sólo en su directorio
+            self.SHARD_DIR = shard_dir(self.DATA_DIR, *self.SHARD)
+            self.JOURNAL_JSONL   = os.path.join(self.SHARD_DIR, "upload_journal.jsonl")
+            self.RUN_REPORT_JSON = os.path.join(self.SHARD_DIR, "run_report.json")
+            self.PROFILE_PSTATS  = os.path.join(self.SHARD_DIR, "run_profile.pstats")
+            self.SHARD_MANIFEST_JSON = os.path.join(self.SHARD_DIR, "cloudinary_manifest.json")
+            self.SHARD_ITEMS_JSON    = os.path.join(self.SHARD_DIR, "gallery.json")       # {modelo: [[url, hash, uploaded_at], …]}
+            self.SHARD_DLQ_JSONL     = os.path.join(self.SHARD_DIR, "upload_failed.jsonl")
+            self.SHARD_RESULT_JSON   = os.path.join(self.SHARD_DIR, "result.json")        # se escribe al terminar bien
+
+    def validate(self):
+        if not (self.EXCEL_PATH or self.EXCEL_URL):
+            raise PipelineStop("❌ ERROR: Proporciona EXCEL_PATH o EXCEL_URL.")
+        if not (self.CLOUD_NAME and self.API_KEY and self.API_SECRET):
+            raise PipelineStop("❌ ERROR: Falta CLOUDINARY_CLOUD_NAME / CLOUDINARY_API_KEY / CLOUDINARY_API_SECRET.")
+        if self.CLD_MODE not in ("incremental", "reconcile", "retry", "verify"):
+            raise PipelineStop("❌ ERROR: CLD_MODE debe ser 'incremental', 'reconcile', 'retry' o 'verify' (no '%s')." % self.CLD_MODE)
+        if self.CLD_SHARD and not self.SHARD:
+            raise PipelineStop("❌ ERROR: CLD_SHARD debe ser 'i/N' con 0 <= i < N (no '%s')." % self.CLD_SHARD)
+        if (self.SHARD or self.CLD_SHARDS > 1) and (self.CLD_MODE != "incremental" or self.CLD_DRY_RUN):
+            # reconcile necesita ver toda la carpeta y retry/dry-run no justifican repartir
+            raise PipelineStop("❌ ERROR: los shards sólo corren en CLD_MODE=incremental y sin CLD_DRY_RUN.")
+
+# ========= Utils =========
+def norm(s): return re.sub(r"\s+", " ", (s or "")).strip().lower()
+
+def parse_shard(value):
+    """'i/N' -> (i, N); None si viene vacío o no es válido."""
+    m = re.match(r"^\s*(\d+)\s*/\s*(\d+)\s*$", value or "")
+    if not m:
+        return None
+    i, n = int(m.group(1)), int(m.group(2))
+    return (i, n) if 0 <= i < n else None
+
+def shard_of(model_val, count):
+    """Shard de un modelo: estable entre corridas y nodos (todas sus imágenes caen en el mismo)."""
+    return int(hashlib.sha1(model_val.encode("utf-8")).hexdigest()[:8], 16) % count
+
+def shard_dir(data_dir, i, count):
+    return os.path.join(data_dir, "shards", "%d-of-%d" % (i, count))
+
+def sanitize_filename(s):
+    s = (s or "").strip()
+    s = re.sub(r"[^\w\-]+", "_", s)
+    s = s.strip("_")
+    return s or "unnamed"
+
+# Galería por modelo: la imagen n (por fila/columna del anchor) es "modelo#n" en el manifiesto
+# y "<modelo>~n" en Cloudinary; la primera conserva el nombre de siempre. sanitize_filename nunca
+# produce '~', así que la imagen 2 de 'AB' (AB~2) no choca con el modelo 'AB_2'.
+def gallery_key(model, n):
+    return model if n == 1 else "%s#%d" % (model, n)
+
+def split_gallery_key(key):
+    """Inversa de gallery_key: 'modelo#3' -> ('modelo', 3); 'modelo' -> ('modelo', 1)."""
+    head, _, n = key.rpartition("#")
+    return (head, int(n)) if head and n.isdigit() else (key, 1)
+
+def gallery_public_id(model, n):
+    pid = sanitize_filename(model)
+    return pid if n == 1 else "%s~%d" % (pid, n)
+
+def fuzzy_find_key(row_dict, aliases):
+    keys = list(row_dict.keys())
+    nmap = {norm(k): k for k in keys}
+    for a in aliases:
+        k = nmap.get(norm(a))
+        if k: return k
+    # contains
+    for k in keys:
+        nk = norm(k)
+        for a in aliases:
+            if norm(a) in nk:
+                return k
+    return None
+
+CHUNK = 1 << 20   # 1 MiB por lectura al hashear/descargar
+
+def content_hash(img_bytes):
+    return hashlib.sha1(img_bytes).hexdigest()
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+def download_excel(cfg, log):
+    """
+    EXCEL_URL -> EXCEL_CACHE en streaming (tmp + rename), hasheando mientras se escribe.
+    Pide con If-None-Match / If-Modified-Since; un 304 reutiliza la copia local.
+    Devuelve (ruta, sha1).
+    """
+    meta = _read_json(cfg.EXCEL_CACHE_META)
+    headers = {"User-Agent": "Mozilla/5.0"}
+    cached = meta.get("url") == cfg.EXCEL_URL and meta.get("sha1") and os.path.exists(cfg.EXCEL_CACHE)
+    if cached:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        r = urlopen(Request(cfg.EXCEL_URL, headers=headers), timeout=cfg.EXCEL_TIMEOUT)
+    except HTTPError as e:
+        if e.code == 304 and cached:
+            log("[init] Excel sin cambios en el origen (304): se usa la copia local")
+            return cfg.EXCEL_CACHE, meta["sha1"]
+        raise
+    h = hashlib.sha1()
+    size = 0
+    tmp = cfg.EXCEL_CACHE + ".tmp"
+    try:
+        with r, open(tmp, "wb") as f:
+            for block in iter(lambda: r.read(CHUNK), b""):
+                f.write(block)
+                h.update(block)
+                size += len(block)
+            f.flush()
+            os.fsync(f.fileno())
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+    except BaseException:
+        # descarga cortada: la copia anterior (si la hay) queda intacta
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp, cfg.EXCEL_CACHE)
+    sha1 = h.hexdigest()
+    write_json_atomic(cfg.EXCEL_CACHE_META, {"url": cfg.EXCEL_URL, "etag": etag, "last_modified": last_modified,
+                                             "sha1": sha1, "size": size}, indent=2)
+    log("[init] Excel descargado: %.1f MB" % (size / 1048576.0))
+    return cfg.EXCEL_CACHE, sha1
+
+def fetch_excel(cfg, log):
+    """(ruta local del .xlsx, sha1 de su contenido)."""
+    if cfg.EXCEL_PATH:
+        return cfg.EXCEL_PATH, file_sha1(cfg.EXCEL_PATH)
+    return download_excel(cfg, log)
+
+MAP_FORMAT = 2   # 2: el mapa guarda la galería completa por modelo ({modelo: [url, …]})
+
+def run_signature(cfg, workbook_sha1):
+    """Todo lo que cambia el resultado de una corrida: libro + hoja/columnas + destino + transcodificación."""
+    parts = [MAP_FORMAT, workbook_sha1, cfg.SHEET_NAME, cfg.HEADER_ROW, cfg.A_MODEL, cfg.CLOUD_NAME, cfg.CLD_FOLDER,
+             cfg.CLD_API_BASE, cfg.IMG_MAX_EDGE, cfg.IMG_MAX_BYTES, cfg.IMG_JPEG_QUALITY, cfg.IMG_WIDTHS,
+             SIZES_VERSION]
+    return content_hash(json.dumps(parts, ensure_ascii=False).encode("utf-8"))
+
+def unchanged_since(cfg, prev_source, signature):
+    """Libro y configuración idénticos a la última corrida completa, sin fallidas ni journal pendientes."""
+    return (cfg.CLD_SKIP_UNCHANGED and not cfg.CLD_FORCE and cfg.CLD_MODE != "reconcile"
+            and prev_source.get("signature") == signature
+            and not prev_source.get("failed") and not prev_source.get("broken") and os.path.exists(cfg.IMG_MAP_JSON)
+            and os.path.exists(cfg.IMG_INDEX_JSON)
+            and not os.path.exists(cfg.JOURNAL_JSONL))
+
+def load_manifest(path):
+    # {"version": 2, "models": {gallery_key: {"hash": sha1, "url": url_optimizada, "public_id": id_que_la_aloja,
+    #                                         "etag": etag_remoto, "bytes": n, "uploaded_at": epoch}},
+    #  (etag/bytes: los de la respuesta de subida; "broken": epoch en que CLD_MODE=verify la halló rota)
+    #  una entrada por imagen: "modelo" (la primera, como en la versión 1) y "modelo#2", "modelo#3"…
+    #  "source": {"sha1": libro, "signature": run_signature, "anchors": n, "failed": n, "broken": n}}
+    data = _read_json(path)
+    models = data.get("models")
+    source = data.get("source")
+    return (models if isinstance(models, dict) else {}), (source if isinstance(source, dict) else {})
+
+def save_manifest(path, models, source=None):
+    data = {"version": 2, "models": models}
+    if source:
+        data["source"] = source
+    write_json_atomic(path, data, indent=2, sort_keys=True)
+
+def load_journal(path):
+    """Entradas {modelo, hash, url, public_id, etag, bytes, uploaded_at} de una corrida interrumpida (la última gana)."""
+    out = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue   # última línea truncada por el corte
+                if e.get("model") and e.get("hash") and e.get("url"):
+                    out[e["model"]] = dict((k, v) for k, v in e.items() if k != "model")
+    except OSError:
+        pass
+    return out
+
+def load_dead_letters(path):
+    """Cola de fallidas: [{key, model, n, public_id, hash, media, workbook, error, error_class, kind,
+    status, attempts, first_failed_at, failed_at, cached}, …] (una por imagen, la última gana)."""
+    out = OrderedDict()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(e, dict) and e.get("key") and e.get("hash") and e.get("media"):
+                    out[e["key"]] = e
+    except OSError:
+        pass
+    return list(out.values())
+
+def save_dead_letters(path, entries):
+    """Reescribe la cola de fallidas de forma atómica (sin fallidas, la borra)."""
+    if not entries:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False, sort_keys=True) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def cache_failed_media(media_dir, h, media_path, read):
+    """Guarda (una vez por contenido) los bytes originales de una fallida; devuelve la ruta."""
+    path = os.path.join(media_dir, h + os.path.splitext(media_path)[1].lower())
+    if not os.path.exists(path):
+        os.makedirs(media_dir, exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(read())
+        os.replace(tmp, path)
+    return path
+
+def prune_failed_media(media_dir, keep):
+    """Borra del caché de fallidas lo que ya ninguna entrada de la cola referencia."""
+    keep = set(os.path.abspath(p) for p in keep if p)
+    try:
+        names = os.listdir(media_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(media_dir, name)
+        if os.path.abspath(path) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    if not keep:
+        try:
+            os.rmdir(media_dir)
+        except OSError:
+            pass
+
+class _DeadLetterMedia:
+    """Lo que _Run usa como ZIP en CLD_MODE=retry: media desde el caché de fallidas o, si no, del libro."""
+
+    def __init__(self, cached, z=None):
+        self.cached = cached   # media_path -> archivo en FAILED_MEDIA_DIR
+        self.z = z
+
+    def read(self, media_path):
+        path = self.cached.get(media_path)
+        if path:
+            with open(path, "rb") as f:
+                return f.read()
+        return self.z.read(media_path)
+
+    def close(self):
+        if self.z is not None:
+            self.z.close()
+
+def manifest_gallery(manifest, models):
+    """{modelo: [(url, hash, uploaded_at), …]} de `models` armada desde el manifiesto (orden 1, 2, 3…)."""
+    slots = {}
+    for key, e in manifest.items():
+        head, _, n = key.rpartition("#")
+        if head in models and n.isdigit():
+            slot = (head, int(n))
+        elif key in models:
+            slot = (key, 1)
+        else:
+            continue
+        if e.get("url"):
+            slots.setdefault(slot[0], []).append((slot[1], e))
+    out = {}
+    for model_val, entries in slots.items():
+        gallery = out[model_val] = []
+        for _n, e in sorted(entries, key=lambda t: t[0]):
+            if e["url"] not in [u for u, _, _ in gallery]:
+                gallery.append((e["url"], e.get("hash"), e.get("uploaded_at")))
+    return out
+
+# ========= Libro: hojas + drawings -> anchors ligados a modelo =========
+def select_sheets(z, sheet_name, log):
+    """
+    [(nombre, parte)] de las hojas pedidas, en el orden del libro (resueltas vía workbook.xml + rels).
+    SHEET_NAME: un nombre, varios separados por coma, o '*' para todas.
+    """
+    sheets = list_sheets(z)
+    if not sheets:
+        raise PipelineStop("❌ ERROR: El libro no tiene hojas.")
+    if sheet_name.strip() == "*":
+        return sheets
+    wanted = [n.strip() for n in sheet_name.split(",") if n.strip()]
+    picked = [(n, part) for n, part in sheets if n in wanted]
+    missing = [n for n in wanted if n not in dict(sheets)]
+    if not picked:
+        log("⚠️  Hoja '%s' no existe, usando la primera: %s" % (sheet_name, sheets[0][0]))
+        return sheets[:1]
+    if missing:
+        log("⚠️  Hojas que no existen (se omiten): %s" % ", ".join(missing))
+    return picked
+
+def parse_sheet(z, sheet_title, sheet_part, cfg, log, mark=None):
+    """
+    Anchors de UNA hoja ya ligados a su modelo: {"sheet", "drawings", "anchors": [{row0, col0, media,
+    model}], "sheet_s", "drawing_s"}. Recorre todos los drawings de la hoja (no sólo el primero).
+    Sólo lee el ZIP, así que varias hojas pueden parsearse a la vez (hilos o procesos, ver parse_workbook).
+    mark(nombre), si viene, abre la fase drawing al pasar de la hoja a sus drawings.
+    """
+    t0 = time.time()
+
+    def pick_model_key(hdrs):
+        return fuzzy_find_key(dict.fromkeys(hdrs), cfg.A_MODEL)
+
+    # Un solo recorrido de la hoja: encabezados + columna del modelo ({fila: modelo})
+    headers, model_key, models, max_row = stream_model_column(z, sheet_part, cfg.HEADER_ROW, pick_model_key)
+    if not model_key:
+        log("Headers (%s): %s" % (sheet_title, headers))
+        raise PipelineStop("❌ ERROR: No pude detectar la columna del modelo en '%s'. Aliases: %s" % (sheet_title, cfg.A_MODEL))
+
+    # fila -> modelo en O(1) (incluye la búsqueda de hasta 3 filas hacia abajo)
+    model_index = ModelIndex(models, cfg.HEADER_ROW, max_row)
+    del models
+
+    t1 = time.time()
+    if mark:
+        mark("drawing")
+    drawings = [tgt for _, typ, tgt in read_rels(z, sheet_part) if typ.endswith("/drawing")]
+    anchors = []
+    for drawing_path in drawings:
+        try:
+            drawing_xml = ET.fromstring(z.read(drawing_path))
+        except KeyError:
+            raise PipelineStop("❌ No encontré el drawing en el ZIP: %s" % drawing_path)
+        rels_map = dict((rid, tgt) for rid, _, tgt in read_rels(z, drawing_path))
+        for tag in ("twoCellAnchor", "oneCellAnchor"):
+            for anc in drawing_xml.findall("xdr:%s" % tag, NS):
+                blip = anc.find(".//a:blip", NS)
+                if blip is None:
+                    continue
+                rId = blip.attrib.get("{%s}embed" % NS["r"])
+                media = rels_map.get(rId)
+                if not media:
+                    continue
+                frm = anc.find("xdr:from", NS)
+                if frm is None:
+                    continue
+                row_el = frm.find("xdr:row", NS)
+                col_el = frm.find("xdr:col", NS)
+                if row_el is None or col_el is None:
+                    continue
+                row0 = int(row_el.text or "0")
+                col0 = int(col_el.text or "0")
+                model_val, _ = model_index.lookup(row0 + 1)
+                anchors.append({"row0": row0, "col0": col0, "media": media, "model": model_val})
+    # Orden de galería determinista: fila y luego columna del anchor (no el orden del drawing)
+    anchors.sort(key=lambda a: (a["row0"], a["col0"]))
+    return {"sheet": sheet_title, "drawings": len(drawings), "anchors": anchors,
+            "sheet_s": t1 - t0, "drawing_s": time.time() - t1}
+
+def parse_sheet_file(xlsx_path, sheet_title, sheet_part, cfg):
+    """parse_sheet en un proceso/hilo aparte: abre su propio handle del ZIP y devuelve los logs."""
+    logs = []
+    with zipfile.ZipFile(xlsx_path, "r") as z:
+        res = parse_sheet(z, sheet_title, sheet_part, cfg, logs.append)
+    res["logs"] = logs
+    return res
+
+def parse_workbook(z, zidx, cfg, log, mark=None, pool=None, add=None):
+    """
+    {"sheet", "sheets", "anchors", "bound": [(modelo, n, media_path)]} de las hojas configuradas;
+    n = posición de la imagen en la galería del modelo (1, 2, …): hoja, luego fila/columna del anchor.
+    Todo lo que depende sólo del .xlsx (y por eso se puede cachear entre trabajos).
+    Con varias hojas, cada una se parsea en paralelo en `pool` (el de transcodificación, que aún
+    está ocioso) o, si no hay, en hilos; todas alimentan la misma lista y la misma subida.
+    mark(nombre), si viene, separa las fases sheet / drawing / bind (ver run_profile); con varias
+    hojas en paralelo la fase sheet cubre hojas y drawings, y add(nombre, s) suma el tiempo de
+    cada parte entre hojas (busy_s.sheet / busy_s.drawing).
+    """
+    mark = mark or (lambda name: None)
+    add = add or (lambda name, s: None)
+    mark("sheet")
+    selected = select_sheets(z, cfg.SHEET_NAME, log)
+    multi = len(selected) > 1
+    if not multi:
+        parsed = [parse_sheet(z, selected[0][0], selected[0][1], cfg, log, mark)]
+    else:
+        own = None
+        if pool is None:
+            own = pool = ThreadPoolExecutor(max_workers=min(len(selected), os.cpu_count() or 2))
+        try:
+            futures = [pool.submit(parse_sheet_file, z.filename, name, part, cfg) for name, part in selected]
+            parsed = []
+            for (name, _), fut in zip(selected, futures):
+                try:
+                    res = fut.result()
+                except PipelineStop as e:
+                    # con varias hojas, una sin columna de modelo (notas, índice…) no frena a las demás
+                    log("⚠️  Hoja '%s' omitida: %s" % (name, e))
+                    continue
+                for line in res.pop("logs"):
+                    log(line)
+                parsed.append(res)
+        finally:
+            if own is not None:
+                own.shutdown()
+        log("[ok] Hojas: %s" % ", ".join("%s (%d)" % (p["sheet"], len(p["anchors"])) for p in parsed))
+
+    for p in parsed:
+        add("sheet", p.pop("sheet_s"))
+        add("drawing", p.pop("drawing_s"))
+
+    mark("bind")
+    anchors, bound, slots = [], [], {}
+    for p in parsed:
+        for a in p["anchors"]:
+            a["sheet"] = p["sheet"]
+            anchors.append(a)
+            if not a["model"]:
+                continue
+            # ruta del rel o, si no está, fallback por número de imagen
+            media_path = zidx.resolve_media(a["media"])
+            if not media_path:
+                log("⚠️  Media no encontrada en ZIP: %s" % a["media"])
+                continue
+            slots[a["model"]] = slots.get(a["model"], 0) + 1
+            bound.append((a["model"], slots[a["model"]], media_path))
+
+    sheet_names = [p["sheet"] for p in parsed]
+    reason = None
+    if not any(p["drawings"] for p in parsed):
+        reason = "ℹ️ La hoja no tiene imágenes incrustadas." if not multi else "ℹ️ Las hojas no tienen imágenes incrustadas."
+    elif not anchors:
+        reason = "ℹ️ No se detectaron anchors de imágenes."
+    return {"sheet": ", ".join(sheet_names), "sheets": sheet_names, "anchors": anchors, "bound": bound, "reason": reason}
+
+def timed_transcode(*args):
+    """transcode() en el proceso hijo + los segundos que tomó (para busy_s.transcode_cpu)."""
+    t0 = time.process_time()
+    data = transcode(*args)
+    return data, time.process_time() - t0
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+# ========= Una corrida =========
+class _Run:
+    """Estado mutable de una corrida (lo comparten el productor y los hilos de subida)."""
+
+    def __init__(self, cfg, log, cancel, upload_once, tpool, book, emit=None, timer=None):
+        self.cfg = cfg
+        self.log = log
+        self.emit = emit
+        self.timer = timer or PhaseTimer()
+        self.cancel = cancel
+        self.upload_once = upload_once
+        self.tpool = tpool
+        self.book = book
+        self.n_anchors = len(book["anchors"])
+
+        self.key_to_url = {}     # gallery_key -> url (una entrada por imagen; ver gallery())
+        self.new_manifest = {}
+        self.queued = self.skipped = self.aliased = self.uploaded = self.failed = 0
+        self.lock = threading.Lock()
+        self.work_q = queue.Queue(maxsize=max(1, cfg.CLD_QUEUE_SIZE))
+
+        # ---- Deduplicación por contenido ----
+        # Cada contenido distinto se sube una sola vez (al public_id del primer modelo que lo usa);
+        # los demás modelos con los mismos bytes apuntan a esa misma URL ("public_id" en el manifiesto).
+        self.media_hash = book["media_hash"]   # media_path -> hash (cacheado con el libro)
+        self.groups   = {}   # hash -> {"public_id", "models", "entry"} subidas de esta corrida
+        self.planned  = {}   # public_id -> hash que se le sube en esta corrida
+        self.borrowed = []   # (clave, public_id_propio, public_id_ajeno, hash, media_path) URLs tomadas de otro public_id
+        self.known    = {}   # hash -> entrada del manifiesto anterior (public_id, url, etag, bytes)
+        self.clashed  = set()   # public_ids del manifiesto anterior con más de un contenido (ver produce)
+        self.fallback = {}   # gallery_key -> entrada anterior: lo que queda en el mapa si su subida falla
+        self.kept = 0        # imágenes fallidas que conservaron su URL anterior
+        self.failed_models = set()
+        self.key_info = {}   # gallery_key -> (modelo, n)
+
+        # ---- Cola de fallidas (DLQ_JSONL) ----
+        self.dead = []       # entradas de esta corrida (ver load_dead_letters)
+        self.dead_prev = {}  # gallery_key -> entrada de la cola anterior (para acumular intentos)
+        self.workbook_sha1 = None
+
+        # ---- Reconciliación (CLD_MODE=reconcile) ----
+        self.remote = None   # public_id (sin carpeta) -> {"etag", "bytes", ...} según el listado de la carpeta
+        self.plan = []       # (modelo, public_id, motivo) de cada subida decidida (lo que imprime CLD_DRY_RUN)
+        self.reasons = {}    # motivo -> subidas
+
+        # ---- Shards (CLD_SHARD) ----
+        # public_id de un modelo de otro shard: ese shard puede re-subirle otro contenido en
+        # paralelo sin que este se entere, así que no se toma prestado (se sube al propio)
+        self.foreign = lambda public_id: False
+
+        self.limiter = AdaptiveLimiter(cfg.CLD_CONCURRENCY, cfg.CLD_MIN_CONCURRENCY, cfg.CLD_MAX_CONCURRENCY,
+                                       bucket=TokenBucket(cfg.CLD_RATE_LIMIT) if cfg.CLD_RATE_LIMIT > 0 else None,
+                                       on_change=self.on_limit_change)
+        self.next_hb = time.time() + 10
+        self.next_ev = 0.0
+        self.bytes_sent = 0
+        self.scanned = 0                      # anchors ligados ya revisados por el productor
+        self.latencies = deque(maxlen=1024)   # s por subida exitosa (ventana para p50/p95)
+        self.t_upload = time.time()
+        self.journal = None
+        self.z = None
+
+    def on_limit_change(self, before, after, reason):
+        self.log("[cc] concurrencia %d → %d (%s)" % (before, after, reason))
+
+    def set_url(self, key, entry):
+        """entry: {"hash", "url", "public_id", "etag", "bytes", "uploaded_at"} (formato del manifiesto)."""
+        self.key_to_url[key] = entry["url"]
+        self.new_manifest[key] = entry
+
+    def journal_append(self, key, entry):
+        # se llama con `lock` tomado
+        self.journal.write(json.dumps(dict(entry, model=key), ensure_ascii=False) + "\n")
+        self.journal.flush()
+
+    def keep_previous(self, key):
+        """Subida fallida: la imagen conserva su URL anterior (si tenía) en vez de salir del mapa."""
+        # se llama con `lock` tomado; el hash viejo hace que la próxima corrida la vuelva a intentar
+        self.failed_models.add(self.key_info.get(key, (key, 1))[0])
+        old = self.fallback.get(key)
+        if old and old.get("url") and key not in self.new_manifest:
+            self.set_url(key, old)
+            self.kept += 1
+
+    def dead_letter(self, g, h, err, keys):
+        """Anota en la cola de fallidas las imágenes `keys` del grupo `g` (contenido `h`)."""
+        cached = None
+        try:
+            # bytes ORIGINALES (antes de transcodificar): el reintento no necesita el libro
+            cached = cache_failed_media(self.cfg.FAILED_MEDIA_DIR, h, g["media"], lambda: self.z.read(g["media"]))
+        except Exception as e:
+            self.log("⚠️  No se pudo cachear %s: %s" % (g["media"], e))
+        now = int(time.time())
+        with self.lock:
+            for key in keys:
+                model_val, n = self.key_info.get(key, (key, 1))
+                prev = self.dead_prev.get(key) or {}
+                same = prev.get("hash") == h
+                self.dead.append({
+                    "key": key, "model": model_val, "n": n, "public_id": g["public_id"], "hash": h,
+                    "media": g["media"], "workbook": self.workbook_sha1, "error": str(err)[:500],
+                    "error_class": type(err).__name__, "kind": classify_error(err),
+                    "status": getattr(err, "status", None),
+                    "attempts": getattr(err, "attempts", 0) + (prev.get("attempts", 0) if same else 0),
+                    "first_failed_at": prev.get("first_failed_at", now) if same else now,
+                    "failed_at": now, "cached": cached,
+                })
+
+    def gallery(self):
+        """{modelo: [(url, hash, uploaded_at), …]} en orden de galería (fila/columna); sin repetidas."""
+        out = {}
+        for model_val, n, _media in self.book["bound"]:
+            e = self.new_manifest.get(gallery_key(model_val, n))
+            entries = out.setdefault(model_val, [])
+            if e and e["url"] not in [u for u, _, _ in entries]:
+                entries.append((e["url"], e.get("hash"), e.get("uploaded_at")))
+        return dict((m, entries) for m, entries in out.items() if entries)
+
+    def remote_check(self, public_id, entry):
+        """None si la copia remota sirve (o no se listó la carpeta); si no, el motivo para re-subir."""
+        if self.remote is None:
+            return None
+        r = self.remote.get(public_id)
+        if r is None:
+            return "missing"
+        # el etag de Cloudinary es el de los bytes subidos (ya transcodificados): se compara con el guardado
+        if entry.get("etag") and r.get("etag"):
+            return None if entry["etag"] == r["etag"] else "etag"
+        if entry.get("bytes") and r.get("bytes"):
+            return None if entry["bytes"] == r["bytes"] else "bytes"
+        return None
+
+    def orphans(self):
+        """public_ids de la carpeta que ningún modelo vigente usa ni se (re)suben en esta corrida."""
+        if self.remote is None:
+            return []
+        used = set(e["public_id"] for e in self.new_manifest.values())
+        used.update(self.planned)
+        # sólo ids "planos" (como los genera sanitize_filename): subcarpetas no son de este script
+        return sorted(pid for pid in self.remote if pid not in used and "/" not in pid)
+
+    def upload_with_retry(self, img_bytes, public_id):
+        # Los 420/429 no gastan los intentos normales (hasta 3x CLD_MAX_RETRIES en total)
+        cfg = self.cfg
+        attempt = 0
+        throttled = 0
+        while True:
+            attempt += 1
+            t_wait = time.time()
+            self.limiter.acquire()
+            t0 = time.time()
+            self.timer.add("limiter_wait", t0 - t_wait)
+            try:
+                res = self.upload_once(img_bytes, public_id)
+            except Exception as e:
+                kind = classify_error(e)
+                self.timer.add("upload", time.time() - t0)
+                self.limiter.release(kind, time.time() - t0, getattr(e, "retry_after", None))
+                if kind == RATE_LIMIT:
+                    throttled += 1
+                if kind == PERMANENT or attempt - throttled >= cfg.CLD_MAX_RETRIES or attempt >= 3 * cfg.CLD_MAX_RETRIES:
+                    e.attempts = attempt   # va a la cola de fallidas
+                    raise
+                delay = backoff_delay(attempt, retry_after=getattr(e, "retry_after", None))
+                self.timer.add("backoff", delay)
+                time.sleep(delay)
+                continue
+            latency = time.time() - t0
+            self.timer.add("upload", latency)
+            self.limiter.release(OK, latency)
+            self.latencies.append(latency)
+            return res
+
+    def worker(self):
+        prof = self.timer.profiler()
+        try:
+            self._work()
+        finally:
+            if prof is not None:
+                prof.disable()
+
+    def _work(self):
+        while True:
+            job = self.work_q.get()
+            if job is None:
+                return
+            if self.cancel.is_set():
+                continue   # drenar sin subir: lo ya anotado en el journal se conserva
+            idx, payload, h = job
+            g = self.groups[h]
+            public_id = g["public_id"]
+            self.log("[prog] %d/%d → %s" % (idx, self.n_anchors, public_id))
+            try:
+                if hasattr(payload, "result"):
+                    t0 = time.time()
+                    img_bytes, cpu_s = payload.result()
+                    self.timer.add("transcode_wait", time.time() - t0)
+                    self.timer.add("transcode_cpu", cpu_s)
+                else:
+                    img_bytes = payload
+                res = self.upload_with_retry(img_bytes, public_id)
+                secure = res.get("secure_url", "")
+                optimized = secure.replace("/upload/", "/upload/f_auto,q_auto/")
+                entry = {"hash": h, "url": optimized, "public_id": public_id, "etag": res.get("etag"),
+                         "bytes": res.get("bytes"), "uploaded_at": int(time.time())}
+                with self.lock:
+                    self.uploaded += 1
+                    self.bytes_sent += len(img_bytes)
+                    g["entry"] = entry
+                    for m in g["models"]:
+                        self.set_url(m, entry)
+                        self.journal_append(m, entry)
+                self.log("[ok] %s → %s" % (", ".join(g["models"]), optimized))
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                    g["failed"] = e
+                    keys = list(g["models"])
+                    for m in keys:
+                        self.keep_previous(m)
+                self.log("[err] %s: %s (%s)" % (", ".join(keys), e, classify_error(e)))
+                self.dead_letter(g, h, e, keys)
+            self.progress()
+
+    def enqueue(self, key, h, media_path, public_id, img_bytes=None, reason="new"):
+        """Sube (o se une a la subida de) el contenido `h` para la imagen `key` (ver gallery_key)."""
+        cfg = self.cfg
+        with self.lock:
+            g = self.groups.get(h)
+            if g is None:
+                # cada contenido se sube una sola vez, a un public_id que sólo él ocupa en esta corrida
+                self.groups[h] = {"public_id": public_id, "models": [key], "entry": None, "failed": None, "media": media_path}
+                self.planned[public_id] = h
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+                if cfg.CLD_DRY_RUN:
+                    self.plan.append((key, public_id, reason))
+                    return
+            else:
+                g["models"].append(key)
+                self.aliased += 1
+                if g["entry"]:
+                    self.set_url(key, g["entry"])
+                    self.journal_append(key, g["entry"])
+                elif g["failed"]:
+                    self.keep_previous(key)
+        if g is not None:
+            if g["failed"] and not g["entry"]:
+                # se une a un contenido cuya subida ya falló: también va a la cola de fallidas
+                self.dead_letter(g, h, g["failed"], [key])
+            return
+        if img_bytes is None:
+            t0 = time.time()
+            img_bytes = self.z.read(media_path)
+            self.timer.add("read_media", time.time() - t0)
+        # Conversión/reducción en el pool de procesos; el hilo de subida espera el resultado
+        payload = img_bytes
+        if self.tpool is not None and needs_transcode(img_bytes, media_path, cfg.IMG_MAX_EDGE, cfg.IMG_MAX_BYTES):
+            payload = self.tpool.submit(timed_transcode, img_bytes, media_path, cfg.IMG_MAX_EDGE, cfg.IMG_MAX_BYTES, cfg.IMG_JPEG_QUALITY)
+        self.queued += 1
+        t0 = time.time()
+        self.work_q.put((self.queued, payload, h))   # bloquea si la cola está llena
+        self.timer.add("queue_full", time.time() - t0)
+
+    # Heartbeat para que el front vea vida si tarda
+    def heartbeat(self):
+        now = time.time()
+        if now >= self.next_hb:
+            self.log("[hb] trabajando… %d/%d completados" % (self.uploaded + self.failed, self.queued))
+            self.next_hb = now + 10
+        self.progress()
+
+    def stats(self):
+        """Contadores + ritmo de la subida (lo que viaja en los eventos 'progress' y en el resumen)."""
+        with self.lock:
+            done = self.uploaded + self.failed
+            out = {"total": len(self.book["bound"]), "scanned": self.scanned, "queued": self.queued,
+                   "uploaded": self.uploaded, "failed": self.failed, "skipped": self.skipped,
+                   "aliased": self.aliased, "bytes_sent": self.bytes_sent}
+            lat = sorted(self.latencies)
+        elapsed = max(1e-6, time.time() - self.t_upload)
+        rate = done / elapsed
+        # lo que falta: cola + lo que el productor aún no revisa (a la misma proporción de subidas)
+        pending = out["total"] - self.scanned
+        future = pending * (float(self.queued) / self.scanned if self.scanned else 1.0)
+        remaining = max(0.0, self.queued - done + future)
+        p50, p95 = percentile(lat, 0.50), percentile(lat, 0.95)
+        out.update({
+            "elapsed_s": round(elapsed, 3),
+            "images_per_s": round(rate, 2),
+            "mbytes_per_s": round(self.bytes_sent / elapsed / 1048576.0, 3),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "eta_s": round(remaining / rate, 1) if rate > 0 else None,
+            "concurrency": int(self.limiter.limit),
+        })
+        return out
+
+    def progress(self, force=False):
+        if self.emit is None:
+            return
+        now = time.time()
+        with self.lock:
+            if not force and now < self.next_ev:
+                return
+            self.next_ev = now + self.cfg.PROGRESS_EVERY
+        ev = {"event": "progress", "phase": "upload"}
+        ev.update(self.stats())
+        self.emit(ev)
+
+    def produce(self, manifest):
+        hashes = {}
+        for _m, _e in manifest.items():
+            if _e.get("hash") and _e.get("url"):
+                hashes.setdefault(_e.get("public_id") or sanitize_filename(_m), set()).add(_e["hash"])
+        # un public_id con contenidos distintos (galerías con el nombre viejo '<modelo>_n'): no se sabe
+        # cuál quedó en Cloudinary, así que cada modelo vuelve a subir lo suyo con su propio id
+        self.clashed = set(pid for pid, hs in hashes.items() if len(hs) > 1)
+        for _m, _e in manifest.items():
+            if _e.get("hash") and _e.get("url"):
+                _pid = _e.get("public_id") or sanitize_filename(_m)
+                if (self.remote_check(_pid, _e) is None and not self.foreign(_pid) and not _e.get("broken")
+                        and _pid not in self.clashed):
+                    self.known.setdefault(_e["hash"], dict(_e, public_id=_pid))
+
+        for model_val, n, media_path in self.book["bound"]:
+            self.heartbeat()
+            if self.cancel.is_set():
+                return
+            self.scanned += 1
+
+            # El hash se calcula sobre los bytes originales del .xlsx (antes de convertir)
+            img_bytes = None
+            h = self.media_hash.get(media_path)
+            if h is None:
+                t0 = time.time()
+                img_bytes = self.z.read(media_path)
+                h = self.media_hash[media_path] = content_hash(img_bytes)
+                self.timer.add("read_media", time.time() - t0)
+
+            key = gallery_key(model_val, n)
+            self.key_info[key] = (model_val, n)
+            own_id = gallery_public_id(model_val, n)
+            prev = manifest.get(key) or {}
+            reason = "force" if self.cfg.CLD_FORCE else ("broken" if prev.get("broken") else ("changed" if prev else "new"))
+            if prev.get("hash") == h and prev.get("url") and not prev.get("broken"):
+                pid = prev.get("public_id") or own_id
+                reason = (("clash" if pid in self.clashed else None) or self.remote_check(pid, prev)
+                          or ("shard" if self.foreign(pid) else None))
+                if reason is None:
+                    with self.lock:
+                        self.set_url(key, dict(prev, public_id=pid))
+                    if pid != own_id:
+                        self.borrowed.append((key, own_id, pid, h, media_path))
+                    self.skipped += 1
+                    continue
+
+            if h not in self.groups and h in self.known and self.planned.get(self.known[h]["public_id"], h) == h:
+                # mismo contenido ya publicado en otra corrida bajo otro public_id
+                k = self.known[h]
+                with self.lock:
+                    self.set_url(key, k)
+                self.borrowed.append((key, own_id, k["public_id"], h, media_path))
+                self.aliased += 1
+                continue
+
+            self.enqueue(key, h, media_path, own_id, img_bytes, reason)
+            img_bytes = None
+
+        # Si un public_id prestado recibe otro contenido en esta corrida, el modelo que lo
+        # tomaba prestado pierde su imagen: se sube el suyo (o se une a un grupo de esta corrida).
+        for key, own_id, pid, h, media_path in self.borrowed:
+            if self.planned.get(pid, h) != h:
+                self.log("[dup] %s: %s cambió de contenido, se sube por separado" % (key, pid))
+                self.enqueue(key, h, media_path, own_id, reason="dup")
+
+class _SdkAdmin:
+    """Listado/borrado con el SDK oficial (CLD_ENGINE=sdk), misma interfaz que CloudinaryUploader."""
+
+    def __init__(self):
+        import cloudinary.api
+        self.api = cloudinary.api
+
+    def list_resources(self, prefix, resource_type="image", type="upload", max_results=500):
+        cursor = None
+        while True:
+            kw = {"resource_type": resource_type, "type": type, "prefix": prefix, "max_results": max_results}
+            if cursor:
+                kw["next_cursor"] = cursor
+            res = self.api.resources(**kw)
+            for r in res.get("resources") or []:
+                yield r
+            cursor = res.get("next_cursor")
+            if not cursor:
+                return
+
+    def delete_resources(self, public_ids, resource_type="image", type="upload"):
+        out = {}
+        ids = list(public_ids)
+        for i in range(0, len(ids), 100):
+            res = self.api.delete_resources(ids[i:i + 100], resource_type=resource_type, type=type)
+            out.update(res.get("deleted") or {})
+        return out
+
+class Engine:
+    """Recursos calientes entre trabajos. Crear ANTES de arrancar otros hilos (ver _start_tpool)."""
+
+    BOOK_CACHE_SIZE = 2
+
+    def __init__(self, cfg=None, log=None):
+        cfg = cfg or Config()
+        # el coordinador de shards no transcodifica: eso lo hace cada shard en su proceso
+        self.tpool = None if cfg.CLD_SHARDS > 1 else self._start_tpool(cfg.IMG_WORKERS, log)
+        self._uploaders = {}
+        self._books = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _start_tpool(workers, log=None):
+        # Pool de transcodificación (CPU): con 'fork' los procesos hijos se crean de una vez
+        # en el primer submit; se hace aquí, antes que cualquier hilo, para no heredar hilos a medias.
+        if not (PIL_OK and workers > 0):
+            return None
+        if "fork" not in multiprocessing.get_all_start_methods():
+            if log:
+                log("⚠️  Sin 'fork' disponible: transcodificación desactivada")
+            return None
+        tpool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        tpool.submit(int).result()
+        return tpool
+
+    def close(self):
+        if self.tpool is not None:
+            self.tpool.shutdown()
+        for up in self._uploaders.values():
+            if hasattr(up, "close"):
+                up.close()
+
+    @staticmethod
+    def _sdk(cfg):
+        import cloudinary
+        cloudinary.config(cloud_name=cfg.CLOUD_NAME, api_key=cfg.API_KEY, api_secret=cfg.API_SECRET,
+                          secure=True, timeout=cfg.CLD_TIMEOUT)
+        return cloudinary
+
+    def _uploader(self, cfg):
+        # Un pool de conexiones keep-alive por backend/credenciales, reutilizado entre trabajos
+        key = (cfg.CLD_API_BASE, cfg.CLOUD_NAME, cfg.API_KEY, cfg.API_SECRET, cfg.CLD_TIMEOUT)
+        with self._lock:
+            uploader = self._uploaders.get(key)
+            if uploader is None:
+                uploader = self._uploaders[key] = CloudinaryUploader(
+                    cfg.CLOUD_NAME, cfg.API_KEY, cfg.API_SECRET, api_base=cfg.CLD_API_BASE,
+                    pool_size=cfg.CLD_MAX_CONCURRENCY, timeout=cfg.CLD_TIMEOUT)
+        return uploader
+
+    def _admin(self, cfg):
+        """Objeto con list_resources(prefix) / delete_resources(ids) (Admin API) según CLD_ENGINE."""
+        if cfg.CLD_ENGINE == "sdk":
+            self._sdk(cfg)
+            return _SdkAdmin()
+        return self._uploader(cfg)
+
+    def _upload_fn(self, cfg):
+        # derivados generados por Cloudinary al subir, sin esperar (la primera visita ya los encuentra)
+        eager = {"eager": eager_transformations(cfg.IMG_WIDTHS), "eager_async": True} if cfg.IMG_WIDTHS and cfg.IMG_EAGER else {}
+        if cfg.CLD_ENGINE == "sdk":
+            cloudinary = self._sdk(cfg)
+            import cloudinary.uploader
+
+            def upload_once(img_bytes, public_id):
+                return cloudinary.uploader.upload(
+                    img_bytes,
+                    folder=cfg.CLD_FOLDER,
+                    public_id=public_id,
+                    overwrite=True,           # sólo llegan aquí imágenes nuevas o modificadas
+                    unique_filename=False,
+                    resource_type="image",
+                    timeout=cfg.CLD_TIMEOUT,
+                    **eager
+                )
+            return upload_once
+
+        uploader = self._uploader(cfg)
+
+        def upload_once(img_bytes, public_id):
+            return uploader.upload(img_bytes, public_id, folder=cfg.CLD_FOLDER, overwrite=True, unique_filename=False, **eager)
+        return upload_once
+
+    def _book(self, z, zidx, workbook_sha1, cfg, log, mark=None, add=None):
+        key = (workbook_sha1, cfg.SHEET_NAME, cfg.HEADER_ROW, tuple(cfg.A_MODEL))
+        with self._lock:
+            book = self._books.get(key)
+            if book is not None:
+                self._books.move_to_end(key)
+                log("[cache] Libro sin cambios desde el trabajo anterior: se reutiliza el parseo")
+                return book
+        book = parse_workbook(z, zidx, cfg, log, mark, pool=self.tpool, add=add)
+        book["media_hash"] = {}
+        with self._lock:
+            self._books[key] = book
+            while len(self._books) > self.BOOK_CACHE_SIZE:
+                self._books.popitem(last=False)
+        return book
+
+    def run(self, cfg, log, cancel=None, emit=None):
+        """
+        Una corrida completa. Devuelve el resumen; lanza PipelineStop en los cortes anticipados.
+        emit(dict), si viene: {"event": "phase", "phase": download|parse|list|upload|delete|finalize|skip} y
+        {"event": "progress", ...Run.stats()} cada PROGRESS_EVERY s durante la subida.
+        Con RUN_REPORT, deja en RUN_REPORT_JSON tiempos y memoria por fase (también si falla).
+        Con CLD_SHARDS > 1 la corrida la reparte image_shards.run_sharded (mismo resumen); el
+        reporte es el del coordinador más las fases de los shards sumadas y sus reportes.
+        """
+        cfg.validate()
+        os.makedirs(cfg.SHARD_DIR if cfg.SHARD else cfg.DATA_DIR, exist_ok=True)
+        timer = PhaseTimer(cpu=cfg.PROFILE_CPU, mem=cfg.PROFILE_MEM)
+        status, message, summary = "error", None, None
+        extra = {}   # lo que agrega el coordinador de shards al reporte
+        try:
+            if cfg.CLD_SHARDS > 1:
+                from image_shards import run_sharded   # image_shards importa este módulo
+                summary = run_sharded(cfg, log, cancel, phase=timer.phase, report=extra)
+            else:
+                summary = self._run(cfg, log, cancel or threading.Event(), emit, timer)
+            status = "skip" if summary.get("unchanged") else "ok"
+            return summary
+        except PipelineStop as e:
+            status, message = ("cancel" if e.code == 130 else "stop"), str(e)
+            raise
+        except Exception as e:
+            message = "%s: %s" % (type(e).__name__, e)
+            raise
+        finally:
+            report = timer.finish(cfg.PROFILE_PSTATS if cfg.PROFILE_CPU else None)
+            if cfg.RUN_REPORT:
+                report.update(extra)
+                report.update({"status": status, "message": message, "summary": summary})
+                try:
+                    write_json_atomic(cfg.RUN_REPORT_JSON, report, indent=2)
+                    log("[report] Tiempos por fase: %s (%s)" % (cfg.RUN_REPORT_JSON, ", ".join(
+                        "%s %.2fs" % (p["name"], p["wall_s"]) for p in report["phases"])))
+                except OSError as e:
+                    log("⚠️  No se pudo escribir el reporte: %s" % e)
+
+    def _run(self, cfg, log, cancel, emit, timer):
+        start_total = time.time()
+
+        def phase(name):
+            timer.phase(name)
+            if emit:
+                emit({"event": "phase", "phase": name, "t": round(time.time() - start_total, 3)})
+
+        if cfg.CLD_MODE == "verify":
+            return self._verify(cfg, log, emit, phase, start_total)
+        retry = cfg.CLD_MODE == "retry"
+        prev_models, prev_source = load_manifest(cfg.MANIFEST_JSON)
+        dead_prev = load_dead_letters(cfg.DLQ_JSONL)
+        pending = []   # fallidas que esta corrida no puede reintentar (siguen en la cola)
+        if retry:
+            # ========= Cola de fallidas: sólo esas imágenes, sin leer la hoja =========
+            if not dead_prev:
+                raise PipelineStop("ℹ️ Sin subidas fallidas pendientes (%s)." % cfg.DLQ_JSONL, code=0)
+            phase("parse")
+            book, z, pending = self._dead_letter_book(cfg, log, dead_prev)
+            workbook_sha1, signature = prev_source.get("sha1"), prev_source.get("signature")
+        else:
+            # ========= Cargar libro/hoja =========
+            log("[init] Descargando/leyendo Excel…")
+            phase("download")
+            xlsx_path, workbook_sha1 = fetch_excel(cfg, log)
+            signature = run_signature(cfg, workbook_sha1)
+            # Libro idéntico al de la última corrida completa y sin fallidas pendientes: nada que hacer
+            # (reconcile no: lo que cambió puede ser la carpeta remota; un shard no: eso lo decide el coordinador)
+            if not cfg.SHARD and unchanged_since(cfg, prev_source, signature):
+                phase("skip")
+                log("[skip] Libro sin cambios desde la última corrida completa (sha1 %s): no se extrae ni se sube nada"
+                    % workbook_sha1[:12])
+                return {
+                    "anchors": prev_source.get("anchors", 0),
+                    "queued": 0, "uploaded": 0, "skipped": prev_source.get("anchors", 0), "aliased": 0, "failed": 0,
+                    "folder": cfg.CLD_FOLDER, "map": cfg.IMG_MAP_JSON, "manifest": cfg.MANIFEST_JSON,
+                    "elapsed": time.time() - start_total, "unchanged": True,
+                }
+
+            phase("parse")
+            # El ZIP se abre directo del archivo en disco: un solo handle para hoja, drawings y media,
+            # y en memoria sólo lo que se va leyendo (nunca el .xlsx completo)
+            z = zipfile.ZipFile(xlsx_path, "r")
+            try:
+                zidx = ZipIndex(z)   # nombres del ZIP en hash maps (se consulta por anchor)
+                book = self._book(z, zidx, workbook_sha1, cfg, log, timer.phase, timer.add)
+            except BaseException:
+                z.close()
+                raise
+            if book["reason"]:
+                z.close()
+                if cfg.SHARD:
+                    # nada que subir en el libro: el shard igual termina (con ceros) y el coordinador decide
+                    log("[shard] %s" % book["reason"])
+                    return self._empty_shard(cfg, workbook_sha1, signature, book["reason"], start_total)
+                write_map(cfg.IMG_MAP_JSON, cfg.IMG_INDEX_JSON, {}, cfg.IMG_SIZES_JSON, cfg.IMG_WIDTHS)
+                raise PipelineStop(book["reason"])
+            if cfg.SHARD:
+                i, count = cfg.SHARD
+                total = len(book["bound"])
+                # copia filtrada: el libro cacheado en el Engine queda completo
+                book = dict(book,
+                            anchors=[a for a in book["anchors"] if a.get("model") and shard_of(a["model"], count) == i],
+                            bound=[b for b in book["bound"] if shard_of(b[0], count) == i])
+                log("[shard] %d/%d: %d de %d imágenes" % (i, count, len(book["bound"]), total))
+        log("[ok] Anchors detectados: %d" % len(book["anchors"]))
+
+        # ========= Pipeline: extracción -> cola acotada -> hilos de subida =========
+        # La extracción (hilo del llamador) alimenta una cola de tamaño CLD_QUEUE_SIZE y los
+        # hilos de subida la drenan: la primera subida arranca de inmediato y en RAM sólo
+        # viven ~ (CLD_QUEUE_SIZE + CLD_MAX_CONCURRENCY) imágenes, sin importar el tamaño del catálogo.
+        run = _Run(cfg, log, cancel, self._upload_fn(cfg), self.tpool, book, emit, timer)
+        run.z = z
+        run.workbook_sha1 = workbook_sha1
+        run.dead_prev = dict((e["key"], e) for e in dead_prev)
+        if cfg.SHARD:
+            owners = dict((e.get("public_id") or gallery_public_id(*split_gallery_key(k)), split_gallery_key(k)[0])
+                          for k, e in prev_models.items())
+            run.foreign = lambda pid: pid in owners and shard_of(owners[pid], cfg.SHARD[1]) != cfg.SHARD[0]
+        if cfg.CLD_MODE == "reconcile":
+            # Estado real de la carpeta en pocas llamadas (páginas de 500) en vez de confiar en el manifiesto
+            phase("list")
+            prefix = cfg.CLD_FOLDER + "/" if cfg.CLD_FOLDER else ""
+            try:
+                run.remote = dict((r["public_id"][len(prefix):], r)
+                                  for r in self._admin(cfg).list_resources(prefix) if r.get("public_id", "").startswith(prefix))
+            except Exception as e:
+                z.close()
+                raise PipelineStop("❌ No se pudo listar la carpeta '%s' en Cloudinary: %s" % (cfg.CLD_FOLDER, e))
+            log("[reconcile] %d recursos en la carpeta '%s'" % (len(run.remote), cfg.CLD_FOLDER))
+        manifest = {} if cfg.CLD_FORCE else prev_models
+        # el journal de una corrida normal interrumpida es de esa corrida: retry no lo consume ni lo borra
+        had_journal = os.path.exists(cfg.JOURNAL_JSONL)
+        resumed = load_journal(cfg.JOURNAL_JSONL) if cfg.CLD_RESUME and not retry else {}
+        if resumed:
+            log("[resume] %d subidas recuperadas del journal de una corrida interrumpida" % len(resumed))
+            manifest.update(resumed)
+        run.fallback = dict(prev_models, **resumed)   # también con CLD_FORCE: una fallida no pierde su URL
+        # append + flush por línea: lo anotado sobrevive a un SIGTERM (en dry-run no se anota nada)
+        run.journal = open(os.devnull if cfg.CLD_DRY_RUN else cfg.JOURNAL_JSONL,
+                           "a" if cfg.CLD_RESUME or retry else "w", encoding="utf-8")
+
+        log("[run] Extrayendo y subiendo a Cloudinary con %d→%d subidas en vuelo (cola: %d, transcodificación: %d procesos)…"
+            % (cfg.CLD_CONCURRENCY, cfg.CLD_MAX_CONCURRENCY, run.work_q.maxsize, cfg.IMG_WORKERS if self.tpool else 0))
+        phase("upload")
+        start_upload = run.t_upload = time.time()
+        # un hilo por subida posible; el limitador decide cuántas van en vuelo
+        threads = [threading.Thread(target=run.worker, daemon=True) for _ in range(max(1, cfg.CLD_MAX_CONCURRENCY))]
+        for t in threads:
+            t.start()
+        try:
+            run.produce(manifest)
+        finally:
+            for _ in threads:
+                run.work_q.put(None)
+            for t in threads:
+                while t.is_alive():
+                    t.join(1.0)
+                    run.heartbeat()
+            run.journal.close()
+            z.close()
+
+        elapsed_up = time.time() - start_upload
+        run.progress(force=True)
+        if cancel.is_set():
+            raise PipelineStop("⏹  Cancelado: %d subidas anotadas en el journal; el próximo trabajo las retoma." % run.uploaded, code=130)
+        log("[done] Sin cambios (manifiesto): %d · Duplicadas: %d · Subidas: %d · Fallidas: %d en %.1fs"
+            % (run.skipped, run.aliased, run.uploaded, run.failed, elapsed_up))
+        if run.kept:
+            log("[keep] %d imágenes fallidas conservan su URL anterior en el mapa" % run.kept)
+
+        if not run.queued and not run.key_to_url and not run.plan and not cfg.SHARD:
+            if not cfg.CLD_DRY_RUN:
+                write_map(cfg.IMG_MAP_JSON, cfg.IMG_INDEX_JSON, {}, cfg.IMG_SIZES_JSON, cfg.IMG_WIDTHS)
+            raise PipelineStop("ℹ️ No se hallaron imágenes utilizable.")
+
+        orphans = run.orphans()
+        if run.reasons and (run.remote is not None or cfg.CLD_DRY_RUN):
+            log("[reconcile] motivos de subida: %s" % ", ".join("%s=%d" % kv for kv in sorted(run.reasons.items())))
+        if cfg.CLD_DRY_RUN:
+            for model_val, pid, reason in run.plan:
+                log("[plan] subir %s → %s (%s)" % (model_val, pid, reason))
+            for pid in orphans:
+                log("[plan] borrar %s" % pid)
+            log("[plan] %d subidas · %d sin cambios · %d alias · %d borrados (dry-run: no se subió, borró ni escribió nada)"
+                % (len(run.plan), run.skipped, run.aliased, len(orphans)))
+            return {
+                "anchors": len(book["anchors"]), "queued": 0, "uploaded": 0, "skipped": run.skipped,
+                "aliased": run.aliased, "failed": 0, "folder": cfg.CLD_FOLDER, "map": cfg.IMG_MAP_JSON,
+                "manifest": cfg.MANIFEST_JSON, "elapsed": time.time() - start_total, "unchanged": False,
+                "mode": cfg.CLD_MODE, "dry_run": True, "remote": len(run.remote) if run.remote is not None else None,
+                "reasons": run.reasons, "orphans": len(orphans), "deleted": 0,
+                "plan": {"upload": [{"model": m, "public_id": p, "reason": r} for m, p, r in run.plan],
+                         "delete": orphans},
+            }
+
+        deleted = 0
+        if orphans:
+            phase("delete")
+            deleted = self._delete_orphans(cfg, log, run, orphans)
+
+        phase("finalize")
+        # Cola de fallidas: las de esta corrida (+ las que retry no pudo intentar); reemplaza a la anterior
+        dead = run.dead + pending
+        if cfg.SHARD:
+            save_dead_letters(cfg.SHARD_DLQ_JSONL, dead)   # el caché de media lo limpia quien combina
+        else:
+            save_dead_letters(cfg.DLQ_JSONL, dead)
+            prune_failed_media(cfg.FAILED_MEDIA_DIR, [e.get("cached") for e in dead])
+            if dead:
+                log("[dlq] %d imágenes fallidas en %s (CLD_MODE=retry las reintenta)" % (len(dead), cfg.DLQ_JSONL))
+
+        if cfg.SHARD:
+            # Sólo los modelos de este shard; image_shards.merge_shards arma mapa, índice y manifiesto comunes
+            items = merge_previous(run.gallery(), load_map(cfg.IMG_MAP_JSON), run.failed_models)
+            write_json_atomic(cfg.SHARD_ITEMS_JSON, dict((m, [list(e) for e in entries]) for m, entries in items.items()))
+            save_manifest(cfg.SHARD_MANIFEST_JSON, run.new_manifest, {
+                "sha1": workbook_sha1, "signature": signature, "anchors": len(book["anchors"]), "failed": run.failed,
+            })
+        elif retry:
+            # Sólo se tocaron los modelos de la cola: el resto del manifiesto y del mapa queda igual
+            manifest_out = dict(prev_models)
+            manifest_out.update(run.new_manifest)
+            source = dict(prev_source, failed=len(dead))
+            items = load_items(cfg.IMG_MAP_JSON, cfg.IMG_INDEX_JSON)
+            for model_val, entries in manifest_gallery(manifest_out, set(m for m, _, _ in book["bound"])).items():
+                items[model_val] = entries
+        else:
+            # {modelo: [url, …]}: galería completa del modelo, la primera es la principal. Las fallidas
+            # ya conservan su URL anterior vía manifiesto; lo que sólo estaba en el mapa (p.ej. del
+            # script completo) se recupera de él.
+            items = merge_previous(run.gallery(), load_map(cfg.IMG_MAP_JSON), run.failed_models)
+            # Manifiesto: sólo modelos vigentes con subida confirmada (las fallidas se reintentan la próxima vez)
+            manifest_out = run.new_manifest
+            source = {"sha1": workbook_sha1, "signature": signature, "anchors": len(book["anchors"]), "failed": run.failed}
+        if not cfg.SHARD:
+            # Mapa + índice compacto, ambos atómicos
+            write_map(cfg.IMG_MAP_JSON, cfg.IMG_INDEX_JSON, items, cfg.IMG_SIZES_JSON, cfg.IMG_WIDTHS)
+            save_manifest(cfg.MANIFEST_JSON, manifest_out, source)
+
+        # Corrida completa: el journal ya está consolidado en el manifiesto
+        if not (retry and had_journal):
+            try:
+                os.remove(cfg.JOURNAL_JSONL)
+            except OSError:
+                pass
+
+        stats = run.stats()
+        summary = {
+            "anchors": len(book["anchors"]),
+            "queued": run.queued,
+            "uploaded": run.uploaded,
+            "skipped": run.skipped,
+            "aliased": run.aliased,
+            "failed": run.failed,
+            "kept": run.kept,
+            "bytes_sent": run.bytes_sent,
+            "images_per_s": stats["images_per_s"],
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "upload_s": round(elapsed_up, 3),
+            "folder": cfg.CLD_FOLDER,
+            "map": cfg.SHARD_ITEMS_JSON if cfg.SHARD else cfg.IMG_MAP_JSON,
+            "index": None if cfg.SHARD else cfg.IMG_INDEX_JSON,
+            "manifest": cfg.SHARD_MANIFEST_JSON if cfg.SHARD else cfg.MANIFEST_JSON,
+            "elapsed": time.time() - start_total,
+            "unchanged": False,
+            "mode": cfg.CLD_MODE,
+            "dry_run": False,
+            "remote": len(run.remote) if run.remote is not None else None,
+            "reasons": run.reasons,
+            "orphans": len(orphans),
+            "deleted": deleted,
+            "dead_letters": len(dead),
+            "dlq": cfg.SHARD_DLQ_JSONL if cfg.SHARD else cfg.DLQ_JSONL,
+        }
+        if cfg.SHARD:
+            self._shard_result(cfg, workbook_sha1, signature, summary)
+        return summary
+
+    @staticmethod
+    def _shard_result(cfg, workbook_sha1, signature, summary, reason=None):
+        # último archivo del shard: su presencia (con este run id) es lo que espera el coordinador
+        write_json_atomic(cfg.SHARD_RESULT_JSON, {
+            "shard": list(cfg.SHARD), "run": cfg.CLD_SHARD_RUN, "sha1": workbook_sha1, "signature": signature,
+            "finished_at": int(time.time()), "reason": reason, "summary": summary,
+        }, indent=2)
+
+    def _empty_shard(self, cfg, workbook_sha1, signature, reason, start_total):
+        """Shard sin imágenes que subir: galería, manifiesto y fallidas vacías + result.json con ceros."""
+        save_dead_letters(cfg.SHARD_DLQ_JSONL, [])
+        write_json_atomic(cfg.SHARD_ITEMS_JSON, {})
+        save_manifest(cfg.SHARD_MANIFEST_JSON, {}, {"sha1": workbook_sha1, "signature": signature, "anchors": 0, "failed": 0})
+        summary = {
+            "anchors": 0, "queued": 0, "uploaded": 0, "skipped": 0, "aliased": 0, "failed": 0, "kept": 0,
+            "bytes_sent": 0, "p50_ms": None, "p95_ms": None, "folder": cfg.CLD_FOLDER, "map": cfg.SHARD_ITEMS_JSON,
+            "index": None, "manifest": cfg.SHARD_MANIFEST_JSON, "elapsed": time.time() - start_total,
+            "unchanged": False, "mode": cfg.CLD_MODE, "dry_run": False, "dead_letters": 0, "dlq": cfg.SHARD_DLQ_JSONL,
+        }
+        self._shard_result(cfg, workbook_sha1, signature, summary, reason)
+        return summary
+
+    def _verify(self, cfg, log, emit, phase, start_total):
+        """CLD_MODE=verify: sondea las URLs del mapa y marca en el manifiesto las que hay que re-subir."""
+        items = load_items(cfg.IMG_MAP_JSON, cfg.IMG_INDEX_JSON)
+        entries = [(m, n + 1, url) for m, gallery in items.items() for n, (url, _h, _ts) in enumerate(gallery)]
+        if not entries:
+            raise PipelineStop("ℹ️ El mapa está vacío (%s): nada que verificar." % cfg.IMG_MAP_JSON, code=0)
+        todo = sample_entries(entries, cfg.VERIFY_SAMPLE)
+        log("[verify] %d de %d URLs con %d requests en vuelo…" % (len(todo), len(entries), cfg.VERIFY_CONCURRENCY))
+        phase("verify")
+        lock = threading.Lock()
+        done = [0, time.time() + 10]
+
+        def on_result(r):
+            if r["verdict"] != "ok":
+                log("[verify] %s %s → %s (%s, %d ms)" % (r["verdict"], r["model"], r["url"],
+                                                        r["error"] or r["status"], r["latency_ms"]))
+            with lock:
+                done[0] += 1
+                beat = time.time() >= done[1]
+                if beat:
+                    done[1] = time.time() + 10
+            if beat:
+                log("[hb] verificando… %d/%d" % (done[0], len(todo)))
+            if emit:
+                emit({"event": "progress", "phase": "verify", "checked": done[0], "total": len(todo)})
+
+        t0 = time.time()
+        results = verify_urls(todo, cfg.VERIFY_CONCURRENCY, cfg.VERIFY_TIMEOUT, cfg.VERIFY_SLOW_MS, on_result)
+        verify_s = time.time() - t0
+        counts = dict((v, sum(1 for r in results if r["verdict"] == v)) for v in ("ok", "broken", "slow"))
+        lat = sorted(r["latency_ms"] for r in results if r["status"])
+
+        phase("finalize")
+        # Re-subida: la entrada queda "broken" en el manifiesto; la próxima corrida no la salta
+        # (ni la presta a otro modelo) y vuelve a subir el contenido a su public_id
+        bad_urls = set(r["url"] for r in results
+                       if r["verdict"] == "broken" or (r["verdict"] == "slow" and cfg.VERIFY_REUPLOAD_SLOW))
+        marked = 0
+        if bad_urls and not cfg.CLD_DRY_RUN:
+            models, source = load_manifest(cfg.MANIFEST_JSON)
+            now, found = int(time.time()), set()
+            for e in models.values():
+                if e.get("url") in bad_urls:
+                    found.add(e["url"])
+                    if not e.get("broken"):
+                        e["broken"] = now
+                        marked += 1
+            if marked:
+                save_manifest(cfg.MANIFEST_JSON, models,
+                              dict(source, broken=sum(1 for e in models.values() if e.get("broken"))))
+            if len(found) < len(bad_urls):
+                log("⚠️  [verify] %d URLs a re-subir no están en el manifiesto (p.ej. del script completo): "
+                    "sólo quedan en el reporte" % (len(bad_urls) - len(found)))
+        summary = {
+            "mode": "verify", "total": len(entries), "checked": len(results), "ok": counts["ok"],
+            "broken": counts["broken"], "slow": counts["slow"], "marked": marked,
+            "p50_ms": percentile(lat, 0.50), "p95_ms": percentile(lat, 0.95),
+            "verify_s": round(verify_s, 3), "report": cfg.VERIFY_REPORT_JSON, "map": cfg.IMG_MAP_JSON,
+            "manifest": cfg.MANIFEST_JSON, "dry_run": cfg.CLD_DRY_RUN, "elapsed": time.time() - start_total,
+        }
+        write_json_atomic(cfg.VERIFY_REPORT_JSON, dict(summary, generated_at=int(time.time()), slow_ms=cfg.VERIFY_SLOW_MS,
+                                                        flagged=[r for r in results if r["verdict"] != "ok"],
+                                                        results=results), indent=2)
+        log("[verify] ok: %d · rotas: %d · lentas: %d · marcadas para re-subir: %d · p50 %s ms · p95 %s ms en %.1fs"
+            % (counts["ok"], counts["broken"], counts["slow"], marked, summary["p50_ms"], summary["p95_ms"], verify_s))
+        return summary
+
+    def _dead_letter_book(self, cfg, log, entries):
+        """
+        CLD_MODE=retry: "libro" con sólo las imágenes de la cola de fallidas, en el formato de
+        parse_workbook. La media sale del caché de fallidas; si falta, del .xlsx, pero sólo si es
+        el mismo libro que falló (sha1). Devuelve (book, lector con .read(media), no reintentables).
+        """
+        cached, from_book, pending = {}, [], []
+        for e in entries:
+            if e.get("cached") and os.path.exists(e["cached"]):
+                cached[e["media"]] = e["cached"]
+            else:
+                from_book.append(e)
+        z = None
+        if from_book:
+            log("[retry] %d fallidas sin caché local: se lee el Excel" % len(from_book))
+            try:
+                xlsx_path, workbook_sha1 = fetch_excel(cfg, log)
+                z = zipfile.ZipFile(xlsx_path, "r")
+                names = set(z.namelist())
+            except Exception as e:
+                log("⚠️  [retry] No se pudo leer el Excel: %s" % e)
+                workbook_sha1, names = None, set()
+            for e in from_book:
+                if e.get("workbook") != workbook_sha1 or e["media"] not in names:
+                    pending.append(e)
+            if z is not None and len(pending) == len(from_book):
+                z.close()
+                z = None
+        if pending:
+            log("⚠️  [retry] %d fallidas sin media disponible (el libro cambió): quedan en la cola para la próxima corrida normal"
+                % len(pending))
+        skip = set(id(e) for e in pending)
+        todo = [e for e in entries if id(e) not in skip]
+        if not todo:
+            if z is not None:
+                z.close()
+            raise PipelineStop("⚠️ Ninguna subida fallida tiene su media disponible; corre el modo normal (CLD_MODE=incremental).")
+        log("[retry] %d imágenes de la cola de fallidas (%d desde el caché local)"
+            % (len(todo), sum(1 for e in todo if e["media"] in cached)))
+        book = {
+            "sheet": None, "sheets": [], "anchors": todo, "reason": None,
+            "bound": [(e["model"], int(e.get("n") or 1), e["media"]) for e in todo],
+            "media_hash": dict((e["media"], e["hash"]) for e in todo),
+        }
+        return book, _DeadLetterMedia(cached, z), pending
+
+    def _delete_orphans(self, cfg, log, run, orphans):
+        """Borra de la carpeta lo que ya nadie usa; con tope (CLD_RECONCILE_MAX_DELETE) ante listados raros."""
+        cap = cfg.CLD_RECONCILE_MAX_DELETE
+        if cap < 1 and len(orphans) > cap * len(run.remote):
+            log("⚠️  [reconcile] %d de %d recursos quedarían huérfanos (> %d%%): no se borra nada. "
+                "Revisa con CLD_DRY_RUN=1 y sube CLD_RECONCILE_MAX_DELETE si es correcto."
+                % (len(orphans), len(run.remote), round(cap * 100)))
+            return 0
+        prefix = cfg.CLD_FOLDER + "/" if cfg.CLD_FOLDER else ""
+        try:
+            res = self._admin(cfg).delete_resources([prefix + pid for pid in orphans])
+        except Exception as e:
+            # no es fatal: el mapa y el manifiesto de esta corrida igual valen
+            log("[err] borrado de huérfanos: %s (%s)" % (e, classify_error(e)))
+            return 0
+        deleted = sum(1 for v in res.values() if v == "deleted")
+        log("[reconcile] %d huérfanos borrados de '%s'" % (deleted, cfg.CLD_FOLDER))
+        return deleted
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+Corrida repartida en shards (CLD_SHARDS=N) para catálogos grandes.
+
+- Coordinador (run_sharded): lee/descarga el libro una sola vez, decide si hay algo que hacer
+  (mismo criterio que Engine.run) y lanza N procesos del script con CLD_SHARD=i/N. Cada uno
+  parsea la hoja, se queda con los modelos cuyo shard_of(modelo, N) == i (todas las imágenes
+  de un modelo van al mismo shard) y sube sólo esos con su propio pool de conexiones,
+  limitador y transcodificación. IMG_WORKERS y CLD_RATE_LIMIT se reparten entre los N.
+- Cada shard escribe en data/shards/<i>-of-<N>/ (journal, manifiesto, galería, fallidas,
+  reporte) y al final result.json con el id de la corrida; nunca toca el mapa común.
+- merge_shards: con los N result.json del mismo libro/configuración arma mapa, índice,
+  manifiesto y cola de fallidas comunes (atómicos) y borra los directorios de los shards.
+  Si un shard falla no se combina nada: su journal queda y la próxima corrida lo retoma. Un
+  shard sin nada que subir (libro sin imágenes) igual deja su result.json, con ceros.
+- Cancelar (SIGTERM al coordinador o cancel del worker) termina los procesos de los shards.
+- Reporte: antes de borrar los directorios se leen los run_report.json de los shards; el
+  data/run_report.json común (ver Engine.run) suma sus fases (pared/CPU, cuántos shards) y
+  tiempos acumulados y los lista completos en "shard_reports".
+- Otros nodos: con CLD_SHARD_SPAWN=0 el coordinador no lanza procesos, imprime el comando
+  de cada shard y espera (hasta CLD_SHARD_WAIT s) sus result.json en el data/ compartido.
+
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import os, sys, time, shutil, signal, threading, subprocess
+from collections import OrderedDict
+
+from image_pipeline import (PipelineStop, fetch_excel, run_signature, unchanged_since, shard_dir,
+                            load_manifest, save_manifest, load_dead_letters, save_dead_letters,
+                            prune_failed_media)
+from image_map import write_map, load_map
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract_and_upload_images_by_model_incremental.py")
+
+def shard_env(cfg, i, count, run_id, xlsx_path):
+    """Entorno de un shard: mismo .env/config que el coordinador (con los overrides del trabajo), el libro ya descargado."""
+    env = dict(cfg.env)
+    env.update({
+        "CLD_SHARD": "%d/%d" % (i, count), "CLD_SHARDS": "", "CLD_SHARD_RUN": run_id,
+        "EXCEL_PATH": os.path.abspath(xlsx_path), "EXCEL_URL": "", "PROGRESS_FORMAT": "text",
+        # CPU de la máquina y cuota de la cuenta se reparten entre los shards
+        "IMG_WORKERS": str(max(1, cfg.IMG_WORKERS // count) if cfg.IMG_WORKERS > 0 else 0),
+        "CLD_RATE_LIMIT": str(cfg.CLD_RATE_LIMIT / count if cfg.CLD_RATE_LIMIT > 0 else 0),
+    })
+    return env
+
+def _pump(stream, prefix, log):
+    for raw in iter(stream.readline, b""):
+        log("%s %s" % (prefix, raw.decode("utf-8", "replace").rstrip("\n")))
+    stream.close()
+
+def spawn_shards(cfg, count, run_id, xlsx_path, log):
+    procs = {}
+    for i in range(count):
+        p = subprocess.Popen([sys.executable, SCRIPT], env=shard_env(cfg, i, count, run_id, xlsx_path),
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        threading.Thread(target=_pump, args=(p.stdout, "[s%d]" % i, log), daemon=True).start()
+        procs[i] = p
+    return procs
+
+def wait_results(cfg, count, run_id, procs, log, cancel):
+    """{i: result.json} de los shards que terminaron bien; corta si un proceso muere sin resultado."""
+    deadline = time.time() + cfg.CLD_SHARD_WAIT
+    results, failed = {}, set()
+    while True:
+        if cancel.is_set():
+            raise PipelineStop("⏹  Cancelado: los shards se terminan; la próxima corrida retoma sus journals.", code=130)
+        for i in range(count):
+            if i in results or i in failed:
+                continue
+            path = os.path.join(shard_dir(cfg.DATA_DIR, i, count), "result.json")
+            exited = i in procs and procs[i].poll() is not None
+            r = load_map(path)   # se lee después del poll: un proceso que ya salió dejó su result.json
+            if r.get("run") == run_id:
+                results[i] = r
+                log("[shard] %d/%d listo: %d subidas, %d fallidas" % (i, count, r["summary"]["uploaded"], r["summary"]["failed"]))
+            elif exited:
+                failed.add(i)
+                log("[err] shard %d/%d terminó sin resultado (código %s)" % (i, count, procs[i].returncode))
+        if len(results) + len(failed) == count:
+            break
+        if time.time() > deadline:
+            failed.update(set(range(count)) - set(results))
+            log("[err] shards sin terminar tras %ds: %s" % (cfg.CLD_SHARD_WAIT, ", ".join(str(i) for i in sorted(failed))))
+            break
+        time.sleep(0.5)
+    return results, failed
+
+def read_shard_reports(cfg, count, results, wait=5.0):
+    """
+    run_report.json de cada shard (antes de que merge_shards borre sus directorios). El shard
+    lo escribe justo después de su result.json: se espera (hasta `wait` s) a que esté al día.
+    """
+    reports = []
+    for i in range(count):
+        d = shard_dir(cfg.DATA_DIR, i, count)
+        path, result = os.path.join(d, "run_report.json"), os.path.join(d, "result.json")
+        deadline = time.time() + (wait if i in results else 0)
+        while True:
+            try:
+                fresh = os.path.getmtime(path) >= os.path.getmtime(result)
+            except OSError:
+                fresh = False
+            if fresh or time.time() >= deadline:
+                break
+            time.sleep(0.1)
+        r = load_map(path)
+        if r:
+            r.pop("pstats", None)   # queda en el directorio del shard, que se borra al combinar
+            reports.append(dict(r, shard=i))
+    return reports
+
+def combine_reports(reports):
+    """Fases de los shards sumadas (pared y CPU; count = shards que pasaron por ella) + sus reportes."""
+    phases, busy = OrderedDict(), {}
+    for r in reports:
+        for p in r.get("phases") or []:
+            acc = phases.setdefault(p["name"], {"name": p["name"], "wall_s": 0.0, "cpu_s": 0.0, "count": 0})
+            acc["wall_s"] += p.get("wall_s") or 0
+            acc["cpu_s"] += p.get("cpu_s") or 0
+            acc["count"] += 1
+        for k, v in (r.get("busy_s") or {}).items():
+            busy[k] = busy.get(k, 0.0) + v
+    for acc in phases.values():
+        acc["wall_s"], acc["cpu_s"] = round(acc["wall_s"], 4), round(acc["cpu_s"], 4)
+    return {
+        "shard_phases": list(phases.values()),
+        "shard_busy_s": dict((k, round(v, 4)) for k, v in sorted(busy.items())),
+        "shard_maxrss_mb": max([r.get("maxrss_mb") or 0 for r in reports]) or None,
+        "shard_reports": reports,
+    }
+
+def merge_shards(cfg, count, results, log):
+    """Mapa + índice + manifiesto + cola de fallidas comunes a partir de los N shards."""
+    sources = set((r.get("sha1"), r.get("signature")) for r in results.values())
+    if len(sources) != 1:
+        raise PipelineStop("❌ Los shards no leyeron el mismo libro/configuración: no se combina nada.")
+    (workbook_sha1, signature), = sources
+    models, items, dead = {}, {}, []
+    for i in range(count):
+        d = shard_dir(cfg.DATA_DIR, i, count)
+        models.update(load_manifest(os.path.join(d, "cloudinary_manifest.json"))[0])
+        for model_val, entries in load_map(os.path.join(d, "gallery.json")).items():
+            items[model_val] = [tuple(e) for e in entries]
+        dead.extend(load_dead_letters(os.path.join(d, "upload_failed.jsonl")))
+    totals = dict((k, sum(r["summary"].get(k) or 0 for r in results.values()))
+                  for k in ("anchors", "queued", "uploaded", "skipped", "aliased", "failed", "kept", "bytes_sent"))
+
+    write_map(cfg.IMG_MAP_JSON, cfg.IMG_INDEX_JSON, items, cfg.IMG_SIZES_JSON, cfg.IMG_WIDTHS)
+    save_manifest(cfg.MANIFEST_JSON, models, {
+        "sha1": workbook_sha1, "signature": signature, "anchors": totals["anchors"], "failed": totals["failed"],
+    })
+    save_dead_letters(cfg.DLQ_JSONL, dead)
+    prune_failed_media(cfg.FAILED_MEDIA_DIR, [e.get("cached") for e in dead])
+    for i in range(count):
+        shutil.rmtree(shard_dir(cfg.DATA_DIR, i, count), ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(shard_dir(cfg.DATA_DIR, 0, count)))   # data/shards, si quedó vacío
+    except OSError:
+        pass
+    log("[shard] Combinados %d shards: %d modelos en el mapa, %d imágenes en el manifiesto, %d fallidas"
+        % (count, len(items), len(models), len(dead)))
+    return totals, len(dead)
+
+def run_sharded(cfg, log, cancel=None, phase=None, report=None):
+    """
+    Corrida completa con CLD_SHARDS=N procesos; devuelve el resumen (mismas claves que Engine.run).
+    phase(nombre) marca las fases del coordinador (download / shards / merge) y `report` (dict)
+    recibe lo de combine_reports; ambos los pasa Engine.run, que escribe el reporte.
+    """
+    cancel = cancel or threading.Event()
+    phase = phase or (lambda name: None)
+    report = {} if report is None else report
+    if threading.current_thread() is not threading.main_thread():
+        return _run_sharded(cfg, log, cancel, phase, report)
+    # CLI: SIGTERM (p.ej. al cerrar el SSE) corta la espera en vez de matar sólo al coordinador,
+    # así el finally de _run_sharded termina los shards. En el worker cancela el trabajo.
+    prev = signal.signal(signal.SIGTERM, lambda signum, frame: cancel.set())
+    try:
+        return _run_sharded(cfg, log, cancel, phase, report)
+    finally:
+        signal.signal(signal.SIGTERM, prev)
+
+def _run_sharded(cfg, log, cancel, phase, report):
+    start_total = time.time()
+    count = cfg.CLD_SHARDS
+
+    log("[init] Descargando/leyendo Excel…")
+    phase("download")
+    xlsx_path, workbook_sha1 = fetch_excel(cfg, log)
+    signature = run_signature(cfg, workbook_sha1)
+    _, prev_source = load_manifest(cfg.MANIFEST_JSON)
+    base = {"folder": cfg.CLD_FOLDER, "map": cfg.IMG_MAP_JSON, "index": cfg.IMG_INDEX_JSON, "manifest": cfg.MANIFEST_JSON,
+            "dlq": cfg.DLQ_JSONL, "shards": count}
+    if unchanged_since(cfg, prev_source, signature):
+        phase("skip")
+        log("[skip] Libro sin cambios desde la última corrida completa (sha1 %s): no se extrae ni se sube nada"
+            % workbook_sha1[:12])
+        return dict(base, anchors=prev_source.get("anchors", 0), queued=0, uploaded=0, skipped=prev_source.get("anchors", 0),
+                    aliased=0, failed=0, elapsed=time.time() - start_total, unchanged=True)
+
+    run_id = "%d-%s" % (int(time.time()), workbook_sha1[:8])
+    for i in range(count):
+        # un result.json viejo no cuenta; el journal sí (el shard retoma lo que ya subió)
+        try:
+            os.remove(os.path.join(shard_dir(cfg.DATA_DIR, i, count), "result.json"))
+        except OSError:
+            pass
+
+    procs = {}
+    if cfg.CLD_SHARD_SPAWN:
+        log("[run] %d shards en procesos aparte (corrida %s)…" % (count, run_id))
+        procs = spawn_shards(cfg, count, run_id, xlsx_path, log)
+    else:
+        log("[shard] Esperando %d shards (corrida %s). En cada nodo, con este mismo data/ compartido:" % (count, run_id))
+        for i in range(count):
+            log("  CLD_SHARD=%d/%d CLD_SHARD_RUN=%s EXCEL_PATH=%s python3 %s"
+                % (i, count, run_id, os.path.abspath(xlsx_path), os.path.basename(SCRIPT)))
+    phase("shards")
+    start_upload = time.time()
+    results = {}
+    try:
+        results, failed = wait_results(cfg, count, run_id, procs, log, cancel)
+    finally:
+        for p in procs.values():
+            if p.poll() is None:
+                p.terminate()
+            p.wait()
+        if cfg.RUN_REPORT:
+            report.update(combine_reports(read_shard_reports(cfg, count, results)))
+    if failed:
+        raise PipelineStop("❌ %d de %d shards no terminaron (%s): no se combinó nada; la próxima corrida retoma sus journals."
+                           % (len(failed), count, ", ".join(str(i) for i in sorted(failed))))
+    upload_s = time.time() - start_upload
+
+    phase("merge")
+    totals, n_dead = merge_shards(cfg, count, results, log)
+    reasons = [r.get("reason") for r in results.values()]
+    if all(reasons):
+        # ningún shard tuvo imágenes: el mapa quedó vacío, como en una corrida sin shards
+        raise PipelineStop(reasons[0])
+    return dict(base, **dict(totals,
+        images_per_s=round(totals["uploaded"] / max(1e-6, upload_s), 2),
+        # percentiles por shard: el peor de ellos
+        p50_ms=max([r["summary"].get("p50_ms") or 0 for r in results.values()]) or None,
+        p95_ms=max([r["summary"].get("p95_ms") or 0 for r in results.values()]) or None,
+        upload_s=round(upload_s, 3), elapsed=time.time() - start_total, unchanged=False,
+        mode=cfg.CLD_MODE, dead_letters=n_dead))
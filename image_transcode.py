@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Transcodificación previa a la subida (pensada para correr en un ProcessPoolExecutor).
+
+- EMF/WMF/BMP/TIFF -> PNG (como antes hacía maybe_convert_to_png).
+- Limita el lado largo a max_edge px y, si aún pesa más de max_bytes, recomprime
+  (JPEG para fotos sin transparencia; PNG optimizado si hay alfa).
+- Nunca devuelve algo más pesado que el original salvo en conversiones de formato.
+
+Requiere Pillow (>= 6.0, por ImageOps.exif_transpose); sin Pillow todo pasa tal cual.
+Python 3.9 compatible.
+"""
+
+import io
+
+try:
+    from PIL import Image, ImageOps
+    PIL_OK = True
+except Exception:
+    PIL_OK = False
+
+CONVERT_EXTS = ("emf", "wmf", "bmp", "tif", "tiff")   # siempre a PNG
+RESIZE_EXTS  = ("png", "jpg", "jpeg") + CONVERT_EXTS
+
+def _ext(media_path):
+    return media_path.rsplit(".", 1)[-1].lower() if "." in media_path else ""
+
+def needs_transcode(img_bytes, media_path, max_edge=0, max_bytes=0):
+    """Chequeo barato (sólo cabecera) en el proceso principal: ¿vale la pena mandarla al pool?"""
+    if not PIL_OK:
+        return False
+    ext = _ext(media_path)
+    if ext in CONVERT_EXTS:
+        return True
+    if ext not in RESIZE_EXTS:
+        return False
+    if max_bytes and len(img_bytes) > max_bytes:
+        return True
+    if max_edge:
+        try:
+            return max(Image.open(io.BytesIO(img_bytes)).size) > max_edge
+        except Exception:
+            return False
+    return False
+
+def _has_alpha(im):
+    return im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+
+def transcode(img_bytes, media_path, max_edge=0, max_bytes=0, jpeg_quality=85):
+    """Bytes listos para subir. Ante cualquier error devuelve los originales."""
+    if not PIL_OK:
+        return img_bytes
+    ext = _ext(media_path)
+    try:
+        im = Image.open(io.BytesIO(img_bytes))
+        im.load()
+        # al reducir/recomprimir se pierde el EXIF: la orientación (fotos de celular) se aplica a los píxeles
+        im = ImageOps.exif_transpose(im)
+    except Exception:
+        return img_bytes
+
+    convert = ext in CONVERT_EXTS
+    resized = False
+    if max_edge and max(im.size) > max_edge:
+        im.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        resized = True
+    if not (convert or resized or (max_bytes and len(img_bytes) > max_bytes)):
+        return img_bytes
+
+    try:
+        out = io.BytesIO()
+        if convert or ext == "png":
+            im.save(out, format="PNG", optimize=True)
+        else:
+            im.convert("RGB").save(out, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+        data = out.getvalue()
+        # PNG todavía pesado y sin transparencia: como foto, JPEG
+        if max_bytes and len(data) > max_bytes and not _has_alpha(im):
+            out = io.BytesIO()
+            im.convert("RGB").save(out, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            if len(out.getvalue()) < len(data):
+                data = out.getvalue()
+    except Exception:
+        return img_bytes
+
+    if convert or len(data) < len(img_bytes):
+        return data
+    return img_bytes
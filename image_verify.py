@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Verificación de las URLs del mapa (CLD_MODE=verify, ver Engine).
+
+- UrlProber: HEAD (o GET con Range: bytes=0-0 si el CDN no acepta HEAD) sobre conexiones
+  keep-alive de upload_engine.ConnectionPool, un pool por origen; nunca baja la imagen.
+- verify_urls: sondea en paralelo (ThreadPoolExecutor) y devuelve por URL status, largo
+  del contenido (Content-Length o el total de Content-Range), latencia y veredicto:
+  ok | broken (error de red, status no 2xx o 0 bytes) | slow (ok pero > slow_ms).
+- sample_entries: todas las entradas o una muestra (fracción < 1 o cantidad >= 1).
+
+Sirve contra cualquier HTTP: bench/fake_cloudinary.py sirve los assets subidos (GET/HEAD/Range).
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import re, time, random, threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from upload_engine import ConnectionPool
+
+_CONTENT_RANGE = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+
+class UrlProber:
+    """HEAD/Range sobre conexiones reutilizadas; un ConnectionPool por scheme://host:port."""
+
+    def __init__(self, size=16, timeout=10):
+        self.size = size
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, u):
+        origin = "%s://%s" % (u.scheme or "https", u.netloc)
+        with self._lock:
+            pool = self._pools.get(origin)
+            if pool is None:
+                pool = self._pools[origin] = ConnectionPool(origin, size=self.size, timeout=self.timeout)
+            return pool
+
+    def probe(self, url):
+        """{"status", "bytes", "latency_ms", "method", "error"} de una URL."""
+        u = urlsplit(url)
+        path = (u.path or "/") + ("?" + u.query if u.query else "")
+        t0 = time.time()
+        method = "HEAD"
+        try:
+            pool = self._pool(u)
+            status, headers, _ = pool.request("HEAD", path)
+            if status in (403, 405, 501):
+                # hay CDNs/proxies que no contestan HEAD: un byte con Range alcanza
+                method = "GET"
+                status, headers, _ = pool.request("GET", path, headers={"Range": "bytes=0-0"})
+        except Exception as e:
+            return {"status": None, "bytes": None, "latency_ms": round((time.time() - t0) * 1000),
+                    "method": method, "error": "%s: %s" % (type(e).__name__, e)}
+        m = _CONTENT_RANGE.match(headers.get("content-range", ""))
+        size = m.group(1) if m else (headers.get("content-length") if method == "HEAD" else None)
+        return {"status": status, "bytes": int(size) if size and size.isdigit() else None,
+                "latency_ms": round((time.time() - t0) * 1000), "method": method, "error": None}
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for p in pools:
+            p.close()
+
+def verdict(res, slow_ms):
+    if res["error"] or not res["status"] or not 200 <= res["status"] < 300 or res["bytes"] == 0:
+        return "broken"
+    if slow_ms and res["latency_ms"] > slow_ms:
+        return "slow"
+    return "ok"
+
+def sample_entries(entries, sample, seed=None):
+    """sample: 0 = todas; < 1 = fracción; >= 1 = cantidad. Conserva el orden del mapa."""
+    if not sample or sample <= 0:
+        return entries
+    k = int(round(len(entries) * sample)) if sample < 1 else int(sample)
+    if k >= len(entries):
+        return entries
+    picked = set(random.Random(seed).sample(range(len(entries)), max(1, k)))
+    return [e for i, e in enumerate(entries) if i in picked]
+
+def verify_urls(entries, concurrency=16, timeout=10, slow_ms=2000, on_result=None):
+    """
+    entries: [(modelo, posición en la galería, url)]. Devuelve una lista (mismo orden) de
+    {"model", "n", "url", "status", "bytes", "latency_ms", "method", "error", "verdict"}.
+    on_result(r) se llama desde los hilos al terminar cada una.
+    """
+    prober = UrlProber(size=concurrency, timeout=timeout)
+
+    def check(entry):
+        model_val, n, url = entry
+        r = dict(prober.probe(url), model=model_val, n=n, url=url)
+        r["verdict"] = verdict(r, slow_ms)
+        if on_result is not None:
+            on_result(r)
+        return r
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+            return list(ex.map(check, entries))
+    finally:
+        prober.close()
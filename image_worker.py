@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Worker persistente de imágenes: un proceso que vive mientras vive server.js y atiende
+trabajos de subida sin pagar en cada uno el arranque de Python, los imports, el pool de
+transcodificación, los handshakes TLS ni el parseo de un libro que no cambió.
+
+Protocolo (una línea JSON por mensaje):
+  stdin:  {"id": "j1", "cmd": "run", "env": {"SHEET_NAME": "Master", ...}}  (env opcional)
+          {"id": "j1", "cmd": "cancel"}
+          {"cmd": "ping"}
+          {"cmd": "shutdown"}
+  stdout: {"type": "ready", "pid": 123}
+          {"id": "j1", "type": "log", "line": "[ok] …"}
+          {"id": "j1", "type": "event", "event": {"event": "progress", "images_per_s": …, "eta_s": …}}
+          {"id": "j1", "type": "done", "code": 0, "summary": {...}}
+          {"type": "pong", "busy": "j1"}
+
+Los trabajos corren de a uno (en orden de llegada); cada uno toma las variables de entorno
+del proceso más las que traiga en "env". EOF en stdin = shutdown.
+Python 3.9 compatible.
+"""
+
+import os, sys, json, queue, threading, traceback
+
+# ---- .env opcional ----
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+from image_pipeline import Config, Engine, PipelineStop
+
+# stdout es el canal del protocolo: cualquier print suelto (librerías) se va a stderr
+_out = sys.stdout
+sys.stdout = sys.stderr
+_out_lock = threading.Lock()
+
+def emit(obj):
+    line = json.dumps(obj, ensure_ascii=False) + "\n"
+    with _out_lock:
+        _out.write(line)
+        _out.flush()
+
+def run_jobs(engine, jobs, cancels, state):
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id = job.get("id")
+        cancel = cancels.get(job_id)
+        if cancel is None or cancel.is_set():
+            emit({"id": job_id, "type": "done", "code": 130, "summary": None})
+            cancels.pop(job_id, None)
+            continue
+        state["busy"] = job_id
+        log = lambda msg, _id=job_id: emit({"id": _id, "type": "log", "line": str(msg)})
+        event = lambda ev, _id=job_id: emit({"id": _id, "type": "event", "event": ev})
+        code, summary = 0, None
+        try:
+            env = dict(os.environ)
+            env.update(dict((str(k), str(v)) for k, v in (job.get("env") or {}).items()))
+            summary = engine.run(Config(env), log, cancel, emit=event)
+        except PipelineStop as e:
+            log(str(e))
+            code = e.code
+        except Exception as e:
+            log("[err] %s: %s" % (type(e).__name__, e))
+            sys.stderr.write(traceback.format_exc())
+            code = 1
+        state["busy"] = None
+        cancels.pop(job_id, None)
+        emit({"id": job_id, "type": "done", "code": code, "summary": summary})
+
+def main():
+    # Engine antes que cualquier hilo: el pool de transcodificación se crea con 'fork'
+    engine = Engine(Config(), log=lambda msg: sys.stderr.write("%s\n" % (msg,)))
+    jobs = queue.Queue()
+    cancels = {}   # id -> threading.Event (trabajos en cola o en curso)
+    state = {"busy": None}
+    runner = threading.Thread(target=run_jobs, args=(engine, jobs, cancels, state), daemon=True)
+    runner.start()
+    emit({"type": "ready", "pid": os.getpid()})
+
+    for raw in sys.stdin:
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            sys.stderr.write("[worker] línea inválida: %r\n" % raw[:200])
+            continue
+        cmd = msg.get("cmd")
+        if cmd == "run":
+            cancels[msg.get("id")] = threading.Event()
+            jobs.put(msg)
+        elif cmd == "cancel":
+            ev = cancels.get(msg.get("id"))
+            if ev is not None:
+                ev.set()
+        elif cmd == "ping":
+            emit({"type": "pong", "busy": state["busy"]})
+        elif cmd == "shutdown":
+            break
+
+    # EOF/shutdown: cancelar lo pendiente y esperar a que el trabajo en curso cierre su journal
+    for ev in list(cancels.values()):
+        ev.set()
+    jobs.put(None)
+    runner.join()
+    engine.close()
+
+if __name__ == "__main__":
+    main()
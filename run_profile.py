@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Medición de una corrida del pipeline de imágenes (ver image_pipeline.Engine.run).
+
+- PhaseTimer.phase(nombre): cierra la fase en curso y abre la siguiente; por fase guarda
+  tiempo de pared, CPU del proceso, RSS actual / máximo y, con tracemalloc, el pico de
+  memoria de Python dentro de la fase.
+- PhaseTimer.add(nombre, s): acumuladores sumados entre hilos (tiempo ocupado subiendo,
+  esperando la transcodificación, en backoff…), porque extracción y subida se solapan.
+- cpu=True: cProfile en el hilo de la corrida y en cada hilo de subida (se combinan al final).
+- mem=True: tracemalloc (pico por fase + líneas que más memoria retienen al final).
+
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import os, io, time, threading, datetime
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+def _rss_mb():
+    """RSS actual (Linux: /proc/self/statm); None si no se puede leer."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1048576.0, 1)
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+def _maxrss_mb():
+    if resource is None:
+        return None
+    # Linux lo da en KiB (macOS en bytes; aquí sólo importa Linux)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+class PhaseTimer:
+    def __init__(self, cpu=False, mem=False):
+        self.cpu = cpu
+        self.mem = mem
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.t0 = time.time()
+        self.phases = []
+        self.busy = {}
+        self._cur = None
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._main_prof = None
+        self._tracemalloc = None
+        if mem:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        if cpu:
+            self._main_prof = self.profiler()
+
+    def phase(self, name):
+        now, cpu_now = time.time(), time.process_time()
+        self._close(now, cpu_now)
+        self._cur = (name, now, cpu_now)
+
+    def _close(self, now, cpu_now):
+        if self._cur is None:
+            return
+        name, t, c = self._cur
+        entry = {"name": name, "wall_s": round(now - t, 4), "cpu_s": round(cpu_now - c, 4),
+                 "rss_mb": _rss_mb(), "maxrss_mb": _maxrss_mb()}
+        if self._tracemalloc is not None:
+            _, peak = self._tracemalloc.get_traced_memory()
+            entry["py_peak_mb"] = round(peak / 1048576.0, 2)
+            self._tracemalloc.reset_peak()
+        self.phases.append(entry)
+        self._cur = None
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.busy[name] = self.busy.get(name, 0.0) + seconds
+
+    def profiler(self):
+        """cProfile.Profile ya activo en el hilo que lo pide (None si cpu=False o no se pudo)."""
+        if not self.cpu:
+            return None
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # 3.12+: un solo perfilador activo por proceso; el del hilo de la corrida ya lo cubre
+            return None
+        with self._lock:
+            self._profiles.append(prof)
+        return prof
+
+    def finish(self, profile_path=None):
+        """Cierra la última fase y devuelve el reporte (dict serializable a JSON)."""
+        self._close(time.time(), time.process_time())
+        report = {
+            "started": self.started,
+            "wall_s": round(time.time() - self.t0, 4),
+            "maxrss_mb": _maxrss_mb(),
+            "phases": self.phases,
+            "busy_s": dict((k, round(v, 4)) for k, v in sorted(self.busy.items())),
+        }
+        if self._profiles:
+            import pstats
+            for prof in self._profiles:
+                try:
+                    prof.disable()
+                except ValueError:
+                    pass
+            stats = pstats.Stats(self._profiles[0])
+            for prof in self._profiles[1:]:
+                stats.add(prof)
+            if profile_path:
+                stats.dump_stats(profile_path)
+                report["pstats"] = profile_path
+            buf = io.StringIO()
+            stats.stream = buf
+            stats.sort_stats("cumulative").print_stats(30)
+            report["profile_top"] = [l for l in buf.getvalue().splitlines() if l.strip()][:45]
+        if self._tracemalloc is not None:
+            snap = self._tracemalloc.take_snapshot()
+            report["memory_top"] = [str(s) for s in snap.statistics("lineno")[:15]]
+            self._tracemalloc.stop()
+        return report
@@ -2,6 +2,7 @@
 // - Imágenes de catálogo: Cloudinary preferido; si no hay, intenta URL del Excel vía /img (no locales)
 // - Botón "Recargar": lanza Python (subida incremental) y luego refresca catálogo
 // - NUEVO: /api/reload_images_stream (SSE) para ver logs en vivo del Python en el navegador
+// - Imágenes: un worker Python persistente (image_worker.py) atiende los trabajos; IMG_WORKER=0 lanza el script por trabajo
 // - Productos personalizados: guarda foto local y salen en carrito + PDF/Excel
 // - Precios por comprador (etiquetas FOB USD y PVP MXN)
 // - Excel incluye columna "Imagen URL" usando la MISMA URL que se muestra en la app y EMBEBE la imagen
@@ -55,19 +56,20 @@ const BUYERS = (process.env.BUYERS || 'OMNIA,HEB,SORIANA,CHEDRAUI,LA COMER,LIVER
 const CLOUDINARY_CLOUD_NAME = (process.env.CLOUDINARY_CLOUD_NAME || '').trim();
 const CLOUDINARY_FOLDER = (process.env.CLOUDINARY_FOLDER || 'showroom_2025').trim();
 
-// Cargar mapa de imágenes de Cloudinary desde archivo JSON (generado por el script Python)
+// Mapa de imágenes de Cloudinary (generado por el script Python con tmp + rename: nunca se lee a medias)
+// Formato: { modelo: [url, …] } (galería en orden de fila/columna; la primera es la principal).
+// Los mapas viejos ({ modelo: url }) se siguen aceptando. Si el índice compacto
+// (data/cloudinary_map_full_index.json, ver image_map.index_path_for) está al día, se carga ése.
 const CLOUDINARY_MAP_PATH = path.join(__dirname, 'data', 'cloudinary_map_full.json');
+const CLOUDINARY_INDEX_PATH = path.join(__dirname, 'data', 'cloudinary_map_full_index.json');
 let CLOUDINARY_IMAGE_MAP = {};
-try {
-  if (fs.existsSync(CLOUDINARY_MAP_PATH)) {
-    CLOUDINARY_IMAGE_MAP = JSON.parse(fs.readFileSync(CLOUDINARY_MAP_PATH, 'utf8'));
-    console.log(`Mapa de imágenes Cloudinary cargado: ${Object.keys(CLOUDINARY_IMAGE_MAP).length} entradas`);
-  } else {
-    console.log('Aviso: No se encontró cloudinary_map_full.json - usando generación dinámica de URLs');
-  }
-} catch (e) {
-  console.error('Error cargando mapa de imágenes Cloudinary:', e.message);
-}
+// Derivados por ancho (IMG_WIDTHS del script): { modelo: [{ "320": url, … }, …] }. La grilla pide
+// IMG_THUMB_WIDTH de los 'models' (f_auto) y el PDF/Excel PDF_IMG_WIDTH de los 'documents' (f_jpg:
+// pdfkit no lee WebP/AVIF); sin el archivo se usa la URL completa.
+const CLOUDINARY_SIZES_PATH = path.join(__dirname, 'data', 'cloudinary_sizes.json');
+const IMG_THUMB_WIDTH = Number(process.env.IMG_THUMB_WIDTH || 400);
+const PDF_IMG_WIDTH = Number(process.env.PDF_IMG_WIDTH || 320);
+let CLOUDINARY_SIZES_NORMALIZED = { models: {}, documents: {} };
 
 // Paths
 const DATA_DIR = path.join(__dirname, 'data');
@@ -141,35 +143,93 @@ const modelBase = m => String(m || '').trim().replace(/[^\w\-]+/g, '_');
 // Crear un mapa normalizado para búsqueda flexible
 const normalizeModelKey = k => String(k || '').trim().toUpperCase().replace(/[\s\-_\/]+/g, '');
 let CLOUDINARY_IMAGE_MAP_NORMALIZED = {};
-for (const [key, url] of Object.entries(CLOUDINARY_IMAGE_MAP)) {
-  const normKey = normalizeModelKey(key);
-  if (!CLOUDINARY_IMAGE_MAP_NORMALIZED[normKey]) {
-    CLOUDINARY_IMAGE_MAP_NORMALIZED[normKey] = url;
+
+const mtimeOf = p => { try { return fs.statSync(p).mtimeMs; } catch { return -1; } };
+
+function readCloudinaryMap() {
+  const idxTime = mtimeOf(CLOUDINARY_INDEX_PATH);
+  if (idxTime >= 0 && idxTime >= mtimeOf(CLOUDINARY_MAP_PATH)) {
+    const idx = JSON.parse(fs.readFileSync(CLOUDINARY_INDEX_PATH, 'utf8'));
+    if (idx && idx.version === 1 && idx.models) {
+      const base = idx.base || '';
+      const map = {};
+      for (const [model, entries] of Object.entries(idx.models)) map[model] = entries.map(e => base + e[2]);
+      return { source: 'cloudinary_map_full_index.json', map };
+    }
+  }
+  if (fs.existsSync(CLOUDINARY_MAP_PATH)) {
+    return { source: 'cloudinary_map_full.json', map: JSON.parse(fs.readFileSync(CLOUDINARY_MAP_PATH, 'utf8')) };
   }
+  return null;
 }
-console.log(`Mapa normalizado creado: ${Object.keys(CLOUDINARY_IMAGE_MAP_NORMALIZED).length} claves únicas`);
 
-const cloudinaryUrlForModel = m => {
-  const modelKey = String(m || '').trim();
+// Derivados sólo si se escribieron junto con (o después de) el mapa vigente
+function readCloudinarySizes() {
+  const none = { models: {}, documents: {} };
+  const sizesTime = mtimeOf(CLOUDINARY_SIZES_PATH);
+  if (sizesTime < 0 || sizesTime < mtimeOf(CLOUDINARY_MAP_PATH)) return none;
+  try {
+    const doc = JSON.parse(fs.readFileSync(CLOUDINARY_SIZES_PATH, 'utf8'));
+    if (!doc || doc.version !== 2 || !doc.models || !doc.documents) return none;
+    const normalize = byModel => {
+      const normalized = {};
+      for (const [key, sizes] of Object.entries(byModel)) {
+        const normKey = normalizeModelKey(key);
+        if (!normalized[normKey]) normalized[normKey] = sizes;
+      }
+      return normalized;
+    };
+    return { models: normalize(doc.models), documents: normalize(doc.documents) };
+  } catch (e) {
+    console.error('Error cargando derivados por ancho:', e.message);
+    return none;
+  }
+}
 
-  // 1) Búsqueda exacta en el mapa original
-  if (CLOUDINARY_IMAGE_MAP[modelKey]) {
-    let url = CLOUDINARY_IMAGE_MAP[modelKey];
-    if (IMG_VER && !/[?&]v=/.test(url)) {
-      url += (url.includes('?') ? '&' : '?') + 'v=' + encodeURIComponent(IMG_VER);
+// (Re)carga el mapa; si no se puede leer, se conserva el que ya estaba en memoria
+function loadCloudinaryMap() {
+  try {
+    const r = readCloudinaryMap();
+    if (!r) {
+      console.log('Aviso: No se encontró cloudinary_map_full.json - usando generación dinámica de URLs');
+      return false;
     }
-    return url;
+    const normalized = {};
+    for (const [key, url] of Object.entries(r.map)) {
+      const normKey = normalizeModelKey(key);
+      if (!normalized[normKey]) normalized[normKey] = url;
+    }
+    CLOUDINARY_IMAGE_MAP = r.map;
+    CLOUDINARY_IMAGE_MAP_NORMALIZED = normalized;
+    CLOUDINARY_SIZES_NORMALIZED = readCloudinarySizes();
+    console.log(`Mapa de imágenes Cloudinary cargado (${r.source}): ${Object.keys(r.map).length} entradas, ${Object.keys(normalized).length} claves normalizadas, ${Object.keys(CLOUDINARY_SIZES_NORMALIZED.models).length} con derivados`);
+    return true;
+  } catch (e) {
+    console.error('Error cargando mapa de imágenes Cloudinary:', e.message);
+    return false;
   }
+}
+loadCloudinaryMap();
 
-  // 2) Búsqueda normalizada (ignora espacios, guiones, mayúsculas)
-  const normKey = normalizeModelKey(modelKey);
-  if (CLOUDINARY_IMAGE_MAP_NORMALIZED[normKey]) {
-    let url = CLOUDINARY_IMAGE_MAP_NORMALIZED[normKey];
-    if (IMG_VER && !/[?&]v=/.test(url)) {
-      url += (url.includes('?') ? '&' : '?') + 'v=' + encodeURIComponent(IMG_VER);
-    }
-    return url;
+const withImgVer = url => {
+  if (IMG_VER && !/[?&]v=/.test(url)) {
+    url += (url.includes('?') ? '&' : '?') + 'v=' + encodeURIComponent(IMG_VER);
   }
+  return url;
+};
+const galleryOf = v => (Array.isArray(v) ? v : [v]).filter(Boolean);
+
+// Todas las imágenes del modelo según el mapa ([] si no está)
+const cloudinaryGalleryForModel = m => {
+  const modelKey = String(m || '').trim();
+  // 1) Búsqueda exacta en el mapa original; 2) normalizada (ignora espacios, guiones, mayúsculas)
+  const hit = CLOUDINARY_IMAGE_MAP[modelKey] || CLOUDINARY_IMAGE_MAP_NORMALIZED[normalizeModelKey(modelKey)];
+  return hit ? galleryOf(hit).map(withImgVer) : [];
+};
+
+const cloudinaryUrlForModel = m => {
+  const gallery = cloudinaryGalleryForModel(m);
+  if (gallery.length) return gallery[0];
 
   // 3) Fallback: generar URL dinámicamente si tenemos CLOUDINARY_CLOUD_NAME
   if (!CLOUDINARY_CLOUD_NAME) return '';
@@ -177,6 +237,37 @@ const cloudinaryUrlForModel = m => {
   return IMG_VER ? `${base}?v=${encodeURIComponent(IMG_VER)}` : base;
 };
 
+// Derivados de la imagen principal: { ancho: url } ({} si el modelo no tiene);
+// kind 'models' para la grilla, 'documents' para PDF/Excel
+const cloudinarySizesForModel = (m, kind = 'models') => {
+  const sizes = CLOUDINARY_SIZES_NORMALIZED[kind][normalizeModelKey(m)];
+  return (Array.isArray(sizes) && sizes[0]) || {};
+};
+
+// El derivado más chico que cubre `width` (o el más grande si ninguno alcanza); '' si no hay
+const cloudinarySizedUrlForModel = (m, width, kind = 'models') => {
+  const sizes = cloudinarySizesForModel(m, kind);
+  const widths = Object.keys(sizes).map(Number).sort((a, b) => a - b);
+  if (!widths.length) return '';
+  const w = widths.find(x => x >= width) || widths[widths.length - 1];
+  return withImgVer(sizes[w]);
+};
+
+// Imagen a incrustar en PDF/Excel: si es la principal del mapa, el derivado JPEG de PDF_IMG_WIDTH
+// (menos bytes que bajar y decodificar); personalizados y otras URLs quedan como en la UI
+const documentImageFor = (item, uiUrl) => {
+  if (!uiUrl || item.isCustom) return uiUrl;
+  const primary = cloudinaryGalleryForModel(item.model)[0];
+  return (primary === uiUrl && cloudinarySizedUrlForModel(item.model, PDF_IMG_WIDTH, 'documents')) || uiUrl;
+};
+
+// srcset para <img> ('' si el modelo no tiene derivados)
+const cloudinarySrcsetForModel = m => {
+  const sizes = cloudinarySizesForModel(m);
+  return Object.keys(sizes).map(Number).sort((a, b) => a - b)
+    .map(w => `${withImgVer(sizes[w])} ${w}w`).join(', ');
+};
+
 function toNumber(v) {
   const s = String(v ?? '').trim(); if (!s) return NaN;
   const cleaned = s.replace(/[^\d,.\-]/g, '').replace(/,(?=\d{3}\b)/g, '').replace(/\.(?=\d{3}\b)/g, '');
@@ -356,7 +447,6 @@ function loadCatalog() {
     if (!model) continue;
 
     const fromXls = getCellVal(rowData, colImage);
-    const image = catalogImageFor(model, fromXls);
 
     const shortDesc = getCellVal(rowData, colShort);
     const nameLong = getCellVal(rowData, colNameLong);
@@ -403,9 +493,10 @@ function loadCatalog() {
       'Included accessories': getCellVal(rowData, colIncludedAcc),
     };
 
-    state.items.push({
+    const item = {
       model,
-      image, // <- se usa en UI, Excel y como base en PDF para no personalizados
+      image: '', // <- se usa en UI, Excel y como base en PDF para no personalizados (ver applyCatalogImages)
+      images: [], // galería (ángulos extra) para el detalle
       short: shortDesc || nameLong,
       packagingType: packaging,
       masterPack,
@@ -415,12 +506,32 @@ function loadCatalog() {
       prices,
       details,
       raw: Object.fromEntries(headers.map((h, i) => [h, rowData[i] || '']))
-    });
+    };
+    XLS_IMAGE_OF.set(item, fromXls);
+    applyCatalogImages(item);
+    state.items.push(item);
   }
 
   return state;
 }
 
+// Imagen/galería de un producto según el mapa vigente (se reaplica al recargar el mapa)
+const XLS_IMAGE_OF = new WeakMap(); // item -> valor de la columna de imagen del Excel
+function applyCatalogImages(item) {
+  item.image = catalogImageFor(item.model, XLS_IMAGE_OF.get(item) || '');
+  const gallery = cloudinaryGalleryForModel(item.model);
+  item.images = gallery.length > 1 ? gallery : [item.image];
+  // miniatura de la grilla: el derivado si la imagen es la principal del mapa
+  const fromMap = gallery.length && item.image === gallery[0];
+  item.thumb = (fromMap && cloudinarySizedUrlForModel(item.model, IMG_THUMB_WIDTH)) || item.image;
+  item.srcset = fromMap ? cloudinarySrcsetForModel(item.model) : '';
+}
+
+// Tras un trabajo de imágenes: releer el mapa y actualizar el catálogo en memoria (sin reparsear el Excel)
+function refreshImageMap() {
+  if (loadCloudinaryMap()) CATALOG.items.forEach(applyCatalogImages);
+}
+
 async function refreshCatalog() {
   try {
     const buf = await fetchExcelBuffer();
@@ -493,24 +604,155 @@ app.post('/api/upload_catalog', upload.single('file'), (req, res) => {
   }
 });
 
-// Ejecutar script Python (incremental) y responder al instante (compatibilidad)
+// ========= Trabajos de imágenes: worker Python persistente (image_worker.py) =========
+// Un solo proceso Python atiende todos los "Recargar" (protocolo JSON por líneas): sin
+// arranque de intérprete, con conexiones a Cloudinary calientes y el último libro parseado
+// en caché. IMG_WORKER=0 (o si el worker no arranca) vuelve a lanzar el script por trabajo.
+const IMG_WORKER_SCRIPT = path.join(__dirname, 'image_worker.py');
+const IMG_WORKER_ENABLED = !['0', 'false', 'no'].includes(String(process.env.IMG_WORKER || '1').trim().toLowerCase());
+let imgWorker = null;          // { proc, jobs: Map(id -> handlers) }
+let imgWorkerBroken = false;   // murió antes de quedar listo: no reintentar en cada job
+let imgJobSeq = 0;
+
+function imageScriptName() {
+  return fs.existsSync(path.join(__dirname, 'extract_and_upload_images_by_model_incremental.py'))
+    ? 'extract_and_upload_images_by_model_incremental.py'
+    : 'extract_and_upload_images_by_model.py';
+}
+
+function getImageWorker() {
+  if (imgWorker) return imgWorker;
+  if (!IMG_WORKER_ENABLED || imgWorkerBroken || !fs.existsSync(IMG_WORKER_SCRIPT)) return null;
+  const proc = spawn('python3', [IMG_WORKER_SCRIPT], { cwd: __dirname });
+  const w = { proc, jobs: new Map(), ready: false };
+  let buf = '';
+  proc.stdout.on('data', d => {
+    buf += d.toString();
+    let nl;
+    while ((nl = buf.indexOf('\n')) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (!line) continue;
+      let msg;
+      try { msg = JSON.parse(line); } catch { console.log('[img-worker]', line); continue; }
+      if (msg.type === 'ready') { w.ready = true; console.log('Imagenes: worker Python listo (pid', msg.pid + ')'); continue; }
+      const job = w.jobs.get(msg.id);
+      if (!job) continue;
+      if (msg.type === 'log') job.onLog('out', msg.line);
+      else if (msg.type === 'event') job.onEvent && job.onEvent(msg.event);
+      else if (msg.type === 'done') { w.jobs.delete(msg.id); job.onDone(msg.code, msg.summary); }
+    }
+  });
+  proc.stderr.on('data', d => process.stderr.write(d.toString()));
+  const onGone = (code) => {
+    if (imgWorker !== w) return;
+    imgWorker = null;
+    if (!w.ready) imgWorkerBroken = true;
+    console.log('Imagenes: worker Python terminó con código', code);
+    for (const job of w.jobs.values()) {
+      job.onLog('err', 'El worker de imágenes terminó inesperadamente.');
+      job.onDone(code ?? 1);
+    }
+    w.jobs.clear();
+  };
+  proc.on('exit', onGone);
+  proc.on('error', (e) => { console.error('Imagenes: no se pudo lanzar el worker:', e.message); onGone(1); });
+  imgWorker = w;
+  return w;
+}
+
+// Resumen de cada trabajo (img/s, p50/p95, bytes…) en data/image_runs.jsonl: historial para
+// detectar regresiones de throughput entre recargas. Acotado: al pasar IMAGE_RUNS_MAX_BYTES se
+// reescribe con las últimas IMAGE_RUNS_KEEP líneas (IMAGE_RUNS_KEEP=0 no guarda historial).
+const IMAGE_RUNS_LOG = path.join(__dirname, 'data', 'image_runs.jsonl');
+const IMAGE_RUNS_KEEP = Number(process.env.IMAGE_RUNS_KEEP ?? 500);
+const IMAGE_RUNS_MAX_BYTES = Number(process.env.IMAGE_RUNS_MAX_BYTES || 2 * 1024 * 1024);
+function trimImageRuns() {
+  if (mtimeOf(IMAGE_RUNS_LOG) < 0 || fs.statSync(IMAGE_RUNS_LOG).size <= IMAGE_RUNS_MAX_BYTES) return;
+  const lines = fs.readFileSync(IMAGE_RUNS_LOG, 'utf8').split('\n').filter(Boolean);
+  // tmp + rename, como el mapa: quien lea el historial ve el anterior o el recortado
+  const tmp = IMAGE_RUNS_LOG + '.tmp';
+  fs.writeFileSync(tmp, lines.slice(-IMAGE_RUNS_KEEP).join('\n') + '\n', 'utf8');
+  fs.renameSync(tmp, IMAGE_RUNS_LOG);
+}
+function recordImageRun(label, code, summary) {
+  try {
+    const entry = { time: new Date().toISOString(), runner: label, code, ...(summary || {}) };
+    if (summary) console.log('Imagenes: resumen', JSON.stringify(entry));
+    if (IMAGE_RUNS_KEEP <= 0) return;
+    fs.appendFileSync(IMAGE_RUNS_LOG, JSON.stringify(entry) + '\n', 'utf8');
+    trimImageRuns();
+  } catch (e) { console.error('Imagenes: no se pudo registrar el resumen:', e.message); }
+}
+
+// Lanza un trabajo de imágenes (worker o script suelto). Devuelve { label, cancel() }.
+// onEvent recibe los eventos estructurados (phase/progress); onDone(code, summary).
+function startImageJob({ onLog, onEvent, onDone }) {
+  const w = getImageWorker();
+  if (w) {
+    const id = `job-${Date.now()}-${++imgJobSeq}`;
+    w.jobs.set(id, {
+      onLog, onEvent,
+      onDone: (code, summary) => { recordImageRun('image_worker.py', code, summary); if (code === 0) refreshImageMap(); onDone(code, summary); },
+    });
+    w.proc.stdin.write(JSON.stringify({ id, cmd: 'run' }) + '\n');
+    return {
+      label: 'image_worker.py',
+      cancel: () => { try { if (w.jobs.has(id)) w.proc.stdin.write(JSON.stringify({ id, cmd: 'cancel' }) + '\n'); } catch { } },
+    };
+  }
+  const scriptName = imageScriptName();
+  // El incremental habla JSON por línea (PROGRESS_FORMAT=json); el completo, texto
+  const py = spawn('python3', [scriptName], { cwd: __dirname, env: { ...process.env, PROGRESS_FORMAT: 'json' } });
+  let summary = null;
+  const onLine = (line, kind) => {
+    if (kind === 'out' && line.startsWith('{')) {
+      try {
+        const ev = JSON.parse(line);
+        if (ev.event === 'log') return onLog('out', ev.line);
+        if (ev.event === 'error') return onLog('err', ev.message);
+        if (ev.event === 'summary') { const { event, ...rest } = ev; summary = rest; return; }
+        if (ev.event) return onEvent && onEvent(ev);
+      } catch { }
+    }
+    onLog(kind, line);
+  };
+  // dividir por líneas para una UX más fluida (un chunk puede cortar una línea a la mitad)
+  const pending = { out: '', err: '' };
+  const feed = (d, kind) => {
+    const parts = (pending[kind] + d.toString()).split(/\r?\n/);
+    pending[kind] = parts.pop();
+    parts.forEach(line => { if (line.trim().length) onLine(line, kind); });
+  };
+  py.stdout.on('data', d => feed(d, 'out'));
+  py.stderr.on('data', d => feed(d, 'err'));
+  py.on('close', code => {
+    ['out', 'err'].forEach(kind => { if (pending[kind].trim()) onLine(pending[kind], kind); });
+    recordImageRun(scriptName, code, summary);
+    if (code === 0) refreshImageMap();
+    onDone(code, summary);
+  });
+  return {
+    label: scriptName,
+    cancel: () => { try { if (!py.killed) py.kill('SIGTERM'); } catch { } },
+  };
+}
+
+// Ejecutar subida incremental de imágenes y responder al instante (compatibilidad)
 app.post('/api/reload_images', (req, res) => {
   try {
-    const scriptName = fs.existsSync(path.join(__dirname, 'extract_and_upload_images_by_model_incremental.py'))
-      ? 'extract_and_upload_images_by_model_incremental.py'
-      : 'extract_and_upload_images_by_model.py';
-    const py = spawn('python3', [scriptName], { cwd: __dirname });
-    py.stdout.on('data', d => process.stdout.write(d.toString()));
-    py.stderr.on('data', d => process.stderr.write(d.toString()));
-    py.on('close', code => console.log('Imagenes: proceso python finalizado con código', code));
-    res.json({ ok: true, message: `Script de imágenes lanzado (${scriptName}).` });
+    const job = startImageJob({
+      onLog: (kind, line) => (kind === 'err' ? process.stderr : process.stdout).write(line + '\n'),
+      onDone: code => console.log('Imagenes: trabajo finalizado con código', code),
+    });
+    res.json({ ok: true, message: `Script de imágenes lanzado (${job.label}).` });
   } catch (e) {
     console.error('No se pudo lanzar el script de imágenes:', e);
     res.status(500).json({ ok: false, error: 'No se pudo lanzar el script de imágenes.' });
   }
 });
 
-// ========= NUEVO: stream de logs (SSE) del script Python =========
+// ========= NUEVO: stream de logs (SSE) del trabajo de imágenes =========
 app.get('/api/reload_images_stream', (req, res) => {
   // Cabeceras SSE
   res.setHeader('Content-Type', 'text/event-stream; charset=utf-8');
@@ -527,38 +769,26 @@ app.get('/api/reload_images_stream', (req, res) => {
   const ping = setInterval(() => { res.write(': ping\n\n'); }, 15000);
 
   try {
-    const scriptName = fs.existsSync(path.join(__dirname, 'extract_and_upload_images_by_model_incremental.py'))
-      ? 'extract_and_upload_images_by_model_incremental.py'
-      : 'extract_and_upload_images_by_model.py';
-
-    send('info', { msg: `Iniciando ${scriptName}...` });
-
-    const py = spawn('python3', [scriptName], { cwd: __dirname });
-
-    // stdout/stderr -> líneas
-    const pushChunk = (buf, kind) => {
-      const txt = buf.toString();
-      // dividir por líneas para una UX más fluida
-      txt.split(/\r?\n/).forEach(line => {
-        if (line.trim().length) send('log', { kind, line });
-      });
-    };
-
-    py.stdout.on('data', d => pushChunk(d, 'out'));
-    py.stderr.on('data', d => pushChunk(d, 'err'));
-
-    py.on('close', code => {
-      send('done', { code });
-      clearInterval(ping);
-      // cerrar SSE después de un pequeño respiro para que el cliente consuma el último evento
-      setTimeout(() => { res.end(); }, 200);
-      console.log('Imagenes: proceso python finalizado con código', code);
+    let finished = false;
+    const job = startImageJob({
+      onLog: (kind, line) => send('log', { kind, line }),
+      onEvent: (ev) => send(ev.event === 'progress' ? 'progress' : 'phase', ev),
+      onDone: (code, summary) => {
+        finished = true;
+        send('done', { code, summary: summary || null });
+        clearInterval(ping);
+        // cerrar SSE después de un pequeño respiro para que el cliente consuma el último evento
+        setTimeout(() => { res.end(); }, 200);
+        console.log('Imagenes: trabajo finalizado con código', code);
+      },
     });
 
-    // Si el cliente cierra, matar proceso
+    send('info', { msg: `Iniciando ${job.label}...` });
+
+    // Si el cliente cierra, cancelar el trabajo (lo ya subido queda en el journal)
     req.on('close', () => {
       try { clearInterval(ping); } catch { }
-      try { if (!py.killed) py.kill('SIGTERM'); } catch { }
+      if (!finished) job.cancel();
     });
 
   } catch (e) {
@@ -741,7 +971,7 @@ app.get('/api/download_cart_pdf', async (req, res) => {
         doc.rect(x, rowY, contentWidth, rowH).stroke('#e5e7eb');
         isOdd = !isOdd;
 
-        const imgUrl = sameUrlAsUI(item);
+        const imgUrl = documentImageFor(item, sameUrlAsUI(item));
 
         try {
           let imgBuffer = null;
@@ -850,7 +1080,7 @@ app.get('/api/download_cart_excel', async (req, res) => {
     // 2) Insertar imágenes ancladas (col A)
     for (let i = 0; i < cart.length; i++) {
       const item = cart[i];
-      const imgUrl = sameUrlAsUI(item);
+      const imgUrl = documentImageFor(item, sameUrlAsUI(item));
       if (!imgUrl) continue;
 
       try {
@@ -945,6 +1175,9 @@ app.get('/', (_, res) => {
   .cart-item-img img{width:100%;height:100%;object-fit:contain}
   .detail-grid{display:grid;grid-template-columns:220px 1fr;gap:20px;align-items:start}
   .detail-hero{background:#f1f5f9;border:1px solid var(--border-color);border-radius:10px;height:220px;display:flex;align-items:center;justify-content:center;overflow:hidden}
+  .detail-thumbs{display:flex;flex-wrap:wrap;gap:6px;margin-top:8px}
+  .detail-thumbs img{width:48px;height:48px;object-fit:contain;background:#f1f5f9;border:1px solid var(--border-color);border-radius:6px;cursor:pointer}
+  .detail-thumbs img.active{border-color:#0f172a}
   .chip{display:inline-block;border:1px solid #d1d5db;background-color:#f9fafb;padding:4px 10px;border-radius:999px;margin-right:8px;margin-bottom:8px;font-size:12px}
   table.attr{width:100%;border-collapse:collapse;font-size:13px;margin-top:12px}
   table.attr th,table.attr td{border-bottom:1px solid #e2e8f0;padding:8px 6px;text-align:left;vertical-align:top}
@@ -953,6 +1186,7 @@ app.get('/', (_, res) => {
   #imagePreview{width:100px;height:100px;background:#e2e8f0;border-radius:8px;background-size:cover;background-position:center;cursor:pointer;display:flex;align-items:center;justify-content:center;color:var(--text-secondary);text-align:center;font-size:12px}
   @media (max-width:640px){#newProductCard{grid-template-columns:1fr}#imagePreview{grid-row:1;justify-self:center}#addNewProductBtn{grid-column:1}}
   @media (min-width:641px){#newProductCard{grid-template-columns:100px 1fr 1fr auto}}
+  #reloadStats{min-height:18px;margin-bottom:8px;font-size:13px;color:#64748b}
   #reloadLogBox{height:360px;background:#0b1020;color:#cbd5e1;border-radius:8px;padding:12px;overflow:auto;font-family:ui-monospace, SFMono-Regular, Menlo, monospace;font-size:12px;white-space:pre-wrap;border:1px solid #1f2937}
   /* ===== NUEVO: Estilos para filtros rápidos ===== */
   .keyword-filters-container { margin-top:16px; padding-top:16px; border-top:1px solid var(--border-color); }
@@ -1027,7 +1261,7 @@ app.get('/', (_, res) => {
 <div class="modal-overlay" id="reloadModal">
   <div class="modal-content">
     <div class="modal-header"><h2>Procesando imágenes (Python)</h2><button class="btn-ghost" id="closeReload">Cerrar</button></div>
-    <div class="modal-body"><pre id="reloadLogBox"></pre></div>
+    <div class="modal-body"><div id="reloadStats"></div><pre id="reloadLogBox"></pre></div>
     <div class="modal-footer">
       <button class="btn-ghost" id="reloadCloseBtn">Cerrar</button>
     </div>
@@ -1115,7 +1349,7 @@ app.get('/', (_, res) => {
 
       const card=document.createElement('div'); card.className='tile';
       card.innerHTML =
-        '<div class="tile-img">'+(p.image?'<img src="'+p.image+'" alt="'+p.model+'"/>':'')+'</div>'+
+        '<div class="tile-img">'+(p.image?'<img src="'+(p.thumb||p.image)+'"'+(p.srcset?' srcset="'+p.srcset+'" sizes="(max-width: 640px) 100vw, 320px"':'')+' loading="lazy" alt="'+p.model+'"/>':'')+'</div>'+
         '<div>'+
           '<div class="tile-model">'+p.model+'</div>'+
           '<div style="display:flex;gap:8px;flex-wrap:wrap;margin:6px 0 8px 0;">'+
@@ -1192,9 +1426,18 @@ app.get('/', (_, res) => {
       .map(function(k){ return [k, (p.details||{})[k] ?? (k === 'Short description' ? p.short : '')]; })
       .filter(function(pair){ return String(pair[1]||'').trim(); })
       .map(function(pair){ return '<tr><th>'+pair[0]+'</th><td>'+pair[1]+'</td></tr>'; }).join('');
+    const images = (p.images||[]).filter(Boolean);
+    const thumbs = images.length > 1
+      ? '<div class="detail-thumbs">'+images.map(function(u, i){
+          return '<img src="'+u+'" alt="'+p.model+' '+(i+1)+'" class="'+(i===0?'active':'')+'" onclick="pickDetailImage(this)">';
+        }).join('')+'</div>'
+      : '';
     document.getElementById('detailBody').innerHTML =
       '<div class="detail-grid">'+
-        '<div class="detail-hero">'+(p.image?'<img src="'+p.image+'" alt="'+p.model+'" style="max-width:100%;max-height:100%;object-fit:contain;">':'')+'</div>'+
+        '<div>'+
+          '<div class="detail-hero">'+(p.image?'<img id="detailHeroImg" src="'+p.image+'" alt="'+p.model+'" style="max-width:100%;max-height:100%;object-fit:contain;">':'')+'</div>'+
+          thumbs+
+        '</div>'+
         '<div>'+
           '<div style="font-size:22px;font-weight:800;margin-bottom:6px;">'+p.model+'</div>'+
           '<div style="margin-bottom:12px;">'+
@@ -1214,6 +1457,13 @@ app.get('/', (_, res) => {
     document.getElementById('detailModal').classList.add('open');
   }
 
+  // Galería del detalle: la miniatura elegida pasa a la imagen principal
+  function pickDetailImage(el){
+    const hero = document.getElementById('detailHeroImg'); if (!hero) return;
+    hero.src = el.src;
+    el.parentNode.querySelectorAll('img').forEach(function(t){ t.classList.toggle('active', t === el); });
+  }
+
   function closeDetail(){
     document.getElementById('detailModal').classList.remove('open');
   }
@@ -1242,11 +1492,23 @@ app.get('/', (_, res) => {
     box.textContent = '';
     modal.classList.add('open');
     const es = new EventSource('/api/reload_images_stream');
+    const stats = document.getElementById('reloadStats');
+    stats.textContent = '';
     const append = function(line){ box.textContent += line + '\\n'; box.scrollTop = box.scrollHeight; };
+    const fmtStats = function(d){
+      const parts = ['Subidas ' + (d.uploaded||0) + '/' + (d.queued||0)];
+      if (d.failed) parts.push('fallidas ' + d.failed);
+      if (d.images_per_s != null) parts.push(d.images_per_s + ' img/s');
+      if (d.p50_ms != null) parts.push('p50 ' + d.p50_ms + ' ms · p95 ' + d.p95_ms + ' ms');
+      if (d.eta_s != null) parts.push('ETA ' + Math.round(d.eta_s) + ' s');
+      return parts.join(' · ');
+    };
+    es.addEventListener('phase', function(ev){ try { const d = JSON.parse(ev.data||'{}'); stats.textContent = 'Fase: ' + d.phase; } catch(_){} });
+    es.addEventListener('progress', function(ev){ try { stats.textContent = fmtStats(JSON.parse(ev.data||'{}')); } catch(_){} });
     es.addEventListener('info', function(ev){ try { const d = JSON.parse(ev.data||'{}'); if (d.msg) append('> ' + d.msg); } catch(_){} });
     es.addEventListener('log', function(ev){ try { const d = JSON.parse(ev.data||'{}'); if (d && d.line) append((d.kind==='err'?'[err] ':'') + d.line); } catch(_){} });
     es.addEventListener('done', async function(ev){
-      try { const d = JSON.parse(ev.data||'{}'); append('==> Finalizado (code: ' + d.code + ')'); } catch(_){}
+      try { const d = JSON.parse(ev.data||'{}'); append('==> Finalizado (code: ' + d.code + ')'); if (d.summary && !d.summary.unchanged) stats.textContent = fmtStats(d.summary); } catch(_){}
       es.close();
       try {
         await fetch('/api/reload',{method:'POST'});
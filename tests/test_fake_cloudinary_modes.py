@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+Modos que tocan la carpeta remota (reconcile con borrado de huérfanos, retry de la cola de
+fallidas, verify) contra bench/fake_cloudinary.py con un libro de bench/make_xlsx.py.
+
+  python3 -m unittest discover -s tests
+
+Sólo librería estándar; cada prueba corre en su propio directorio (data/ relativo) y su
+propia carpeta del Cloudinary falso.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import make_xlsx
+from fake_cloudinary import serve
+from image_pipeline import Config, Engine, PipelineStop, load_manifest, load_dead_letters
+from image_map import load_map
+
+ROWS = 6
+
+class FakeCloudinaryModes(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.srv = serve(0)
+        cls.tmp = tempfile.mkdtemp(prefix="showroom_test_")
+        cls.xlsx = os.path.join(cls.tmp, "book.xlsx")
+        make_xlsx.build(cls.xlsx, rows=ROWS, images=1, size=(16, 16), seed=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.srv.shutdown()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(dir=self.tmp)
+        os.chdir(self.dir)   # Config usa data/ relativo
+        self.folder = "t_" + self._testMethodName
+        self.srv.error_rate = 0.0
+        self.logs = []
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def run_pipeline(self, **env):
+        base = {
+            "EXCEL_PATH": self.xlsx, "CLOUDINARY_CLOUD_NAME": "test", "CLOUDINARY_API_KEY": "k",
+            "CLOUDINARY_API_SECRET": "s", "CLD_API_BASE": self.srv.base_url, "CLOUDINARY_FOLDER": self.folder,
+            "IMG_WORKERS": "0", "RUN_REPORT": "0", "CLD_MAX_RETRIES": "1",
+        }
+        base.update(env)
+        cfg = Config(base)
+        engine = Engine(cfg)
+        try:
+            return engine.run(cfg, self.logs.append)
+        finally:
+            engine.close()
+
+    def remote_ids(self):
+        prefix = self.folder + "/"
+        with self.srv.lock:
+            return set(k[len(prefix):] for k in self.srv.assets if k.startswith(prefix))
+
+    def add_orphans(self, n):
+        with self.srv.lock:
+            for i in range(n):
+                self.srv.assets["%s/orphan_%d" % (self.folder, i)] = {
+                    "bytes": b"x", "version": 1, "etag": "e%d" % i, "format": "png"}
+
+    # ========= reconcile =========
+    def test_reconcile_deletes_only_orphans(self):
+        self.run_pipeline()
+        managed = self.remote_ids()
+        self.assertEqual(len(managed), ROWS)
+        self.add_orphans(2)
+
+        plan = self.run_pipeline(CLD_MODE="reconcile", CLD_DRY_RUN="1")
+        self.assertEqual((plan["orphans"], plan["deleted"]), (2, 0))
+        self.assertEqual(len(self.remote_ids()), ROWS + 2)   # dry-run no borra
+
+        summary = self.run_pipeline(CLD_MODE="reconcile")
+        self.assertEqual((summary["orphans"], summary["deleted"]), (2, 2))
+        self.assertEqual(self.remote_ids(), managed)
+
+    def test_reconcile_delete_cap(self):
+        self.run_pipeline()
+        self.add_orphans(ROWS + 1)   # más de la mitad de la carpeta
+
+        summary = self.run_pipeline(CLD_MODE="reconcile")
+        self.assertEqual((summary["orphans"], summary["deleted"]), (ROWS + 1, 0))
+        self.assertEqual(len(self.remote_ids()), 2 * ROWS + 1)
+
+        summary = self.run_pipeline(CLD_MODE="reconcile", CLD_RECONCILE_MAX_DELETE="1")
+        self.assertEqual(summary["deleted"], ROWS + 1)
+        self.assertEqual(len(self.remote_ids()), ROWS)
+
+    # ========= retry =========
+    def test_retry_drains_dead_letters(self):
+        self.srv.error_rate = 1.0
+        summary = self.run_pipeline()
+        self.assertEqual((summary["uploaded"], summary["failed"]), (0, ROWS))
+        self.assertEqual(len(load_dead_letters(os.path.join("data", "upload_failed.jsonl"))), ROWS)
+
+        self.srv.error_rate = 0.0
+        summary = self.run_pipeline(CLD_MODE="retry")
+        self.assertEqual((summary["uploaded"], summary["failed"]), (ROWS, 0))
+        self.assertEqual(load_dead_letters(os.path.join("data", "upload_failed.jsonl")), [])
+        self.assertEqual(len(load_map(os.path.join("data", "cloudinary_map_full.json"))), ROWS)
+
+        with self.assertRaises(PipelineStop) as cm:
+            self.run_pipeline(CLD_MODE="retry")
+        self.assertEqual(cm.exception.code, 0)   # cola vacía: nada que reintentar
+
+    # ========= verify =========
+    def test_verify_flags_deleted_asset(self):
+        self.run_pipeline()
+        gone = sorted(self.remote_ids())[0]
+        with self.srv.lock:
+            del self.srv.assets["%s/%s" % (self.folder, gone)]
+
+        summary = self.run_pipeline(CLD_MODE="verify")
+        self.assertEqual((summary["checked"], summary["broken"]), (ROWS, 1))
+        models, _ = load_manifest(os.path.join("data", "cloudinary_manifest.json"))
+        self.assertEqual([e["public_id"] for e in models.values() if e.get("broken")], [gone])
+
+        # la próxima corrida re-sube sólo la rota
+        summary = self.run_pipeline()
+        self.assertEqual(summary["uploaded"], 1)
+        self.assertIn(gone, self.remote_ids())
+
+if __name__ == "__main__":
+    unittest.main()
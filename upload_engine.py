@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+"""
+Motor de subida a Cloudinary con conexiones persistentes (keep-alive).
+
+- ConnectionPool: pool de http.client.HTTP(S)Connection compartido por los hilos;
+  cada conexión (y su handshake TLS) se reutiliza entre subidas.
+- CloudinaryUploader: Upload API firmada (multipart) sin SDK ni 'requests'; además
+  listado paginado y borrado por lotes de la Admin API (modo reconcile).
+- Backend intercambiable vía api_base (CLD_API_BASE): por defecto
+  https://api.cloudinary.com; para pruebas/benchmarks, bench/fake_cloudinary.py.
+- AdaptiveLimiter (AIMD) + TokenBucket: sube la concurrencia mientras la latencia y
+  los errores están sanos y la recorta a la mitad ante 420/429; backoff exponencial
+  con jitter; los 4xx permanentes no se reintentan (classify_error).
+
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import re, json, time, uuid, base64, random, hashlib, threading, http.client
+from urllib.parse import urlsplit, urlencode
+
+DEFAULT_API_BASE = "https://api.cloudinary.com"
+
+class UploadError(Exception):
+    """Respuesta no exitosa del backend (status HTTP, mensaje del API y Retry-After si vino)."""
+
+    def __init__(self, status, message, retry_after=None):
+        Exception.__init__(self, "HTTP %s: %s" % (status, message))
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+# ========= Errores / backoff =========
+OK         = "ok"
+RATE_LIMIT = "rate_limit"   # 420/429: bajar el ritmo
+TRANSIENT  = "transient"    # timeouts, conexión, 5xx: reintentar
+PERMANENT  = "permanent"    # resto de 4xx: no tiene caso reintentar
+
+_SDK_STATUS = re.compile(r"(?:status code - |HTTP )(\d{3})")
+
+def error_status(e):
+    status = getattr(e, "status", None)
+    if status is None:
+        # cloudinary SDK: GeneralError("Server returned unexpected status code - 420 - …")
+        m = _SDK_STATUS.search(str(e))
+        status = int(m.group(1)) if m else None
+    return status
+
+def classify_error(e):
+    status = error_status(e)
+    if status in (420, 429):
+        return RATE_LIMIT
+    if status is not None and 400 <= status < 500 and status not in (408, 409):
+        return PERMANENT
+    # sin status: timeout/conexión/errores del SDK -> se reintenta
+    return TRANSIENT
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """Exponencial con 'full jitter'; respeta Retry-After si el servidor lo mandó."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after:
+        delay = max(delay, float(retry_after))
+    return delay
+
+# ========= Control de ritmo =========
+class TokenBucket:
+    """Arranques por segundo (rate <= 0: sin límite)."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.max_rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def scale(self, factor):
+        with self._lock:
+            if self.max_rate > 0:
+                self.rate = min(self.max_rate, max(self.max_rate / 20.0, self.rate * factor))
+
+class AdaptiveLimiter:
+    """
+    AIMD sobre el número de subidas en vuelo:
+    - éxito con latencia sana: +1/limit (≈ +1 por "ventana" de `limit` éxitos);
+    - latencia > 2x la mejor media observada (+ latency_slack s) o error transitorio: -1;
+    - 420/429: limit/2, bucket/2 y pausa global (Retry-After o 1 s).
+    """
+
+    def __init__(self, initial, min_limit=1, max_limit=32, bucket=None, on_change=None, latency_slack=0.25):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.bucket = bucket
+        self.on_change = on_change
+        self.latency_slack = latency_slack   # holgura absoluta: el jitter de pocos ms no cuenta
+        self.in_flight = 0
+        self.ewma = None
+        self.best = None
+        self.pause_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.pause_until:
+                    self._cond.wait(self.pause_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait(1.0)
+                else:
+                    self.in_flight += 1
+                    break
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def release(self, outcome, latency=None, retry_after=None):
+        with self._cond:
+            self.in_flight -= 1
+            before = int(self.limit)
+            reason = None
+            if outcome == OK:
+                if latency is not None:
+                    self.ewma = latency if self.ewma is None else 0.8 * self.ewma + 0.2 * latency
+                    self.best = self.ewma if self.best is None else min(self.best, self.ewma)
+                if self.ewma is not None and self.ewma > 2 * self.best + self.latency_slack:
+                    self.limit = max(self.min_limit, self.limit - 1.0 / self.limit)
+                    reason = "latencia"
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                    reason = "sano"
+                if self.bucket is not None:
+                    self.bucket.scale(1.05)
+            elif outcome == RATE_LIMIT:
+                self.limit = max(self.min_limit, self.limit / 2.0)
+                self.pause_until = max(self.pause_until, time.monotonic() + float(retry_after or 1.0))
+                if self.bucket is not None:
+                    self.bucket.scale(0.5)
+                reason = "rate limit"
+            elif outcome == TRANSIENT:
+                self.limit = max(self.min_limit, self.limit - 1.0)
+                reason = "errores"
+            after = int(self.limit)
+            self._cond.notify_all()
+        if after != before and self.on_change:
+            self.on_change(before, after, reason)
+
+# ========= Pool de conexiones =========
+class ConnectionPool:
+    """
+    Conexiones keep-alive a un único host. get/put son O(1); si todas están en uso
+    se abre una nueva (el número de hilos ya acota cuántas hay a la vez).
+    """
+
+    def __init__(self, base_url, size=8, timeout=120):
+        u = urlsplit(base_url)
+        self.scheme = u.scheme or "https"
+        self.host = u.hostname
+        self.port = u.port
+        self.prefix = (u.path or "").rstrip("/")
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.opened = 0        # conexiones creadas (para medir la reutilización)
+
+    def _new(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            self.opened += 1
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new(), False
+
+    def _put(self, conn):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, headers, body). Reintenta una vez si una conexión reutilizada estaba cerrada."""
+        for attempt in (1, 2):
+            conn, reused = self._get()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and attempt == 1:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._put(conn)
+            return resp.status, dict((k.lower(), v) for k, v in resp.getheaders()), data
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for c in idle:
+            c.close()
+
+# ========= Multipart / firma =========
+def _multipart(fields, file_field, file_bytes, filename="file"):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for k, v in fields.items():
+        parts.append(("--%s\r\nContent-Disposition: form-data; name=\"%s\"\r\n\r\n%s\r\n" % (boundary, k, v)).encode("utf-8"))
+    parts.append(("--%s\r\nContent-Disposition: form-data; name=\"%s\"; filename=\"%s\"\r\n"
+                  "Content-Type: application/octet-stream\r\n\r\n" % (boundary, file_field, filename)).encode("utf-8"))
+    parts.append(file_bytes)
+    parts.append(("\r\n--%s--\r\n" % boundary).encode("utf-8"))
+    return b"".join(parts), "multipart/form-data; boundary=%s" % boundary
+
+def api_sign(params, api_secret):
+    """Firma de Cloudinary: sha1('k1=v1&k2=v2…' ordenado + api_secret)."""
+    to_sign = "&".join("%s=%s" % (k, params[k]) for k in sorted(params) if params[k] not in (None, ""))
+    return hashlib.sha1((to_sign + api_secret).encode("utf-8")).hexdigest()
+
+def _bool(v):
+    return "true" if v else "false"
+
+def _retry_after(headers):
+    v = headers.get("retry-after")
+    try:
+        return float(v) if v else None
+    except ValueError:
+        return None
+
+# ========= Uploader =========
+class CloudinaryUploader:
+    """Subidas firmadas contra /v1_1/<cloud>/<resource_type>/upload usando un ConnectionPool."""
+
+    def __init__(self, cloud_name, api_key, api_secret, api_base=DEFAULT_API_BASE, pool_size=8, timeout=120):
+        self.cloud_name = cloud_name
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.pool = ConnectionPool(api_base or DEFAULT_API_BASE, size=pool_size, timeout=timeout)
+
+    def upload(self, img_bytes, public_id, folder="", overwrite=True, unique_filename=False, resource_type="image",
+               eager=None, eager_async=False):
+        params = {
+            "public_id": public_id,
+            "folder": folder,
+            "overwrite": _bool(overwrite),
+            "unique_filename": _bool(unique_filename),
+            "eager": eager,   # "t1|t2": derivados a generar (firmados como el resto)
+            "eager_async": _bool(eager_async) if eager else None,
+            "timestamp": str(int(time.time())),
+        }
+        params = dict((k, v) for k, v in params.items() if v not in (None, ""))
+        params["signature"] = api_sign(params, self.api_secret)
+        params["api_key"] = self.api_key
+        body, ctype = _multipart(params, "file", img_bytes, filename=public_id or "file")
+        status, headers, data = self.pool.request(
+            "POST", "/v1_1/%s/%s/upload" % (self.cloud_name, resource_type), body=body,
+            headers={"Content-Type": ctype, "Content-Length": str(len(body)), "Connection": "keep-alive"})
+        try:
+            res = json.loads(data.decode("utf-8") or "{}")
+        except ValueError:
+            res = {}
+        if status != 200:
+            msg = (res.get("error") or {}).get("message") if isinstance(res, dict) else None
+            raise UploadError(status, msg or data[:200].decode("utf-8", "replace"), _retry_after(headers))
+        return res
+
+    # ---- Admin API (Basic auth con api_key:api_secret) ----
+    def _admin(self, method, path, query):
+        auth = base64.b64encode(("%s:%s" % (self.api_key, self.api_secret)).encode("utf-8")).decode("ascii")
+        status, headers, data = self.pool.request(
+            method, "/v1_1/%s/%s?%s" % (self.cloud_name, path, urlencode(query, doseq=True)),
+            headers={"Authorization": "Basic " + auth, "Connection": "keep-alive"})
+        try:
+            res = json.loads(data.decode("utf-8") or "{}")
+        except ValueError:
+            res = {}
+        if status != 200:
+            msg = (res.get("error") or {}).get("message") if isinstance(res, dict) else None
+            raise UploadError(status, msg or data[:200].decode("utf-8", "replace"), _retry_after(headers))
+        return res
+
+    def list_resources(self, prefix, resource_type="image", type="upload", max_results=500):
+        """Recursos bajo `prefix` (public_id, version, format, bytes, etag si el API lo da), página a página."""
+        cursor = None
+        while True:
+            query = {"prefix": prefix, "max_results": max_results}
+            if cursor:
+                query["next_cursor"] = cursor
+            res = self._admin("GET", "resources/%s/%s" % (resource_type, type), query)
+            for r in res.get("resources") or []:
+                yield r
+            cursor = res.get("next_cursor")
+            if not cursor:
+                return
+
+    def delete_resources(self, public_ids, resource_type="image", type="upload"):
+        """Borra hasta 100 public_ids por llamada; devuelve {"public_id": "deleted"|"not_found"}."""
+        out = {}
+        ids = list(public_ids)
+        for i in range(0, len(ids), 100):
+            res = self._admin("DELETE", "resources/%s/%s" % (resource_type, type), {"public_ids[]": ids[i:i + 100]})
+            out.update(res.get("deleted") or {})
+        return out
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lectura en streaming de un .xlsx (ZIP OOXML) sin cargar el libro completo.
+
+Compartido por extract_and_upload_images_by_model*.py:
+- Resuelve hojas por nombre vía xl/workbook.xml + sus rels (no asume sheetN).
+- Recorre sólo la hoja pedida con iterparse y se queda con la fila de
+  encabezados y UNA columna (la del modelo); el resto de celdas se descarta.
+- Sólo decodifica los sharedStrings que realmente usan esas celdas.
+- ModelIndex: fila -> modelo en O(1), con la misma búsqueda hacia abajo de antes.
+- ZipIndex: nombres del ZIP y numeración xl/media/imageN.* en hash maps.
+
+Sólo librería estándar; Python 3.9 compatible.
+"""
+
+import re, posixpath
+from array import array
+from xml.etree import ElementTree as ET
+
+# Namespace de relaciones OPC
+RNS = {"": "http://schemas.openxmlformats.org/package/2006/relationships"}
+R_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+def _local(tag):
+    # '{ns}row' -> 'row' (sirve igual para transitional y strict OOXML)
+    return tag.rsplit("}", 1)[-1]
+
+# ========= Partes / relaciones =========
+def rels_path_for(part):
+    d, b = posixpath.split(part)
+    return posixpath.join(d, "_rels", b + ".rels")
+
+def resolve_part(base_part, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+def read_rels(z, part):
+    """[(Id, Type, parte_destino)] de las relaciones internas de `part`."""
+    path = rels_path_for(part)
+    try:
+        xml = ET.fromstring(z.read(path))
+    except KeyError:
+        return []
+    out = []
+    for rel in xml.findall("Relationship", RNS):
+        if rel.attrib.get("TargetMode") == "External":
+            continue
+        tgt = rel.attrib.get("Target") or ""
+        out.append((rel.attrib.get("Id"), rel.attrib.get("Type", ""), resolve_part(part, tgt)))
+    return out
+
+def workbook_part(z):
+    for _, typ, tgt in read_rels(z, ""):
+        if typ.endswith("/officeDocument"):
+            return tgt
+    return "xl/workbook.xml"
+
+def list_sheets(z):
+    """[(nombre, parte)] en el orden del libro, resolviendo r:id -> xl/worksheets/…"""
+    wb_part = workbook_part(z)
+    targets = {rid: tgt for rid, _, tgt in read_rels(z, wb_part)}
+    out = []
+    for el in ET.fromstring(z.read(wb_part)).iter():
+        if _local(el.tag) == "sheet":
+            part = targets.get(el.attrib.get(R_ID))
+            if part:
+                out.append((el.attrib.get("name", ""), part))
+    return out
+
+# ========= Celdas =========
+_CELL_REF = re.compile(r"([A-Z]+)(\d*)")
+
+def col_index(ref):
+    """'AB12' -> 27 (base 0)."""
+    m = _CELL_REF.match(ref or "")
+    if not m:
+        return None
+    n = 0
+    for ch in m.group(1):
+        n = n * 26 + (ord(ch) - 64)
+    return n - 1
+
+def _cell_raw(c):
+    """(tipo, valor) de un <c>; para 's' el valor es el índice del sharedString."""
+    t = c.attrib.get("t", "n")
+    if t == "inlineStr":
+        return "str", "".join(el.text or "" for el in c.iter() if _local(el.tag) == "t")
+    for el in c:
+        if _local(el.tag) == "v":
+            v = el.text or ""
+            return ("s", int(v)) if t == "s" else ("str", v)
+    return "str", ""
+
+def _shared_strings(z, wanted):
+    """{índice: texto} sólo para los índices pedidos."""
+    if not wanted:
+        return {}
+    path = None
+    for _, typ, tgt in read_rels(z, workbook_part(z)):
+        if typ.endswith("/sharedStrings"):
+            path = tgt
+            break
+    if not path or path not in z.namelist():
+        return {}
+    out, idx, last = {}, -1, max(wanted)
+    for ev, el in ET.iterparse(z.open(path), events=("end",)):
+        if _local(el.tag) != "si":
+            continue
+        idx += 1
+        if idx in wanted:
+            # texto plano o rich text (<r><t>…</t></r>); se ignoran las fonéticas (<rPh>)
+            parts = []
+            for ch in el:
+                name = _local(ch.tag)
+                if name == "t":
+                    parts.append(ch.text or "")
+                elif name == "r":
+                    parts.extend(t.text or "" for t in ch if _local(t.tag) == "t")
+            out[idx] = "".join(parts)
+        el.clear()
+        if idx >= last:
+            break
+    return out
+
+# ========= Hoja: encabezados + columna del modelo =========
+def stream_model_column(z, sheet_part, header_row, pick_key):
+    """
+    Recorre la hoja una sola vez.
+    pick_key(headers) -> nombre de encabezado de la columna del modelo (o None).
+    Devuelve (headers, model_key, models, max_row) con models = {fila: texto} (sólo no vacías).
+    Si el encabezado repite nombre, gana la última columna (igual que el dict por fila de antes).
+    """
+    header_cells = {}      # col -> raw
+    col_cells = {}         # fila -> raw
+    headers, model_key, model_col = None, None, None
+    max_row, row_num = 0, 0
+    sheet_data = None
+
+    for ev, el in ET.iterparse(z.open(sheet_part), events=("start", "end")):
+        name = _local(el.tag)
+        if ev == "start":
+            if name == "sheetData":
+                sheet_data = el
+            continue
+        if name != "row":
+            continue
+        r_attr = el.attrib.get("r")
+        row_num = int(r_attr) if r_attr else row_num + 1
+        has_cells = False
+        next_col = 0
+        for c in el:
+            if _local(c.tag) != "c":
+                continue
+            has_cells = True
+            ci = col_index(c.attrib.get("r"))
+            if ci is None:
+                ci = next_col
+            next_col = ci + 1
+            if row_num == header_row:
+                header_cells[ci] = _cell_raw(c)
+            elif model_col is not None and ci == model_col and row_num > header_row:
+                col_cells[row_num] = _cell_raw(c)
+        if has_cells:
+            max_row = row_num
+
+        if row_num >= header_row and headers is None:
+            # Encabezados listos: resolver la columna del modelo antes de seguir
+            shared = _shared_strings(z, {v for t, v in header_cells.values() if t == "s"})
+            ncols = (max(header_cells) + 1) if header_cells else 0
+            headers = []
+            for ci in range(ncols):
+                t, v = header_cells.get(ci, ("str", ""))
+                headers.append(shared.get(v, "") if t == "s" else v)
+            model_key = pick_key(headers)
+            if model_key is None:
+                return headers, None, {}, max_row
+            model_col = max(i for i, h in enumerate(headers) if h == model_key)
+            # la propia fila que cerró los encabezados puede ser ya de datos
+            if row_num > header_row:
+                for c in el:
+                    if _local(c.tag) == "c" and col_index(c.attrib.get("r")) == model_col:
+                        col_cells[row_num] = _cell_raw(c)
+
+        el.clear()
+        if sheet_data is not None:
+            sheet_data.clear()
+
+    if headers is None:
+        headers = []
+        model_key = pick_key(headers)
+        return headers, model_key, {}, max_row
+
+    shared = _shared_strings(z, {v for t, v in col_cells.values() if t == "s"})
+    models = {}
+    for r, (t, v) in col_cells.items():
+        txt = (shared.get(v, "") if t == "s" else v).strip()
+        if txt:
+            models[r] = txt
+    return headers, model_key, models, max_row
+
+def pick_sheet(z, sheet_name):
+    """(nombre, parte, encontrada) de la hoja pedida; si no existe, la primera del libro."""
+    sheets = list_sheets(z)
+    if not sheets:
+        return None, None, False
+    for name, part in sheets:
+        if name == sheet_name:
+            return name, part, True
+    return sheets[0][0], sheets[0][1], False
+
+# ========= Índice del ZIP =========
+_MEDIA_NUM = re.compile(r"image(\d+)\.", re.I)
+
+class ZipIndex:
+    """
+    namelist() indexado una sola vez: pertenencia en O(1) y, para el fallback
+    por número de imagen, xl/media/imageN.* -> nombre real (gana el primero del ZIP).
+    """
+
+    def __init__(self, z):
+        names = z.namelist()
+        self.names = set(names)
+        self.media_by_num = {}
+        for n in names:
+            if n.startswith("xl/media/"):
+                m = _MEDIA_NUM.search(n)
+                if m:
+                    self.media_by_num.setdefault(m.group(1), n)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def resolve_media(self, media_path):
+        """Ruta real de la imagen en el ZIP (o None); si la ruta del rel no existe, busca por número."""
+        if media_path in self.names:
+            return media_path
+        m = _MEDIA_NUM.search(media_path or "")
+        return self.media_by_num.get(m.group(1)) if m else None
+
+# ========= Fila -> modelo =========
+class ModelIndex:
+    """
+    Columna del modelo como arreglo compacto (una posición por fila de datos) y,
+    al lado, la posición del siguiente modelo no vacío dentro de `lookahead` filas.
+    lookup() conserva la semántica de find_model_for_row: toma el modelo de la fila
+    del anchor (o la primera de datos); si está vacío, mira hasta 3 filas abajo.
+    """
+
+    def __init__(self, models, header_row, max_row, lookahead=3):
+        self.first = header_row + 1
+        self.max_row = max_row
+        n = max(0, max_row - self.first + 1)
+        self.values = [""] * n
+        for r, v in models.items():
+            if self.first <= r <= max_row:
+                self.values[r - self.first] = v
+        # nxt[i] = índice del modelo que liga la fila i (o -1), calculado de abajo hacia arriba
+        self.nxt = array("l", [-1]) * n
+        nearest = -1
+        for i in range(n - 1, -1, -1):
+            if self.values[i]:
+                nearest = i
+            if nearest >= 0 and nearest - i <= lookahead:
+                self.nxt[i] = nearest
+
+    def lookup(self, start_r):
+        """(modelo, fila_ligada) — ("", None) si la fila queda fuera de la hoja."""
+        row = max(start_r, self.first)
+        if row > self.max_row:
+            return "", None
+        j = self.nxt[row - self.first]
+        if j < 0:
+            return "", row
+        return self.values[j], j + self.first